@@ -0,0 +1,112 @@
+"""
+Concurrent POST conversions while the rates are being refreshed, through the WSGI
+views on a pool of WSGI_THREADS threads (like one gthread worker) and through the
+ASGI views on a single event loop. Every operation starts with a cold rates cache
+and fires CONCURRENT_REQUESTS requests against a local upstream stub answering
+after UPSTREAM_LATENCY seconds.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.test import AsyncClient, Client
+from django.urls import reverse
+
+from conversion.api import AsyncCreateConversionView, CreateConversionView
+from conversion.models import RateSnapshot  # type: ignore
+from conversion.services import ExchangeRatesAPI, last_known_rates, rates_local_cache
+from devtools.upstream_stub import StubExchangeRatesServer
+
+CONCURRENT_REQUESTS = 50
+WSGI_THREADS = 4
+UPSTREAM_LATENCY = 0.2
+ROUNDS = 5
+
+
+@pytest.fixture(autouse=True)
+def upstream(monkeypatch):
+    with StubExchangeRatesServer(latency=UPSTREAM_LATENCY) as stub:
+        monkeypatch.setattr(ExchangeRatesAPI, "url", stub.url)
+        yield stub
+
+
+@pytest.fixture(autouse=True)
+def disable_throttling():
+    views = (CreateConversionView, AsyncCreateConversionView)
+    throttle_classes = [view.throttle_classes for view in views]
+    for view in views:
+        view.throttle_classes = ()
+    yield
+    for view, view_throttle_classes in zip(views, throttle_classes):
+        view.throttle_classes = view_throttle_classes
+
+
+@pytest.fixture
+def payload(user):
+    return {
+        "from_currency": "USD",
+        "to_currency": "BRL",
+        "amount": 10,
+        "user_id": user.external_id,
+    }
+
+
+def cold_rates_cache():
+    """Forgets the rates everywhere they are kept, so they come from upstream again."""
+    cache.clear()
+    rates_local_cache.clear()
+    last_known_rates.clear()
+    RateSnapshot.objects.all().delete()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_wsgi_concurrent_conversions(benchmark, payload):
+    url = reverse("conversion-create")
+
+    def post(_):
+        return Client().post(url, payload).status_code
+
+    with ThreadPoolExecutor(max_workers=WSGI_THREADS) as executor:
+
+        def run_round():
+            cold_rates_cache()
+            statuses = list(executor.map(post, range(CONCURRENT_REQUESTS)))
+            assert statuses == [201] * CONCURRENT_REQUESTS
+
+        result = benchmark(
+            f"WSGI {CONCURRENT_REQUESTS} concurrent conversions, "
+            f"{WSGI_THREADS} threads (per op)",
+            run_round,
+            iterations=ROUNDS,
+        )
+    result.name += f", {result.ops_per_second * CONCURRENT_REQUESTS:,.0f} requests/s"
+
+
+@pytest.mark.django_db(transaction=True)
+def test_asgi_concurrent_conversions(benchmark, payload):
+    url = reverse("async-conversion-create")
+
+    async def run_concurrently():
+        client = AsyncClient()
+        responses = await asyncio.gather(
+            *(
+                client.post(url, payload, content_type="application/json")
+                for _ in range(CONCURRENT_REQUESTS)
+            )
+        )
+        return [response.status_code for response in responses]
+
+    def run_round():
+        cold_rates_cache()
+        statuses = async_to_sync(run_concurrently)()
+        assert statuses == [201] * CONCURRENT_REQUESTS
+
+    result = benchmark(
+        f"ASGI {CONCURRENT_REQUESTS} concurrent conversions, one event loop (per op)",
+        run_round,
+        iterations=ROUNDS,
+    )
+    result.name += f", {result.ops_per_second * CONCURRENT_REQUESTS:,.0f} requests/s"
@@ -0,0 +1,66 @@
+"""
+Time and peak memory of GET /api/users/<user_id>/conversions/ returning a whole history,
+as the not paginated list and streamed (?stream=true).
+"""
+
+import datetime
+from decimal import Decimal
+
+import pytest
+from django.http import StreamingHttpResponse
+from django.test import Client
+from django.urls import reverse
+
+from conversion.api import GetUserConversionsView
+from conversion.models import Conversion as ConversionModel  # type: ignore
+
+
+@pytest.fixture(autouse=True)
+def disable_throttling():
+    throttling_clases = GetUserConversionsView.throttle_classes
+    GetUserConversionsView.throttle_classes = ()
+    yield
+    GetUserConversionsView.throttle_classes = throttling_clases
+
+
+@pytest.fixture
+def conversions(request, user):
+    rates_timestamp = datetime.datetime.now(tz=datetime.timezone.utc)
+    ConversionModel.objects.bulk_create(
+        (
+            ConversionModel(
+                user=user,
+                from_currency="USD",
+                from_amount=Decimal("100.00"),
+                to_currency="EUR",
+                to_amount=Decimal("92.25"),
+                rate=Decimal("0.92"),
+                rates_timestamp=rates_timestamp,
+            )
+            for _ in range(request.param)
+        ),
+        batch_size=10_000,
+    )
+    yield request.param
+    ConversionModel.objects.all().delete()
+
+
+def export(url: str, params: dict) -> int:
+    response = Client().get(url, params)
+    if isinstance(response, StreamingHttpResponse):
+        return sum(len(chunk) for chunk in response)
+    return len(response.content)
+
+
+@pytest.mark.django_db()
+@pytest.mark.parametrize("conversions", [10_000, 100_000], indirect=True)
+@pytest.mark.parametrize("stream", [False, True])
+def test_export_conversions(benchmark, user, conversions, stream):
+    url = reverse("conversions-user-list", args=[user.external_id])
+    params = {"stream": "true"} if stream else {}
+    benchmark(
+        f"conversions {'streamed' if stream else 'list'} ({conversions} conversions)",
+        lambda: export(url, params),
+        iterations=1,
+        trace_memory=True,
+    )
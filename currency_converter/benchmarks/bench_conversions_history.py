@@ -0,0 +1,97 @@
+"""
+Time to load a user's conversion history with ConversionDbService.listByUser, against the
+previous implementation that hydrated model instances and read the user back per row.
+"""
+
+import datetime
+from decimal import Decimal
+
+import pytest
+from django.urls import reverse
+
+from conversion.models import Conversion as ConversionModel  # type: ignore
+from conversion.services import ConversionDbService
+
+
+def legacy_list_by_user(user_id: str) -> list:
+    """listByUser as it was before the history query was projected."""
+    service = ConversionDbService()
+    return [
+        service.to_conversion(
+            conversion.user.external_id,
+            tuple(getattr(conversion, column) for column in service.conversion_columns),
+        )
+        for conversion in ConversionModel.objects.filter(user__external_id=user_id)
+    ]
+
+
+@pytest.fixture
+def conversions(request, user):
+    rates_timestamp = datetime.datetime.now(tz=datetime.timezone.utc)
+    ConversionModel.objects.bulk_create(
+        ConversionModel(
+            user=user,
+            from_currency="USD",
+            from_amount=Decimal("100.00"),
+            to_currency="EUR",
+            to_amount=Decimal("92.25"),
+            rate=Decimal("0.92"),
+            rates_timestamp=rates_timestamp,
+        )
+        for _ in range(request.param)
+    )
+    yield request.param
+    ConversionModel.objects.all().delete()
+
+
+@pytest.mark.django_db()
+@pytest.mark.parametrize("conversions", [100, 1_000, 10_000, 100_000], indirect=True)
+def test_list_by_user(benchmark, user, conversions):
+    service = ConversionDbService()
+    benchmark(
+        f"listByUser ({conversions} conversions)",
+        lambda: service.listByUser(user.external_id, user_pk=user.pk),
+        iterations=10,
+    )
+
+
+@pytest.mark.django_db()
+@pytest.mark.parametrize("conversions", [1_000, 10_000], indirect=True)
+def test_legacy_list_by_user(benchmark, user, conversions):
+    benchmark(
+        f"listByUser, legacy per-row user ({conversions} conversions)",
+        lambda: legacy_list_by_user(user.external_id),
+        iterations=10,
+    )
+
+
+@pytest.mark.django_db()
+@pytest.mark.parametrize("conversions", [10_000], indirect=True)
+@pytest.mark.parametrize("depth", ["first", "last"])
+def test_list_by_user_page(benchmark, user, conversions, depth):
+    service = ConversionDbService()
+    after = None
+    if depth == "last":
+        last = service.listByUser(user.external_id, user_pk=user.pk)[-101]
+        after = (last.response.created_at, last.id)
+    benchmark(
+        f"listByUser, {depth} page of 100 ({conversions} conversions)",
+        lambda: service.listByUser(
+            user.external_id, user_pk=user.pk, limit=101, after=after
+        ),
+        iterations=100,
+    )
+
+
+@pytest.mark.django_db()
+@pytest.mark.parametrize("conversions", [10_000], indirect=True)
+@pytest.mark.parametrize("conditional", [False, True])
+def test_history_request(benchmark, client, user, conversions, conditional):
+    url = reverse("conversions-user-list", args=[user.external_id])
+    headers = {"If-None-Match": client.get(url)["ETag"]} if conditional else {}
+    benchmark(
+        f"GET history, {'304 Not Modified' if conditional else '200'} "
+        f"({conversions} conversions)",
+        lambda: client.get(url, headers=headers),
+        iterations=10,
+    )
@@ -0,0 +1,75 @@
+"""
+ExchangeRatesAPI.convert_amount with the precomputed rates matrix, against the
+per-request Decimal arithmetic it replaced (kept below as the reference).
+"""
+
+import datetime
+from decimal import Decimal
+
+import pytest
+import pytz  # type: ignore
+
+from conversion.domain import ConversionRequest, ConversionResponse
+from conversion.services import (
+    ConversionRatesCacheService,
+    ExchangeRatesAPI,
+    MidnightCache,
+)
+from conversion.test_services import MOCK_EXCHANGE_RATES
+
+PAIRS = [("EUR", "USD"), ("USD", "EUR"), ("USD", "BRL")]
+
+
+def convert_amount_per_request(
+    request: ConversionRequest, rates: dict
+) -> ConversionResponse:
+    rates_timestamp = datetime.datetime.fromtimestamp(rates["timestamp"], pytz.UTC)
+    now = datetime.datetime.now(tz=pytz.UTC)
+    if request.from_currency == rates["base"]:
+        rate = rates["rates"][request.to_currency]
+        return ConversionResponse(
+            rate=rate,
+            rates_timestamp=rates_timestamp,
+            converted_amount=Decimal(request.amount)
+            * Decimal(rates["rates"][request.to_currency]),
+            created_at=now,
+        )
+    elif request.to_currency == rates["base"]:
+        rate = Decimal(1) / Decimal(rates["rates"][request.from_currency])
+        return ConversionResponse(
+            rate=rate,
+            rates_timestamp=rates_timestamp,
+            converted_amount=Decimal(request.amount) * rate,
+            created_at=now,
+        )
+    else:
+        from_currency_rate = Decimal(rates["rates"][request.from_currency])
+        to_currency_rate = Decimal(rates["rates"][request.to_currency])
+        final_rate = to_currency_rate / from_currency_rate
+        return ConversionResponse(
+            rate=final_rate,
+            rates_timestamp=rates_timestamp,
+            converted_amount=Decimal(request.amount) * final_rate,
+            created_at=now,
+        )
+
+
+@pytest.mark.parametrize("from_currency, to_currency", PAIRS)
+def test_convert_amount_per_request(benchmark, from_currency, to_currency):
+    request = ConversionRequest(from_currency, to_currency, Decimal("98.12"))
+    benchmark(
+        f"convert_amount per-request math {from_currency}->{to_currency}",
+        lambda: convert_amount_per_request(request, MOCK_EXCHANGE_RATES),
+        iterations=50_000,
+    )
+
+
+@pytest.mark.parametrize("from_currency, to_currency", PAIRS)
+def test_convert_amount_matrix(benchmark, from_currency, to_currency):
+    service = ExchangeRatesAPI(ConversionRatesCacheService(MidnightCache()))
+    request = ConversionRequest(from_currency, to_currency, Decimal("98.12"))
+    benchmark(
+        f"convert_amount rates matrix {from_currency}->{to_currency}",
+        lambda: service.convert_amount(request, MOCK_EXCHANGE_RATES),
+        iterations=50_000,
+    )
@@ -0,0 +1,91 @@
+"""
+GET /api/users/<user_id>/conversions/ with and without the rendered-response cache
+(CONVERSION_HISTORY_CACHE), on a user with CONVERSIONS conversions who converts once
+every READS_PER_WRITE reads. The cache hit ratio is reported with the cached runs.
+"""
+
+import datetime
+from decimal import Decimal
+
+import pytest
+from django.urls import reverse
+
+from conversion.api import GetUserConversionsView
+from conversion.domain import Conversion, ConversionRequest, ConversionResponse
+from conversion.models import Conversion as ConversionModel  # type: ignore
+from conversion.services import ConversionDbService, conversion_history_cache
+
+CONVERSIONS = 1000
+READS_PER_WRITE = 20
+
+
+@pytest.fixture
+def conversions(user):
+    rates_timestamp = datetime.datetime.now(tz=datetime.timezone.utc)
+    ConversionModel.objects.bulk_create(
+        ConversionModel(
+            user=user,
+            from_currency="USD",
+            from_amount=Decimal("100.00"),
+            to_currency="EUR",
+            to_amount=Decimal("92.25"),
+            rate=Decimal("0.92"),
+            rates_timestamp=rates_timestamp,
+        )
+        for _ in range(CONVERSIONS)
+    )
+    yield
+    ConversionModel.objects.all().delete()
+
+
+@pytest.fixture
+def no_throttling():
+    throttle_classes = GetUserConversionsView.throttle_classes
+    GetUserConversionsView.throttle_classes = ()
+    yield
+    GetUserConversionsView.throttle_classes = throttle_classes
+
+
+@pytest.mark.django_db()
+@pytest.mark.parametrize("cached", [False, True])
+def test_history_reads(
+    benchmark, client, settings, monkeypatch, user, conversions, no_throttling, cached
+):
+    settings.CONVERSION_HISTORY_CACHE = cached
+    url = reverse("conversions-user-list", args=[user.external_id])
+    service = ConversionDbService()
+    conversion = Conversion(
+        user_id=user.external_id,
+        request=ConversionRequest("USD", "EUR", Decimal("10.00")),
+        response=ConversionResponse(
+            rate=Decimal("0.92"),
+            rates_timestamp=datetime.datetime.now(tz=datetime.timezone.utc),
+            created_at=None,  # type: ignore
+            converted_amount=Decimal("9.23"),
+        ),
+    )
+
+    lookups = []
+    get = conversion_history_cache.get
+
+    def counted_get(*args):
+        cached_response = get(*args)
+        lookups.append(cached_response is not None)
+        return cached_response
+
+    monkeypatch.setattr(conversion_history_cache, "get", counted_get)
+
+    def reads_and_a_write():
+        for _ in range(READS_PER_WRITE):
+            client.get(url)
+        service.create(conversion, user_pk=user.pk)
+
+    result = benchmark(
+        f"history, {READS_PER_WRITE} reads per write "
+        f"({'cached' if cached else 'not cached'})",
+        reads_and_a_write,
+        iterations=5,
+    )
+    result.iterations *= READS_PER_WRITE
+    if lookups:
+        result.name += f", {sum(lookups) / len(lookups):.0%} hits"
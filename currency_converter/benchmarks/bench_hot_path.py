@@ -0,0 +1,164 @@
+"""
+The conversion hot path, end to end and piece by piece, to save as a baseline and compare
+later runs against (see conftest.py). convert_amount is in bench_convert_amount.py and
+listByUser in bench_conversions_history.py.
+
+MidnightCache runs against LocMemCache, which pickles values like Redis does without the
+network round trip, and against Redis when BENCHMARK_REDIS_URL is set.
+"""
+
+import datetime
+import os
+from decimal import Decimal
+
+import pytest
+from django.urls import reverse
+
+from conversion.api import CreateConversionView, GetUserConversionsView
+from conversion.domain import Conversion, ConversionRequest, ConversionResponse
+from conversion.models import Conversion as ConversionModel  # type: ignore
+from conversion.services import (
+    ConversionDbService,
+    ConversionRatesCacheService,
+    ExchangeRatesAPI,
+    MidnightCache,
+    get_rates_cache,
+)
+from conversion.test_services import MOCK_EXCHANGE_RATES
+
+CACHE_BACKENDS = {
+    "locmem": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "redis": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.environ.get("BENCHMARK_REDIS_URL"),
+    },
+}
+
+
+@pytest.fixture
+def todays_key():
+    return ExchangeRatesAPI(ConversionRatesCacheService(MidnightCache())).todays_key
+
+
+@pytest.fixture
+def warm_cache(todays_key):
+    MidnightCache().set(todays_key, MOCK_EXCHANGE_RATES)
+
+
+@pytest.fixture(autouse=True)
+def disable_throttling():
+    views = (CreateConversionView, GetUserConversionsView)
+    throttle_classes = [view.throttle_classes for view in views]
+    for view in views:
+        view.throttle_classes = ()
+    yield
+    for view, view_throttle_classes in zip(views, throttle_classes):
+        view.throttle_classes = view_throttle_classes
+
+
+@pytest.fixture
+def cache_backend(request, settings):
+    if request.param == "redis" and not os.environ.get("BENCHMARK_REDIS_URL"):
+        pytest.skip("BENCHMARK_REDIS_URL is not set")
+    settings.CACHES = {"default": CACHE_BACKENDS[request.param]}
+    return request.param
+
+
+def new_conversion(user_id: str) -> Conversion:
+    now = datetime.datetime.now(tz=datetime.timezone.utc)
+    return Conversion(
+        user_id=user_id,
+        request=ConversionRequest("USD", "EUR", Decimal("100.00")),
+        response=ConversionResponse(
+            rate=Decimal("0.92"),
+            rates_timestamp=now,
+            created_at=now,
+            converted_amount=Decimal("92.25"),
+        ),
+    )
+
+
+@pytest.mark.django_db()
+@pytest.mark.parametrize("enabled", [False, True])
+def test_get_latest_rates_hit(benchmark, settings, warm_cache, enabled):
+    settings.RATES_LOCAL_CACHE_ENABLED = enabled
+    service = ExchangeRatesAPI(ConversionRatesCacheService(get_rates_cache()))
+    benchmark(
+        f"get_latest_rates hit (local tier {'on' if enabled else 'off'})",
+        service.get_latest_rates,
+        iterations=10_000,
+    )
+
+
+@pytest.mark.parametrize("cache_backend", ["locmem", "redis"], indirect=True)
+def test_midnight_cache_get(benchmark, cache_backend, todays_key):
+    cache = MidnightCache()
+    cache.set(todays_key, MOCK_EXCHANGE_RATES)
+    benchmark(
+        f"MidnightCache get ({cache_backend})",
+        lambda: cache.get(todays_key),
+        iterations=10_000,
+    )
+
+
+@pytest.mark.parametrize("cache_backend", ["locmem", "redis"], indirect=True)
+def test_midnight_cache_set(benchmark, cache_backend, todays_key):
+    cache = MidnightCache()
+    benchmark(
+        f"MidnightCache set ({cache_backend})",
+        lambda: cache.set(todays_key, MOCK_EXCHANGE_RATES),
+        iterations=10_000,
+    )
+
+
+@pytest.mark.django_db()
+def test_conversion_db_create(benchmark, user):
+    service = ConversionDbService()
+    conversion = new_conversion(user.external_id)
+    try:
+        benchmark(
+            "ConversionDbService.create",
+            lambda: service.create(conversion, user_pk=user.pk),
+            iterations=1_000,
+        )
+    finally:
+        ConversionModel.objects.all().delete()
+
+
+@pytest.mark.django_db()
+def test_create_conversion_view(benchmark, client, user, warm_cache):
+    payload = {
+        "from_currency": "USD",
+        "to_currency": "BRL",
+        "amount": 10,
+        "user_id": user.external_id,
+    }
+    try:
+        benchmark(
+            "POST /api/conversions/",
+            lambda: client.post(
+                reverse("conversion-create"),
+                payload,
+                content_type="application/json",
+            ),
+            iterations=500,
+        )
+    finally:
+        ConversionModel.objects.all().delete()
+
+
+@pytest.mark.django_db()
+def test_user_conversions_view(benchmark, client, user):
+    service = ConversionDbService()
+    service.bulk_create(
+        [new_conversion(user.external_id) for _ in range(100)], user_pk=user.pk
+    )
+    url = reverse("conversions-user-list", args=[user.external_id])
+    try:
+        benchmark(
+            "GET /api/users/<user_id>/conversions/ (100 conversions)",
+            lambda: client.get(url),
+            iterations=500,
+        )
+    finally:
+        ConversionModel.objects.all().delete()
@@ -0,0 +1,65 @@
+"""
+Requests per second of POST /api/conversions/ with the in-process rates tier on and off.
+The Django cache is LocMemCache here, which pickles like Redis does but has no network
+round trip, so against Redis the gap is wider than what this reports.
+"""
+
+import pytest
+from django.urls import reverse
+
+from conversion.api import CreateConversionView
+from conversion.services import (
+    ConversionRatesCacheService,
+    ExchangeRatesAPI,
+    MidnightCache,
+    get_rates_cache,
+)
+from conversion.test_services import MOCK_EXCHANGE_RATES
+
+
+@pytest.fixture
+def todays_key():
+    return ExchangeRatesAPI(ConversionRatesCacheService(MidnightCache())).todays_key
+
+
+@pytest.fixture(autouse=True)
+def warm_cache(todays_key):
+    MidnightCache().set(todays_key, MOCK_EXCHANGE_RATES)
+
+
+@pytest.fixture(autouse=True)
+def disable_throttling():
+    throttling_clases = CreateConversionView.throttle_classes
+    CreateConversionView.throttle_classes = ()
+    yield
+    CreateConversionView.throttle_classes = throttling_clases
+
+
+@pytest.mark.django_db()
+@pytest.mark.parametrize("enabled", [False, True])
+def test_rates_cache_get(benchmark, settings, todays_key, enabled):
+    settings.RATES_LOCAL_CACHE_ENABLED = enabled
+    benchmark(
+        f"rates cache get (local tier {'on' if enabled else 'off'})",
+        lambda: get_rates_cache().get(todays_key),
+        iterations=10_000,
+    )
+
+
+@pytest.mark.django_db()
+@pytest.mark.parametrize("enabled", [False, True])
+def test_create_conversion_requests_per_second(
+    benchmark, client, user, settings, enabled
+):
+    settings.RATES_LOCAL_CACHE_ENABLED = enabled
+    payload = {
+        "from_currency": "USD",
+        "to_currency": "BRL",
+        "amount": 10,
+        "user_id": user.external_id,
+    }
+    benchmark(
+        f"POST conversion (local tier {'on' if enabled else 'off'})",
+        lambda: client.post(reverse("conversion-create"), payload, format="json"),
+        iterations=500,
+    )
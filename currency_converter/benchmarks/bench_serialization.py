@@ -0,0 +1,98 @@
+"""
+CPU cost of validating a POST /api/conversions/ body and of rendering 1, 100 and 10k
+conversions to JSON, with the DRF serializers and with conversion.fast_serializers.
+"""
+
+import datetime
+from decimal import Decimal
+from typing import Any
+
+import pytest
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from conversion.api import (  # type: ignore
+    ConversionRequestSerializer,
+    ConversionResponseSerializer,
+    format_conversion,
+)
+from conversion.domain import Conversion, ConversionRequest, ConversionResponse
+from conversion.fast_serializers import (
+    conversion_representation,
+    parse_conversion_request,
+)
+
+REQUEST: dict[str, Any] = {
+    "from_currency": "USD",
+    "to_currency": "BRL",
+    "amount": 10,
+    "user_id": "user_3aemZNca2qnvRZhwP8qbL3",
+}
+
+ITERATIONS = {1: 10_000, 100: 200, 10_000: 3}
+
+
+def serializers_validate():
+    serializer = ConversionRequestSerializer(data=REQUEST)
+    serializer.is_valid(raise_exception=True)
+    return serializer.validated_data
+
+
+def serializers_render(conversions: list[Conversion]) -> bytes:
+    return JSONRenderer().render(
+        ConversionResponseSerializer(
+            [format_conversion(conversion) for conversion in conversions], many=True
+        ).data
+    )
+
+
+def fast_render(conversions: list[Conversion]) -> bytes:
+    current_timezone = timezone.get_current_timezone()
+    return JSONRenderer().render(
+        [
+            conversion_representation(conversion, current_timezone)
+            for conversion in conversions
+        ]
+    )
+
+
+def make_conversions(rows: int) -> list[Conversion]:
+    now = datetime.datetime.now(tz=datetime.timezone.utc)
+    return [
+        Conversion(
+            id=id,
+            user_id=REQUEST["user_id"],
+            request=ConversionRequest(
+                from_currency="USD", to_currency="BRL", amount=Decimal("10.00")
+            ),
+            response=ConversionResponse(
+                converted_amount=Decimal("52.03"),
+                rate=Decimal("5.20"),
+                rates_timestamp=now,
+                created_at=now,
+            ),
+        )
+        for id in range(rows)
+    ]
+
+
+@pytest.mark.parametrize("fast", [False, True])
+def test_validate_request(benchmark, fast):
+    benchmark(
+        f"validate request ({'fast' if fast else 'serializers'})",
+        (lambda: parse_conversion_request(REQUEST)) if fast else serializers_validate,
+        iterations=10_000,
+    )
+
+
+@pytest.mark.parametrize("rows", [1, 100, 10_000])
+@pytest.mark.parametrize("fast", [False, True])
+def test_render_conversions(benchmark, rows, fast):
+    conversions = make_conversions(rows)
+    assert fast_render(conversions) == serializers_render(conversions)
+    render = fast_render if fast else serializers_render
+    benchmark(
+        f"render {rows} conversions ({'fast' if fast else 'serializers'})",
+        lambda: render(conversions),
+        iterations=ITERATIONS[rows],
+    )
@@ -0,0 +1,104 @@
+"""
+Transactions per second on a file database under concurrent readers and writers, with
+Django's default SQLite settings and with the "production" profile (DATABASE_PROFILE).
+Writers read then write in one transaction, like a request checking something before
+inserting a conversion; those that fail with "database is locked" are counted apart.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from django.db import OperationalError
+from django.db.utils import ConnectionHandler
+
+READERS = 4
+WRITERS = 4
+TRANSACTIONS = 200
+
+PROFILES = {
+    "default": {"ENGINE": "django.db.backends.sqlite3"},
+    "production": {
+        "ENGINE": "currency_converter.sqlite_backend",
+        "OPTIONS": {
+            "transaction_mode": "IMMEDIATE",
+            "pragmas": {
+                "journal_mode": "WAL",
+                "synchronous": "NORMAL",
+                "busy_timeout": 5000,
+                "mmap_size": 256 * 2**20,
+                "cache_size": -64_000,
+                "temp_store": "MEMORY",
+            },
+        },
+    },
+}
+
+
+class Database:
+    """One connection per thread on the given profile, like Django's own handler."""
+
+    def __init__(self, name, profile):
+        self.connections = ConnectionHandler(
+            {"default": {}, "bench": {"NAME": name, **PROFILES[profile]}}
+        )
+        self.locked = 0
+        self._lock = threading.Lock()
+
+    def transaction(self, sql, params=()):
+        connection = self.connections["bench"]
+        connection.set_autocommit(
+            False, force_begin_transaction_with_broken_autocommit=True
+        )
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT COUNT(*) FROM item")
+                cursor.fetchone()
+                if sql:
+                    cursor.execute(sql, params)
+            connection.commit()
+        except OperationalError:
+            connection.rollback()
+            with self._lock:
+                self.locked += 1
+        finally:
+            connection.set_autocommit(True)
+
+    def close(self):
+        self.connections.close_all()
+
+
+@pytest.fixture(params=PROFILES)
+def database(request, tmp_path):
+    database = Database(str(tmp_path / "profile.sqlite3"), request.param)
+    with database.connections["bench"].cursor() as cursor:
+        cursor.execute("CREATE TABLE item (id INTEGER PRIMARY KEY, value INTEGER)")
+    database.profile = request.param
+    yield database
+    database.close()
+
+
+@pytest.mark.django_db()
+def test_concurrent_reads_and_writes(benchmark, database):
+    def work(write):
+        try:
+            for i in range(TRANSACTIONS):
+                if write:
+                    database.transaction("INSERT INTO item (value) VALUES (%s)", [i])
+                else:
+                    database.transaction(None)
+        finally:
+            database.connections["bench"].close()
+
+    def run():
+        with ThreadPoolExecutor(READERS + WRITERS) as executor:
+            list(executor.map(work, [False] * READERS + [True] * WRITERS))
+
+    database.locked = 0
+    result = benchmark(
+        f"{READERS} readers, {WRITERS} writers ({database.profile})",
+        run,
+        iterations=3,
+    )
+    result.iterations *= (READERS + WRITERS) * TRANSACTIONS
+    result.name += f", {database.locked} locked"
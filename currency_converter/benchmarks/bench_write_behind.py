@@ -0,0 +1,77 @@
+"""
+Conversions written per second by ConversionDbService.create, inserting each row
+(the default) and in write-behind mode (CONVERSION_WRITE_BEHIND), from 1 and from
+THREADS threads like the ones of a gthread worker. Every operation writes WRITES
+conversions and, in write-behind mode, flushes what is left queued.
+"""
+
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+import pytest
+from django.db import connection
+
+from conversion.domain import Conversion, ConversionRequest, ConversionResponse
+from conversion.models import Conversion as ConversionModel  # type: ignore
+from conversion.services import ConversionDbService, ConversionWriteBuffer
+
+WRITES = 1000
+THREADS = 4
+ROUNDS = 3
+
+
+@pytest.fixture
+def conversion(user):
+    yield Conversion(
+        user_id=user.external_id,
+        request=ConversionRequest(
+            from_currency="USD", to_currency="BRL", amount=Decimal("10.00")
+        ),
+        response=ConversionResponse(
+            converted_amount=Decimal("52.03"),
+            rate=Decimal("5.20"),
+            rates_timestamp=datetime.datetime.now(tz=datetime.timezone.utc),
+            created_at=None,  # type: ignore
+        ),
+    )
+    ConversionModel.objects.all().delete()
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.parametrize("threads", [1, THREADS])
+@pytest.mark.parametrize("write_behind", [False, True])
+def test_writes(
+    benchmark, settings, monkeypatch, user, conversion, threads, write_behind
+):
+    buffer = ConversionWriteBuffer(
+        max_rows=settings.CONVERSION_WRITE_BEHIND_MAX_ROWS, flush_interval=0
+    )
+    monkeypatch.setattr("conversion.services.conversion_write_buffer", buffer)
+    settings.CONVERSION_WRITE_BEHIND = write_behind
+    service = ConversionDbService()
+
+    def write(count):
+        try:
+            for _ in range(count):
+                service.create(conversion, user_pk=user.pk)
+        finally:
+            if threads > 1:
+                connection.close()
+
+    def write_all():
+        if threads == 1:
+            write(WRITES)
+        else:
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                list(executor.map(write, [WRITES // threads] * threads))
+        buffer.flush()
+
+    result = benchmark(
+        f"{WRITES} writes, {'write-behind' if write_behind else 'inserts'}, "
+        f"{threads} thread(s) (per op)",
+        write_all,
+        iterations=ROUNDS,
+    )
+    assert ConversionModel.objects.count() == WRITES * (ROUNDS + 1)
+    result.name += f", {result.ops_per_second * WRITES:,.0f} writes/s"
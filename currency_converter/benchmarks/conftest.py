@@ -0,0 +1,232 @@
+"""
+Benchmarks are not collected by a plain `pytest` run (their modules are named bench_*.py).
+Run them explicitly, e.g. `pytest benchmarks/bench_rates_cache.py`, and read the summary at the end.
+
+Results can be kept as a JSON baseline and later runs compared against it:
+
+    pytest benchmarks/bench_hot_path.py --benchmark-save=baseline.json
+    pytest benchmarks/bench_hot_path.py --benchmark-compare=baseline.json
+
+A comparison flags the benchmarks whose time per operation grew by more than
+--benchmark-threshold (0.25, i.e. 25%, by default) and then fails the run. Timings vary by
+a few percent between runs, and baselines only compare on the same machine.
+"""
+
+import datetime
+import json
+import platform
+import time
+import tracemalloc
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Optional
+
+import pytest
+from django.core.cache import cache
+
+from conversion.services import last_known_rates, rates_local_cache
+from users.services import user_id_resolver
+
+RESULTS: list["BenchmarkResult"] = []
+# the comparison with --benchmark-compare's baseline, for the summary
+COMPARISON = pytest.StashKey[list]()
+
+
+@dataclass
+class BenchmarkResult:
+    name: str
+    iterations: int
+    seconds: float
+    peak_bytes: Optional[int] = None
+    # the name the benchmark was run under, before benchmarks append what they measured
+    # to name, which identifies it in baselines
+    key: str = ""
+
+    def __post_init__(self) -> None:
+        self.key = self.key or self.name
+
+    @property
+    def ops_per_second(self) -> float:
+        return self.iterations / self.seconds
+
+    @property
+    def mean_us(self) -> float:
+        return self.seconds / self.iterations * 1_000_000
+
+
+class Benchmark:
+    def __call__(
+        self,
+        name: str,
+        fn: Callable[[], object],
+        iterations: int = 1000,
+        trace_memory: bool = False,
+    ) -> BenchmarkResult:
+        """
+        Times iterations calls of fn. With trace_memory, one more, untimed, call
+        reports the peak of the memory allocated by Python while it ran.
+        """
+        fn()  # warm up
+        start = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        result = BenchmarkResult(name, iterations, time.perf_counter() - start)
+        if trace_memory:
+            tracemalloc.start()
+            try:
+                fn()
+                result.peak_bytes = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+        RESULTS.append(result)
+        return result
+
+
+@pytest.fixture
+def benchmark():
+    return Benchmark()
+
+
+@pytest.fixture(scope="session")
+def django_db_modify_db_settings(tmp_path_factory):
+    """
+    A file database, unlike the default shared in-memory one, copes with
+    concurrent connections the way production does.
+    """
+    from django.db import connection
+
+    connection.settings_dict["TEST"]["NAME"] = str(
+        tmp_path_factory.mktemp("db") / "bench.sqlite3"
+    )
+
+
+@pytest.fixture(autouse=True)
+def locmem_cache(settings):
+    settings.CACHES = {
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+    }
+    cache.clear()
+    rates_local_cache.clear()
+    last_known_rates.clear()
+    user_id_resolver.clear()
+    yield
+    rates_local_cache.clear()
+    last_known_rates.clear()
+    user_id_resolver.clear()
+
+
+@pytest.fixture
+def user(django_user_model):
+    yield django_user_model.objects.create_user(
+        email="bench@email.com", password="something"
+    )
+    django_user_model.objects.all().delete()
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("benchmarks")
+    group.addoption(
+        "--benchmark-save",
+        metavar="PATH",
+        help="Save the results as a JSON baseline.",
+    )
+    group.addoption(
+        "--benchmark-compare",
+        metavar="PATH",
+        help="Compare the results with a JSON baseline, failing on slowdowns.",
+    )
+    group.addoption(
+        "--benchmark-threshold",
+        type=float,
+        default=0.25,
+        help="Slowdown, as a fraction of the baseline time per op, that fails a comparison.",
+    )
+
+
+def baseline_of(results: list[BenchmarkResult]) -> dict:
+    return {
+        "created_at": datetime.datetime.now(tz=datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": {
+            result.key: {
+                "name": result.name,
+                "iterations": result.iterations,
+                "seconds": result.seconds,
+                "mean_us": result.mean_us,
+                "peak_bytes": result.peak_bytes,
+            }
+            for result in results
+        },
+    }
+
+
+def compare(
+    results: list[BenchmarkResult], baseline: dict, threshold: float
+) -> list[tuple[BenchmarkResult, Optional[float], bool]]:
+    """
+    Returns (result, change of its time per op against the baseline, slowed down beyond the
+    threshold) of every result, the change being None for benchmarks not in the baseline.
+    """
+    comparison: list[tuple[BenchmarkResult, Optional[float], bool]] = []
+    for result in results:
+        previous = baseline["results"].get(result.key)
+        if previous is None:
+            comparison.append((result, None, False))
+            continue
+        change = result.mean_us / previous["mean_us"] - 1
+        comparison.append((result, change, change > threshold))
+    return comparison
+
+
+def pytest_sessionfinish(session, exitstatus):
+    config = session.config
+    if not RESULTS:
+        return
+    if path := config.getoption("--benchmark-save"):
+        Path(path).write_text(json.dumps(baseline_of(RESULTS), indent=2) + "\n")
+    if path := config.getoption("--benchmark-compare"):
+        comparison = compare(
+            RESULTS,
+            json.loads(Path(path).read_text()),
+            config.getoption("--benchmark-threshold"),
+        )
+        config.stash[COMPARISON] = comparison
+        if any(regressed for _, _, regressed in comparison) and exitstatus == 0:
+            session.exitstatus = pytest.ExitCode.TESTS_FAILED
+
+
+def pytest_terminal_summary(terminalreporter, config):
+    if not RESULTS:
+        return
+    terminalreporter.section("benchmarks")
+    changes = {
+        id(result): (change, regressed)
+        for result, change, regressed in config.stash.get(COMPARISON, [])
+    }
+    for result in RESULTS:
+        line = (
+            f"{result.name:<60} {result.ops_per_second:>12,.1f} ops/s "
+            f"{result.mean_us:>10,.1f} us/op"
+        )
+        if result.peak_bytes is not None:
+            line += f" {result.peak_bytes / 1024:>10,.0f} KiB peak"
+        if id(result) in changes:
+            change, regressed = changes[id(result)]
+            if change is None:
+                line += "        (new)"
+            else:
+                line += f" {change:>+8.1%}"
+                if regressed:
+                    line += " SLOWER"
+            terminalreporter.write_line(line, red=regressed)
+        else:
+            terminalreporter.write_line(line)
+    if regressions := sum(regressed for _, regressed in changes.values()):
+        terminalreporter.write_line(
+            f"{regressions} benchmark(s) slower than the baseline by more than "
+            f"{config.getoption('--benchmark-threshold'):.0%}",
+            red=True,
+        )
+    if path := config.getoption("--benchmark-save"):
+        terminalreporter.write_line(f"baseline saved to {path}")
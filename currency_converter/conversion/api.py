@@ -1,31 +1,78 @@
+import base64
+import dataclasses
+import datetime
+import hashlib
+import json
+import time
+from typing import AsyncIterable, AsyncIterator, Iterable, Iterator, Optional
+
+from asgiref.sync import sync_to_async
 from rest_framework.views import APIView
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework import serializers, exceptions, status
-from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.db import IntegrityError
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers,
+)
+from django.utils.http import http_date
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
 
+from conversion import fast_serializers
+from conversion.renderers import RatesBinaryRenderer
+from conversion.timing import phase
 from conversion.domain import Conversion, ConversionRequest
 from conversion.services import (
+    AsyncConversionService,
+    AsyncExchangeRatesAPI,
     ConversionDbService,
     ConversionRatesCacheService,
     ConversionService,
     ExchangeRatesAPI,
-    MidnightCache,
+    conversion_history_cache,
+    get_rate_snapshot_store,
+    get_rates_cache,
+    idempotency_store,
+    seconds_until_midnight,
 )
 from conversion.exceptions import (
     ConversionRateServiceException,
+    ConversionRateServiceTimeoutException,
+    ConversionRateServiceUnavailableException,
     CurrencyNotFoundException,
+    IdempotencyKeyInProgressException,
+    IdempotencyKeyReusedException,
 )
-from drf_spectacular.utils import extend_schema, OpenApiExample
+from drf_spectacular.utils import extend_schema, OpenApiExample, OpenApiParameter
+from users.services import user_id_resolver
 
 import structlog
 
 logger = structlog.get_logger(__name__)
 
+RATES_STALE_HEADER = "X-Rates-Stale"
+IDEMPOTENCY_KEY_HEADER = "Idempotency-Key"
+IDEMPOTENT_REPLAYED_HEADER = "Idempotent-Replayed"
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+# query parameters of GET /api/quote/ and the ConversionItemSerializer fields they fill
+QUOTE_PARAMETERS = {"from": "from_currency", "to": "to_currency", "amount": "amount"}
+
 
-class ConversionRequestSerializer(serializers.Serializer):
+class ConversionItemSerializer(serializers.Serializer):
     from_currency = serializers.CharField()
     to_currency = serializers.CharField()
     amount = serializers.DecimalField(max_digits=5, decimal_places=2)
+
+
+class ConversionRequestSerializer(ConversionItemSerializer):
     user_id = serializers.CharField()
 
 
@@ -37,10 +84,416 @@ class ConversionResponseSerializer(ConversionRequestSerializer):
     created_at = serializers.DateTimeField(format="%Y-%m-%d %H:%M:%S %Z%z")
 
 
+class QuoteResponseSerializer(ConversionItemSerializer):
+    to_amount = serializers.DecimalField(max_digits=5, decimal_places=2)
+    rate = serializers.DecimalField(max_digits=5, decimal_places=2)
+    rates_timestamp = serializers.DateTimeField(format="%Y-%m-%d %H:%M:%S %Z%z")
+
+
+class RatesTableSerializer(serializers.Serializer):
+    base = serializers.CharField()
+    date = serializers.CharField()
+    timestamp = serializers.IntegerField()
+    rates = serializers.DictField(child=serializers.FloatField())
+
+
+class CurrenciesSerializer(serializers.Serializer):
+    base = serializers.CharField()
+    date = serializers.CharField()
+    timestamp = serializers.IntegerField()
+    currencies = serializers.ListField(child=serializers.CharField())
+
+
 class ErrorResponseSerializer(serializers.Serializer):
     detail = serializers.JSONField()
 
 
+class ConversionBatchRequestSerializer(serializers.Serializer):
+    user_id = serializers.CharField()
+    conversions = serializers.ListField(
+        child=serializers.DictField(),
+        min_length=1,
+        max_length=settings.CONVERSION_BATCH_MAX_ITEMS,
+    )
+
+
+class ConversionBatchResultSerializer(serializers.Serializer):
+    index = serializers.IntegerField()
+    conversion = ConversionResponseSerializer(required=False)
+    detail = serializers.JSONField(required=False)
+
+
+class ConversionBatchResponseSerializer(serializers.Serializer):
+    user_id = serializers.CharField()
+    results = ConversionBatchResultSerializer(many=True)
+
+
+class ConversionListQuerySerializer(serializers.Serializer):
+    limit = serializers.IntegerField(
+        required=False, min_value=1, max_value=settings.CONVERSION_LIST_MAX_LIMIT
+    )
+    cursor = serializers.CharField(required=False)
+    stream = serializers.BooleanField(required=False, default=False)
+
+    def validate_cursor(self, value):
+        try:
+            return decode_cursor(value)
+        except ValueError:
+            raise serializers.ValidationError("Invalid cursor.")
+
+    def validate(self, attrs):
+        if attrs["stream"] and "limit" in attrs:
+            raise serializers.ValidationError(
+                {"limit": "A streamed list can't be limited."}
+            )
+        return attrs
+
+
+class ConversionPageSerializer(serializers.Serializer):
+    results = ConversionResponseSerializer(many=True)
+    next = serializers.CharField(allow_null=True)
+
+
+def encode_cursor(conversion: Conversion) -> str:
+    """
+    Encodes the position after a conversion, (created_at, id), as an opaque page cursor.
+    """
+    position = json.dumps(
+        [conversion.response.created_at.isoformat(), conversion.id],
+        separators=(",", ":"),
+    )
+    return base64.urlsafe_b64encode(position.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime.datetime, int]:
+    try:
+        created_at, id = json.loads(
+            base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        )
+        return datetime.datetime.fromisoformat(created_at), int(id)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def conversions_data(conversions: list[Conversion], limit: Optional[int]):
+    """
+    Renders a user's conversions: the whole list when not paginated (limit is None), otherwise
+    a page of limit conversions out of the limit + 1 read, the extra one telling there's a next page.
+    """
+    current_timezone = timezone.get_current_timezone()
+    if limit is None:
+        return [
+            conversion_data(conversion, current_timezone) for conversion in conversions
+        ]
+
+    page = conversions[:limit]
+    return {
+        "results": [
+            conversion_data(conversion, current_timezone) for conversion in page
+        ],
+        "next": encode_cursor(page[-1]) if len(conversions) > limit else None,
+    }
+
+
+def conversions_json_chunks(
+    conversions: Iterable[Conversion], chunk_size: int
+) -> Iterator[str]:
+    """
+    Writes a JSON array of conversions, as the not paginated list renders it,
+    chunk_size elements at a time.
+    """
+    current_timezone = timezone.get_current_timezone()
+    chunk: list[str] = []
+    separator = ""
+    yield "["
+    for conversion in conversions:
+        chunk.append(
+            json.dumps(
+                conversion_data(conversion, current_timezone), separators=(",", ":")
+            )
+        )
+        if len(chunk) == chunk_size:
+            yield separator + ",".join(chunk)
+            chunk.clear()
+            separator = ","
+    if chunk:
+        yield separator + ",".join(chunk)
+    yield "]"
+
+
+async def aconversions_json_chunks(
+    conversions: AsyncIterable[Conversion], chunk_size: int
+) -> AsyncIterator[str]:
+    current_timezone = timezone.get_current_timezone()
+    chunk: list[str] = []
+    separator = ""
+    yield "["
+    async for conversion in conversions:
+        chunk.append(
+            json.dumps(
+                conversion_data(conversion, current_timezone), separators=(",", ":")
+            )
+        )
+        if len(chunk) == chunk_size:
+            yield separator + ",".join(chunk)
+            chunk.clear()
+            separator = ","
+    if chunk:
+        yield separator + ",".join(chunk)
+    yield "]"
+
+
+def history_etag(
+    request, version: int, last_position: Optional[tuple[datetime.datetime, int]]
+) -> str:
+    """
+    Returns the ETag of a user's conversions response, from the version of their history (see
+    ConversionHistoryCache), the position of their last conversion (see
+    ConversionDbService.last_position) and the response variant.
+    Every write through ConversionDbService bumps the version, write-behind rows too, which can
+    land before rows already listed; the last position also catches conversions appended by
+    other means.
+    The responses have no Last-Modified: at a second's resolution, a conversion written in the
+    same second as the previous response would leave it unchanged, and If-Modified-Since would
+    then get a 304 for a stale list.
+    """
+    created_at, last_id = last_position or (None, None)
+    validator = ":".join(
+        [
+            str(version),
+            str(last_id),
+            created_at.isoformat() if created_at else "",
+            history_variant(request),
+        ]
+    )
+    return f'"{hashlib.md5(validator.encode(), usedforsecurity=False).hexdigest()}"'
+
+
+def history_variant(request) -> str:
+    """
+    Identifies, besides the user's conversions, what a user's conversions response depends on:
+    its query string and the current timezone.
+    """
+    variant = (
+        f"{request.META.get('QUERY_STRING', '')}:{timezone.get_current_timezone_name()}"
+    )
+    return hashlib.md5(variant.encode(), usedforsecurity=False).hexdigest()
+
+
+def cached_history_response(request, cached) -> Optional[HttpResponse]:
+    """
+    Returns the response of a rendered response cached by conversion_history_cache, as
+    (content, etag), or None when there's none.
+    """
+    if cached is None:
+        return None
+    content, etag = cached
+    response = not_modified_response(request, etag)
+    if response is None:
+        response = HttpResponse(content, content_type="application/json")
+        with_etag(response, etag)
+    return response
+
+
+def not_modified_response(request, etag: str):
+    """
+    Returns the 304 Not Modified (or 412) response of a conditional request whose ETag
+    matches, or None when the response has to be rendered.
+    """
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        with_etag(response, etag)
+    return response
+
+
+def with_etag(response, etag: str):
+    response["ETag"] = etag
+    # clients may keep the response, but have to revalidate it before reusing it
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def page_limit(query: dict) -> Optional[int]:
+    """
+    Pagination is opt-in: a request without limit nor cursor gets the whole list.
+    """
+    if "limit" in query:
+        return query["limit"]
+    if "cursor" in query:
+        return settings.CONVERSION_LIST_DEFAULT_LIMIT
+    return None
+
+
+def conversion_data(
+    conversion: Conversion, current_timezone: Optional[datetime.tzinfo] = None
+) -> dict:
+    """
+    Renders a conversion with ConversionResponseSerializer, or with its fast equivalent
+    when settings.CONVERSION_FAST_SERIALIZATION is on.
+    """
+    if settings.CONVERSION_FAST_SERIALIZATION:
+        return fast_serializers.conversion_representation(conversion, current_timezone)
+    return ConversionResponseSerializer(format_conversion(conversion)).data
+
+
+def validated_conversion_data(
+    serializer_class: type[ConversionItemSerializer], data
+) -> dict:
+    """
+    Validates data with serializer_class, raising its ValidationError. When
+    settings.CONVERSION_FAST_SERIALIZATION is on, plainly valid data don't go through the
+    serializer, the rest still does for its error messages.
+    """
+    if settings.CONVERSION_FAST_SERIALIZATION:
+        if serializer_class is ConversionRequestSerializer:
+            validated_data = fast_serializers.parse_conversion_request(data)
+        else:
+            validated_data = fast_serializers.parse_conversion_item(data)
+        if validated_data is not None:
+            return validated_data
+    serializer = serializer_class(data=data)
+    serializer.is_valid(raise_exception=True)
+    return serializer.validated_data
+
+
+def format_conversion(conversion: Conversion) -> dict:
+    return {
+        "id": conversion.id,
+        "user_id": conversion.user_id,
+        "from_currency": conversion.request.from_currency,
+        "amount": conversion.request.amount,
+        "to_currency": conversion.request.to_currency,
+        "to_amount": conversion.response.converted_amount,
+        "rate": conversion.response.rate,
+        "rates_timestamp": conversion.response.rates_timestamp,
+        "created_at": conversion.response.created_at,
+    }
+
+
+def rates_service_api_exception(error: Exception) -> exceptions.APIException:
+    """
+    Maps a failure of the rates service to the API error response.
+    """
+    if isinstance(error, ConversionRateServiceTimeoutException):
+        api_exception = exceptions.APIException(detail={"detail": str(error)})
+        api_exception.status_code = status.HTTP_504_GATEWAY_TIMEOUT
+    elif isinstance(error, ConversionRateServiceUnavailableException):
+        api_exception = exceptions.APIException(detail={"detail": str(error)})
+        api_exception.status_code = status.HTTP_502_BAD_GATEWAY
+    elif isinstance(error, ConversionRateServiceException):
+        api_exception = exceptions.APIException(detail={"detail": str(error)})
+    else:
+        # any other exception, it may or may not carry an HTTP response
+        api_exception = exceptions.APIException(detail=str(error))
+        api_exception.status_code = getattr(
+            getattr(error, "response", None),
+            "status_code",
+            status.HTTP_500_INTERNAL_SERVER_ERROR,
+        )
+    return api_exception
+
+
+def get_rates_service() -> ExchangeRatesAPI:
+    return ExchangeRatesAPI(
+        ConversionRatesCacheService(get_rates_cache()),
+        snapshot_store=get_rate_snapshot_store(),
+    )
+
+
+def get_conversion_service() -> ConversionService:
+    return ConversionService(get_rates_service())
+
+
+def get_async_conversion_service() -> AsyncConversionService:
+    return AsyncConversionService(
+        AsyncExchangeRatesAPI(
+            ConversionRatesCacheService(get_rates_cache()),
+            snapshot_store=get_rate_snapshot_store(),
+        )
+    )
+
+
+def api_exception_response(api_exception: exceptions.APIException) -> JsonResponse:
+    """
+    Renders an APIException the way DRF's exception handler does, for the async views.
+    """
+    detail = api_exception.detail
+    data = detail if isinstance(detail, (dict, list)) else {"detail": detail}
+    response = json_response(data, status=api_exception.status_code)
+    if getattr(api_exception, "wait", None):
+        response["Retry-After"] = "%d" % api_exception.wait  # type: ignore
+    return response
+
+
+def with_rates_staleness(response, conversions: Iterable[Conversion]):
+    """
+    Flags, with an X-Rates-Stale: true header, the responses whose conversions used the last known
+    rates because the current ones couldn't be fetched (see RATES_STALE_WINDOW).
+    """
+    if any(conversion.response.stale for conversion in conversions):
+        response[RATES_STALE_HEADER] = "true"
+    return response
+
+
+def idempotency_key(request) -> Optional[str]:
+    """
+    The Idempotency-Key header of a request, if it has one.
+    """
+    key = request.headers.get(IDEMPOTENCY_KEY_HEADER)
+    if key is None:
+        return None
+    key = key.strip()
+    if not key or len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise exceptions.ValidationError(
+            detail={
+                IDEMPOTENCY_KEY_HEADER: [
+                    f"Must have 1 to {IDEMPOTENCY_KEY_MAX_LENGTH} characters."
+                ]
+            }
+        )
+    return key
+
+
+def idempotency_fingerprint(validated_data: dict) -> str:
+    return hashlib.sha256(
+        json.dumps(validated_data, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+def idempotency_api_exception(error: Exception) -> exceptions.APIException:
+    api_exception = exceptions.APIException(detail={"detail": str(error)})
+    if isinstance(error, IdempotencyKeyReusedException):
+        api_exception.status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    else:
+        api_exception.status_code = status.HTTP_409_CONFLICT
+    return api_exception
+
+
+def created_conversion(conversion: Conversion) -> dict:
+    """
+    The response to a created conversion, as kept for the repeats of an idempotent request.
+    """
+    headers = {RATES_STALE_HEADER: "true"} if conversion.response.stale else {}
+    with phase("serialize"):
+        return {"data": conversion_data(conversion), "headers": headers}
+
+
+def user_deleted_api_exception(validated_data: dict) -> exceptions.APIException:
+    """
+    The user_pk resolved from the cache belongs to a user deleted from another process
+    since, which the conversion's foreign key then rejects.
+    """
+    user_id_resolver.invalidate(validated_data["user_id"])
+    logger.exception("User does not exist", **validated_data)
+    return exceptions.PermissionDenied()
+
+
+def json_response(data, status: int) -> JsonResponse:
+    return JsonResponse(
+        data, status=status, safe=False, json_dumps_params={"separators": (",", ":")}
+    )
+
+
 class CreateConversionView(APIView):
     @extend_schema(
         request=ConversionRequestSerializer,
@@ -48,8 +501,31 @@ class CreateConversionView(APIView):
             200: ConversionResponseSerializer,
             400: ErrorResponseSerializer,
             500: ErrorResponseSerializer,
+            502: ErrorResponseSerializer,
+            409: ErrorResponseSerializer,
+            422: ErrorResponseSerializer,
+            504: ErrorResponseSerializer,
         },
-        description="Request a new conversion",
+        parameters=[
+            OpenApiParameter(
+                IDEMPOTENCY_KEY_HEADER,
+                location=OpenApiParameter.HEADER,
+                required=False,
+                description=(
+                    "Makes the request safe to retry: a repeat with the same key returns "
+                    "the first response, with an Idempotent-Replayed: true header, "
+                    "without converting again. The key used for a different request "
+                    "gets a 422, a repeat while the first request runs waits for it "
+                    "and gets a 409 if it takes too long."
+                ),
+            ),
+        ],
+        description=(
+            "Request a new conversion. "
+            "While the current rates can't be fetched, recent rates are used: "
+            "rates_timestamp tells their age and the response has an "
+            "X-Rates-Stale: true header."
+        ),
         tags=["Conversions"],
         examples=[
             OpenApiExample(
@@ -95,71 +571,437 @@ class CreateConversionView(APIView):
         ],
     )
     def post(self, request):
-        serializer = ConversionRequestSerializer(data=request.data)
-        if serializer.is_valid(raise_exception=True):
-            User = get_user_model()
+        validated_data = validated_conversion_data(
+            ConversionRequestSerializer, request.data
+        )
+        key = idempotency_key(request)
+        with phase("user"):
+            user_pk = user_id_resolver.resolve(validated_data["user_id"])
+        if user_pk is None:
+            logger.exception("User does not exist", **validated_data)
+            raise exceptions.PermissionDenied()
+
+        if key is None:
+            created, replayed = self.create(validated_data, user_pk), False
+        else:
             try:
-                User.objects.get(external_id=serializer.validated_data["user_id"])
-            except User.DoesNotExist:
-                logger.exception("User does not exist", **serializer.validated_data)
-                raise exceptions.PermissionDenied()
+                created, replayed = idempotency_store.run(
+                    validated_data["user_id"],
+                    key,
+                    idempotency_fingerprint(validated_data),
+                    lambda: self.create(validated_data, user_pk),
+                )
+            except (
+                IdempotencyKeyReusedException,
+                IdempotencyKeyInProgressException,
+            ) as e:
+                logger.info(str(e), idempotency_key=key, **validated_data)
+                raise idempotency_api_exception(e)
+
+        response = Response(
+            created["data"], status=status.HTTP_201_CREATED, headers=created["headers"]
+        )
+        if replayed:
+            response[IDEMPOTENT_REPLAYED_HEADER] = "true"
+        return response
 
-            conversion_request = ConversionRequest(
-                from_currency=serializer.validated_data["from_currency"],
-                to_currency=serializer.validated_data["to_currency"],
-                amount=serializer.validated_data["amount"],
+    def create(self, validated_data: dict, user_pk: int) -> dict:
+        conversion_request = ConversionRequest(
+            from_currency=validated_data["from_currency"],
+            to_currency=validated_data["to_currency"],
+            amount=validated_data["amount"],
+        )
+
+        try:
+            conversion_response = get_conversion_service().convert_currency(
+                conversion_request
             )
+        except CurrencyNotFoundException as cnfe:
+            logger.exception(str(cnfe), **validated_data)
+            raise exceptions.ValidationError(detail={"detail": str(cnfe)})
+        except Exception as e:
+            logger.exception(str(e), **validated_data)
+            raise rates_service_api_exception(e)
 
+        conversion = Conversion(
+            user_id=validated_data["user_id"],
+            request=conversion_request,
+            response=conversion_response,
+        )
+        with phase("db"):
             try:
-                conversion_service = ConversionService(
-                    ExchangeRatesAPI(ConversionRatesCacheService(MidnightCache()))
+                successful_conversion = ConversionDbService().create(
+                    conversion, user_pk=user_pk
                 )
-                conversion_response = conversion_service.convert_currency(
-                    conversion_request
+            except IntegrityError:
+                raise user_deleted_api_exception(validated_data)
+        logger.info("Conversion created", **format_conversion(successful_conversion))
+        return created_conversion(successful_conversion)
+
+
+class CreateConversionBatchView(APIView):
+    @extend_schema(
+        request=ConversionBatchRequestSerializer,
+        responses={
+            201: ConversionBatchResponseSerializer,
+            400: ConversionBatchResponseSerializer,
+            500: ErrorResponseSerializer,
+            502: ErrorResponseSerializer,
+            504: ErrorResponseSerializer,
+        },
+        description=(
+            "Request many conversions for the same user at once. "
+            "Invalid items are reported individually and don't fail the others."
+        ),
+        tags=["Conversions"],
+        examples=[
+            OpenApiExample(
+                "New conversions batch request example",
+                value={
+                    "user_id": "user_123",
+                    "conversions": [
+                        {"from_currency": "USD", "to_currency": "EUR", "amount": 100},
+                        {"from_currency": "USD", "to_currency": "YYY", "amount": 10},
+                    ],
+                },
+                request_only=True,
+            ),
+            OpenApiExample(
+                "Conversions batch response example",
+                value={
+                    "user_id": "user_123",
+                    "results": [
+                        {
+                            "index": 0,
+                            "conversion": {
+                                "id": 1,
+                                "user_id": "user_123",
+                                "from_currency": "USD",
+                                "amount": 100,
+                                "to_currency": "EUR",
+                                "to_amount": 108.40,
+                                "rate": 1.16,
+                                "rates_timestamp": "2024-06-02 15:56:58 UTC+0000",
+                            },
+                        },
+                        {"index": 1, "detail": "USD or YYY not found"},
+                    ],
+                },
+                response_only=True,
+            ),
+        ],
+    )
+    def post(self, request):
+        serializer = ConversionBatchRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user_id = serializer.validated_data["user_id"]
+        user_pk = user_id_resolver.resolve(user_id)
+        if user_pk is None:
+            logger.exception("User does not exist", user_id=user_id)
+            raise exceptions.PermissionDenied()
+
+        results: list[dict] = []
+        conversion_requests: list[tuple[int, ConversionRequest]] = []
+        for index, item in enumerate(serializer.validated_data["conversions"]):
+            try:
+                item_data = validated_conversion_data(ConversionItemSerializer, item)
+            except exceptions.ValidationError as e:
+                results.append({"index": index, "detail": e.detail})
+            else:
+                conversion_requests.append((index, ConversionRequest(**item_data)))
+
+        conversions: list[tuple[int, Conversion]] = []
+        if conversion_requests:
+            try:
+                conversion_responses = get_conversion_service().convert_currencies(
+                    [
+                        conversion_request
+                        for _, conversion_request in conversion_requests
+                    ]
                 )
-            except CurrencyNotFoundException as cnfe:
-                logger.exception(str(cnfe), **serializer.validated_data)
-                raise exceptions.ValidationError(detail={"detail": str(cnfe)})
-            except ConversionRateServiceException as crse:
-                logger.exception(str(crse), **serializer.validated_data)
-                raise exceptions.APIException(detail={"detail": str(crse)})
             except Exception as e:
-                # any other exception like from requests.get
-                logger.exception(str(e), **serializer.validated_data)
-                api_exception = exceptions.APIException(detail=str(e))
-                api_exception.status_code = e.response.status_code
-                raise api_exception
-
-            conversion = Conversion(
-                user_id=serializer.validated_data["user_id"],
-                request=conversion_request,
-                response=conversion_response,
-            )
-            successful_conversion = ConversionDbService().create(conversion)
-            formatted_conversion = {
-                "id": successful_conversion.id,
-                "user_id": successful_conversion.user_id,
-                "from_currency": successful_conversion.request.from_currency,
-                "amount": successful_conversion.request.amount,
-                "to_currency": successful_conversion.request.to_currency,
-                "to_amount": successful_conversion.response.converted_amount,
-                "rate": successful_conversion.response.rate,
-                "rates_timestamp": successful_conversion.response.rates_timestamp,
-                "created_at": successful_conversion.response.created_at,
-            }
-            logger.info("Conversion created", **formatted_conversion)
-            return Response(
-                ConversionResponseSerializer(formatted_conversion).data,
-                status=status.HTTP_201_CREATED,
+                logger.exception(str(e), user_id=user_id)
+                raise rates_service_api_exception(e)
+
+            for (index, conversion_request), conversion_response in zip(
+                conversion_requests, conversion_responses
+            ):
+                if isinstance(conversion_response, CurrencyNotFoundException):
+                    results.append({"index": index, "detail": str(conversion_response)})
+                else:
+                    conversions.append(
+                        (
+                            index,
+                            Conversion(
+                                user_id=user_id,
+                                request=conversion_request,
+                                response=conversion_response,
+                            ),
+                        )
+                    )
+
+        if conversions:
+            try:
+                successful_conversions = ConversionDbService().bulk_create(
+                    [conversion for _, conversion in conversions], user_pk=user_pk
+                )
+            except IntegrityError:
+                raise user_deleted_api_exception({"user_id": user_id})
+            for (index, _), successful_conversion in zip(
+                conversions, successful_conversions
+            ):
+                results.append(
+                    {
+                        "index": index,
+                        "conversion": format_conversion(successful_conversion),
+                    }
+                )
+            logger.info(
+                "Conversions created",
+                user_id=user_id,
+                count=len(successful_conversions),
             )
 
+        results.sort(key=lambda result: result["index"])
+        response = Response(
+            ConversionBatchResponseSerializer(
+                {"user_id": user_id, "results": results}
+            ).data,
+            status=status.HTTP_201_CREATED
+            if conversions
+            else status.HTTP_400_BAD_REQUEST,
+        )
+        return with_rates_staleness(response, [c for _, c in conversions])
+
+
+def quote_request(query_params) -> ConversionRequest:
+    data = {
+        field: query_params[parameter]
+        for parameter, field in QUOTE_PARAMETERS.items()
+        if parameter in query_params
+    }
+    try:
+        validated_data = validated_conversion_data(ConversionItemSerializer, data)
+    except exceptions.ValidationError as e:
+        # reported under the names of the query parameters
+        fields = {field: parameter for parameter, field in QUOTE_PARAMETERS.items()}
+        raise exceptions.ValidationError(
+            detail={fields.get(key, key): value for key, value in e.detail.items()}
+        )
+    return ConversionRequest(
+        from_currency=validated_data["from_currency"],
+        to_currency=validated_data["to_currency"],
+        amount=validated_data["amount"],
+    )
+
+
+def with_rates_caching(response, stale: bool):
+    """
+    Lets shared caches keep a response computed from the rates until they expire, at midnight
+    UTC (see MidnightCache). Responses from the last known rates are not kept, the current ones
+    may be back by the next request.
+    """
+    if stale:
+        response[RATES_STALE_HEADER] = "true"
+        patch_cache_control(response, no_cache=True)
+        return response
+    max_age = seconds_until_midnight()
+    patch_cache_control(response, public=True, max_age=max_age)
+    response["Expires"] = http_date(time.time() + max_age)
+    return response
+
+
+class QuoteView(APIView):
+    @extend_schema(
+        parameters=[
+            OpenApiParameter("from", str, required=True, description="e.g. USD"),
+            OpenApiParameter("to", str, required=True, description="e.g. EUR"),
+            OpenApiParameter("amount", float, required=True, description="e.g. 100"),
+        ],
+        responses={
+            200: QuoteResponseSerializer,
+            400: ErrorResponseSerializer,
+            500: ErrorResponseSerializer,
+            502: ErrorResponseSerializer,
+            504: ErrorResponseSerializer,
+        },
+        description=(
+            "Quote a conversion with the current rates, without recording it. "
+            "The response can be cached, by a proxy too, until the rates expire at "
+            "midnight UTC; quotes from the last known rates have an X-Rates-Stale: true "
+            "header and are not cached."
+        ),
+        tags=["Conversions"],
+        examples=[
+            OpenApiExample(
+                "Quote response example",
+                value={
+                    "from_currency": "USD",
+                    "to_currency": "EUR",
+                    "amount": 100,
+                    "to_amount": 108.40,
+                    "rate": 1.16,
+                    "rates_timestamp": "2024-06-02 15:56:58 UTC+0000",
+                },
+                response_only=True,
+            ),
+        ],
+    )
+    def get(self, request):
+        conversion_request = quote_request(request.query_params)
+        try:
+            conversion_response = get_conversion_service().convert_currency(
+                conversion_request
+            )
+        except CurrencyNotFoundException as cnfe:
+            logger.exception(str(cnfe), **dataclasses.asdict(conversion_request))
+            raise exceptions.ValidationError(detail={"detail": str(cnfe)})
+        except Exception as e:
+            logger.exception(str(e), **dataclasses.asdict(conversion_request))
+            raise rates_service_api_exception(e)
+
+        data = QuoteResponseSerializer(
+            {
+                "from_currency": conversion_request.from_currency,
+                "to_currency": conversion_request.to_currency,
+                "amount": conversion_request.amount,
+                "to_amount": conversion_response.converted_amount,
+                "rate": conversion_response.rate,
+                "rates_timestamp": conversion_response.rates_timestamp,
+            }
+        ).data
+        return with_rates_caching(Response(data), conversion_response.stale)
+
+
+class RatesTableView(APIView):
+    """
+    Base of the views serving the cached rates table, in JSON or in the compact encoding of
+    conversion.renderers, under an ETag of its upstream timestamp.
+    It serves the whole table; subclasses serve a part of it by overriding table_data.
+    """
+
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, RatesBinaryRenderer]
+
+    def get(self, request):
+        try:
+            rates = get_rates_service().get_successful_rates()
+        except Exception as e:
+            logger.exception(str(e))
+            raise rates_service_api_exception(e)
+
+        etag = (
+            f'"{rates["base"]}-{rates["timestamp"]}-{request.accepted_renderer.format}"'
+        )
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = Response(self.table_data(rates))
+        response["ETag"] = etag
+        patch_vary_headers(response, ["Accept"])
+        return with_rates_caching(response, rates.get("stale", False))
+
+    def table_data(self, rates: dict) -> dict:
+        return {
+            "base": rates["base"],
+            "date": rates["date"],
+            "timestamp": rates["timestamp"],
+            "rates": rates["rates"],
+        }
+
+    def handle_exception(self, exc):
+        response = super().handle_exception(exc)
+        if isinstance(
+            getattr(self.request, "accepted_renderer", None), RatesBinaryRenderer
+        ):
+            # errors are rendered in JSON
+            self.request.accepted_renderer = JSONRenderer()
+            self.request.accepted_media_type = JSONRenderer.media_type
+        return response
+
+
+class RatesView(RatesTableView):
+    @extend_schema(
+        responses={
+            200: RatesTableSerializer,
+            304: None,
+            500: ErrorResponseSerializer,
+            502: ErrorResponseSerializer,
+            504: ErrorResponseSerializer,
+        },
+        description=(
+            "The current rates of every currency to the base currency, to convert locally. "
+            "With ?format=bin or Accept: application/octet-stream the table comes in a "
+            "compact binary encoding (see conversion.renderers). "
+            "The ETag changes with the rates: pass it back in If-None-Match to get a 304 "
+            "Not Modified until they do. The response can be cached until the rates expire "
+            "at midnight UTC."
+        ),
+        tags=["Rates"],
+    )
+    def get(self, request):
+        return super().get(request)
+
+
+class CurrenciesView(RatesTableView):
+    @extend_schema(
+        responses={
+            200: CurrenciesSerializer,
+            304: None,
+            500: ErrorResponseSerializer,
+            502: ErrorResponseSerializer,
+            504: ErrorResponseSerializer,
+        },
+        description=(
+            "The currencies that can be converted, from the current rates table. "
+            "Same encodings and caching as GET /api/rates/."
+        ),
+        tags=["Rates"],
+    )
+    def get(self, request):
+        return super().get(request)
+
+    def table_data(self, rates: dict) -> dict:
+        return {
+            "base": rates["base"],
+            "date": rates["date"],
+            "timestamp": rates["timestamp"],
+            "currencies": sorted(rates["rates"]),
+        }
+
 
 class GetUserConversionsView(APIView):
     @extend_schema(
+        parameters=[ConversionListQuerySerializer],
         responses={200: ConversionResponseSerializer},
-        description="Request user's conversions",
+        description=(
+            "Request user's conversions, oldest first. "
+            "With limit and/or cursor the response is a page: "
+            '{"results": [...], "next": cursor of the next page, or null}. '
+            "With stream=true the whole list (from cursor, if given) is streamed, "
+            "for exports of large histories. "
+            "Responses carry an ETag: pass it back in If-None-Match to get a "
+            "304 Not Modified while the user's conversions don't change."
+        ),
         tags=["Conversions"],
         examples=[
+            OpenApiExample(
+                "User's conversions page response example",
+                value={
+                    "results": [
+                        {
+                            "id": 1,
+                            "user_id": "user_123",
+                            "from_currency": "USD",
+                            "amount": 100,
+                            "to_currency": "EUR",
+                            "to_amount": 108.40,
+                            "rate": 1.16,
+                            "rates_timestamp": "2024-06-02 15:56:58 UTC+0000",
+                        },
+                    ],
+                    "next": "WyIyMDI0LTA2LTAyVDE1OjU3OjAxLjEyMzQ1NiswMDowMCIsMV0",
+                },
+                response_only=True,
+            ),
             OpenApiExample(
                 "User's conversions response example",
                 value=[
@@ -189,30 +1031,265 @@ class GetUserConversionsView(APIView):
         ],
     )
     def get(self, request, user_id):
-        User = get_user_model()
-        try:
-            User.objects.get(external_id=user_id)
-        except User.DoesNotExist:
+        query_serializer = ConversionListQuerySerializer(data=request.query_params)
+        query_serializer.is_valid(raise_exception=True)
+        query = query_serializer.validated_data
+        limit = page_limit(query)
+
+        with phase("user"):
+            user_pk = user_id_resolver.resolve(user_id)
+        if user_pk is None:
             logger.exception("User does not exist", user_id=user_id)
             raise exceptions.PermissionDenied()
 
-        user_conversions = ConversionDbService().listByUser(user_id=user_id)
-        output_conversions = []
-        for conversion in user_conversions:
-            output_conversions.append(
-                {
-                    "id": conversion.id,
-                    "user_id": conversion.user_id,
-                    "from_currency": conversion.request.from_currency,
-                    "amount": conversion.request.amount,
-                    "to_currency": conversion.request.to_currency,
-                    "to_amount": conversion.response.converted_amount,
-                    "rate": conversion.response.rate,
-                    "rates_timestamp": conversion.response.rates_timestamp,
-                    "created_at": conversion.response.created_at,
-                }
-            )
-        return Response(
-            ConversionResponseSerializer(output_conversions, many=True).data,
-            status=status.HTTP_200_OK,
+        cache_response = (
+            settings.CONVERSION_HISTORY_CACHE
+            and not query["stream"]
+            and request.accepted_renderer.format == "json"
+        )
+        variant = f"drf:{history_variant(request)}"
+        with phase("cache"):
+            version = conversion_history_cache.version(user_pk)
+            if cache_response:
+                cached = conversion_history_cache.get(user_pk, version, variant)
+        if cache_response:
+            response = cached_history_response(request, cached)
+            if response is not None:
+                return response
+
+        with phase("db"):
+            last_position = ConversionDbService().last_position(user_id, user_pk)
+        etag = history_etag(request, version, last_position)
+        response = not_modified_response(request, etag)
+        if response is not None:
+            return response
+
+        if query["stream"]:
+            chunk_size = settings.CONVERSION_STREAM_CHUNK_SIZE
+            user_conversions = ConversionDbService().iterByUser(
+                user_id=user_id,
+                user_pk=user_pk,
+                after=query.get("cursor"),
+                chunk_size=chunk_size,
+            )
+            response = StreamingHttpResponse(
+                conversions_json_chunks(user_conversions, chunk_size),
+                content_type="application/json",
+            )
+            return with_etag(response, etag)
+
+        with phase("db"):
+            user_conversions = ConversionDbService().listByUser(
+                user_id=user_id,
+                user_pk=user_pk,
+                limit=None if limit is None else limit + 1,
+                after=query.get("cursor"),
+            )
+        with phase("serialize"):
+            data = conversions_data(user_conversions, limit)
+        if cache_response:
+            with phase("serialize"):
+                content = request.accepted_renderer.render(
+                    data, request.accepted_media_type, self.get_renderer_context()
+                )
+            conversion_history_cache.set(user_pk, version, variant, (content, etag))
+            response = HttpResponse(content, content_type="application/json")
+        else:
+            response = Response(data, status=status.HTTP_200_OK)
+        return with_etag(response, etag)
+
+
+class AsyncThrottledView(View):
+    """
+    Base of the async views, which DRF doesn't dispatch: checks the request against
+    throttle_classes (DRF's default throttles, like the APIViews) before dispatching it.
+    """
+
+    throttle_classes = api_settings.DEFAULT_THROTTLE_CLASSES
+
+    def dispatch(self, request, *args, **kwargs):
+        return self.athrottled_dispatch(request, *args, **kwargs)
+
+    async def athrottled_dispatch(self, request, *args, **kwargs):
+        # throttles read request.user and the cache synchronously
+        throttled = await sync_to_async(self.check_throttles)(request)
+        if throttled is not None:
+            return api_exception_response(throttled)
+        return await super().dispatch(request, *args, **kwargs)
+
+    def get_throttles(self):
+        return [throttle() for throttle in self.throttle_classes]
+
+    def check_throttles(self, request) -> Optional[exceptions.Throttled]:
+        """The Throttled exception APIView.check_throttles would raise, if any."""
+        durations = [
+            throttle.wait()
+            for throttle in self.get_throttles()
+            if not throttle.allow_request(request, self)
+        ]
+        if not durations:
+            return None
+        wait = max(
+            (duration for duration in durations if duration is not None), default=None
+        )
+        return exceptions.Throttled(wait)
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class AsyncCreateConversionView(AsyncThrottledView):
+    """
+    Async counterpart of CreateConversionView, for ASGI deployments.
+    While the rates are being fetched the event loop keeps serving other requests.
+    """
+
+    async def post(self, request):
+        if request.content_type == "application/json":
+            try:
+                data = json.loads(request.body or b"{}")
+            except ValueError:
+                return api_exception_response(exceptions.ParseError())
+        else:
+            data = request.POST
+
+        try:
+            validated_data = validated_conversion_data(
+                ConversionRequestSerializer, data
+            )
+        except exceptions.ValidationError as e:
+            return json_response(e.detail, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            key = idempotency_key(request)
+        except exceptions.ValidationError as e:
+            return json_response(e.detail, status=status.HTTP_400_BAD_REQUEST)
+
+        with phase("user"):
+            user_pk = await user_id_resolver.aresolve(validated_data["user_id"])
+        if user_pk is None:
+            logger.exception("User does not exist", **validated_data)
+            return api_exception_response(exceptions.PermissionDenied())
+
+        try:
+            if key is None:
+                created, replayed = await self.create(validated_data, user_pk), False
+            else:
+                created, replayed = await idempotency_store.arun(
+                    validated_data["user_id"],
+                    key,
+                    idempotency_fingerprint(validated_data),
+                    lambda: self.create(validated_data, user_pk),
+                )
+        except (IdempotencyKeyReusedException, IdempotencyKeyInProgressException) as e:
+            logger.info(str(e), idempotency_key=key, **validated_data)
+            return api_exception_response(idempotency_api_exception(e))
+        except exceptions.APIException as e:
+            return api_exception_response(e)
+
+        response = json_response(created["data"], status=status.HTTP_201_CREATED)
+        for header, value in created["headers"].items():
+            response[header] = value
+        if replayed:
+            response[IDEMPOTENT_REPLAYED_HEADER] = "true"
+        return response
+
+    async def create(self, validated_data: dict, user_pk: int) -> dict:
+        conversion_request = ConversionRequest(
+            from_currency=validated_data["from_currency"],
+            to_currency=validated_data["to_currency"],
+            amount=validated_data["amount"],
+        )
+        try:
+            conversion_response = await get_async_conversion_service().convert_currency(
+                conversion_request
+            )
+        except CurrencyNotFoundException as cnfe:
+            logger.exception(str(cnfe), **validated_data)
+            raise exceptions.ValidationError(detail={"detail": str(cnfe)})
+        except Exception as e:
+            logger.exception(str(e), **validated_data)
+            raise rates_service_api_exception(e)
+
+        conversion = Conversion(
+            user_id=validated_data["user_id"],
+            request=conversion_request,
+            response=conversion_response,
         )
+        with phase("db"):
+            try:
+                successful_conversion = await ConversionDbService().acreate(
+                    conversion, user_pk=user_pk
+                )
+            except IntegrityError:
+                raise user_deleted_api_exception(validated_data)
+        logger.info("Conversion created", **format_conversion(successful_conversion))
+        return created_conversion(successful_conversion)
+
+
+class AsyncGetUserConversionsView(AsyncThrottledView):
+    """
+    Async counterpart of GetUserConversionsView, for ASGI deployments.
+    """
+
+    async def get(self, request, user_id):
+        query_serializer = ConversionListQuerySerializer(data=request.GET)
+        if not query_serializer.is_valid():
+            return json_response(
+                query_serializer.errors, status=status.HTTP_400_BAD_REQUEST
+            )
+        query = query_serializer.validated_data
+        limit = page_limit(query)
+
+        with phase("user"):
+            user_pk = await user_id_resolver.aresolve(user_id)
+        if user_pk is None:
+            logger.exception("User does not exist", user_id=user_id)
+            return api_exception_response(exceptions.PermissionDenied())
+
+        cache_response = settings.CONVERSION_HISTORY_CACHE and not query["stream"]
+        variant = f"json:{history_variant(request)}"
+        with phase("cache"):
+            version = await conversion_history_cache.aversion(user_pk)
+            if cache_response:
+                cached = await conversion_history_cache.aget(user_pk, version, variant)
+        if cache_response:
+            response = cached_history_response(request, cached)
+            if response is not None:
+                return response
+
+        with phase("db"):
+            last_position = await ConversionDbService().alast_position(user_id, user_pk)
+        etag = history_etag(request, version, last_position)
+        response = not_modified_response(request, etag)
+        if response is not None:
+            return response
+
+        if query["stream"]:
+            chunk_size = settings.CONVERSION_STREAM_CHUNK_SIZE
+            user_conversions = ConversionDbService().aiterByUser(
+                user_id=user_id,
+                user_pk=user_pk,
+                after=query.get("cursor"),
+                chunk_size=chunk_size,
+            )
+            response = StreamingHttpResponse(
+                aconversions_json_chunks(user_conversions, chunk_size),
+                content_type="application/json",
+            )
+            return with_etag(response, etag)
+
+        with phase("db"):
+            user_conversions = await ConversionDbService().alistByUser(
+                user_id=user_id,
+                user_pk=user_pk,
+                limit=None if limit is None else limit + 1,
+                after=query.get("cursor"),
+            )
+        with phase("serialize"):
+            response = json_response(
+                conversions_data(user_conversions, limit), status=status.HTTP_200_OK
+            )
+        if cache_response:
+            await conversion_history_cache.aset(
+                user_pk, version, variant, (response.content, etag)
+            )
+        return with_etag(response, etag)
@@ -1,6 +1,19 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections, router
 
 
 class ConversionConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "conversion"
+
+    def ready(self):
+        if settings.CONVERSION_WRITE_BEHIND:
+            # the write buffer reserves conversion ids in SQLite's sqlite_sequence
+            alias = router.db_for_write(self.get_model("Conversion"))
+            vendor = connections[alias].vendor
+            if vendor != "sqlite":
+                raise ImproperlyConfigured(
+                    f"CONVERSION_WRITE_BEHIND is only supported on SQLite, not {vendor}"
+                )
@@ -0,0 +1,25 @@
+"""
+Compact binary encoding of rates tables, in which RateSnapshot stores them and
+conversion.renderers serves them.
+"""
+
+import struct
+
+
+def encode_rates(rates: dict) -> bytes:
+    """
+    Encodes {currency: rate} as the 3-letter currency codes, concatenated, followed by the rates
+    as little-endian doubles, which is what the rates parsed from JSON are, so they decode as they
+    were.
+    """
+    codes = "".join(rates).encode("ascii")
+    if len(codes) != 3 * len(rates):
+        raise ValueError("Currency codes must have 3 letters")
+    return codes + struct.pack(f"<{len(rates)}d", *rates.values())
+
+
+def decode_rates(data: bytes) -> dict:
+    count = len(data) // 11
+    codes = data[: 3 * count].decode("ascii")
+    values = struct.unpack(f"<{count}d", data[3 * count :])
+    return {codes[3 * i : 3 * i + 3]: value for i, value in enumerate(values)}
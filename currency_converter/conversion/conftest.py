@@ -1,7 +1,14 @@
 import os
+import sqlite3
 from unittest import mock
 import pytest
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
 from conversion.models import Conversion  # type: ignore
+from conversion.routers import REPLICA_DB_ALIAS
+from conversion.services import last_known_rates, rates_local_cache
+from users.services import user_id_resolver
+from devtools.upstream_stub import StubExchangeRatesServer
 
 
 @pytest.fixture
@@ -27,3 +34,45 @@ def setenvvar(monkeypatch):
         for k, v in envvars.items():
             monkeypatch.setenv(k, v)
         yield
+
+
+@pytest.fixture(autouse=True)
+def locmem_cache(settings):
+    """Tests must not depend on a running Redis."""
+    settings.CACHES = {
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+    }
+    cache.clear()
+    rates_local_cache.clear()
+    last_known_rates.clear()
+    user_id_resolver.clear()
+    yield
+    rates_local_cache.clear()
+    last_known_rates.clear()
+    user_id_resolver.clear()
+
+
+@pytest.fixture
+def rates_stub():
+    with StubExchangeRatesServer() as stub:
+        yield stub
+
+
+@pytest.fixture
+def replica(db, tmp_path):
+    """
+    Configures a "replica" database: a file copy of the test database as it is when the
+    fixture runs, which then misses every later write, like a lagging replica.
+    """
+    primary = connections[DEFAULT_DB_ALIAS]
+    primary.ensure_connection()
+    name = str(tmp_path / "replica.sqlite3")
+    target = sqlite3.connect(name)
+    # unlike Connection.backup(), iterdump() sees the test's uncommitted transaction
+    target.executescript("\n".join(primary.connection.iterdump()))
+    target.close()
+    connections.settings[REPLICA_DB_ALIAS] = {**primary.settings_dict, "NAME": name}
+    yield
+    connections[REPLICA_DB_ALIAS].close()
+    del connections[REPLICA_DB_ALIAS]
+    del connections.settings[REPLICA_DB_ALIAS]
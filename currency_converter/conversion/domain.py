@@ -17,6 +17,8 @@ class ConversionResponse:
     rates_timestamp: datetime
     created_at: datetime
     converted_amount: Decimal
+    # the rates were the last known ones, served while the current ones couldn't be fetched
+    stale: bool = False
 
 
 @dataclass
@@ -24,4 +26,4 @@ class Conversion:
     user_id: str
     request: ConversionRequest
     response: ConversionResponse
-    id: Optional[str] = None
+    id: Optional[int] = None
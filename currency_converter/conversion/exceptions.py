@@ -4,3 +4,19 @@ class CurrencyNotFoundException(Exception):
 
 class ConversionRateServiceException(Exception):
     pass
+
+
+class ConversionRateServiceTimeoutException(ConversionRateServiceException):
+    pass
+
+
+class ConversionRateServiceUnavailableException(ConversionRateServiceException):
+    pass
+
+
+class IdempotencyKeyReusedException(Exception):
+    pass
+
+
+class IdempotencyKeyInProgressException(Exception):
+    pass
@@ -0,0 +1,136 @@
+"""
+Fast equivalents of the conversion serializers of conversion.api, used when
+settings.CONVERSION_FAST_SERIALIZATION is on.
+
+Parsing only accepts plainly valid JSON input and returns None for anything else, so the
+caller falls back to the DRF serializer and its error messages. Rendering produces the same
+primitives as ConversionResponseSerializer, so the responses stay byte for byte the same.
+"""
+
+import datetime
+import re
+from decimal import ROUND_HALF_EVEN, Context, Decimal
+from typing import Any, Optional
+
+from django.conf import settings
+from django.http import QueryDict
+from django.utils import timezone
+
+from conversion.domain import Conversion
+
+# Matching the serializers' fields: DecimalField(max_digits=5, decimal_places=2) leaves
+# 3 digits for the integer part; DRF quantizes with the default context's rounding
+CENTS = Decimal("0.01")
+DECIMAL_CONTEXT = Context(prec=5, rounding=ROUND_HALF_EVEN)
+AMOUNT_PATTERN = re.compile(r"-?\d{1,3}(?:\.\d{1,2})?", re.ASCII)
+CURRENCY_PATTERN = re.compile(r"[A-Za-z]{3}", re.ASCII)
+USER_ID_PATTERN = re.compile(r"[\w-]{1,64}", re.ASCII)
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S %Z%z"
+
+# "%Z%z" of every (tzname, utcoffset) seen, strftime being the slow part of the format
+_timezone_suffixes: dict[tuple[Optional[str], Optional[datetime.timedelta]], str] = {}
+
+
+def parse_string(value: Any, pattern: re.Pattern) -> Optional[str]:
+    if not isinstance(value, str):
+        return None
+    value = value.strip()
+    return value if pattern.fullmatch(value) else None
+
+
+def parse_amount(value: Any) -> Optional[Decimal]:
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        return None
+    value = str(value).strip()
+    if not AMOUNT_PATTERN.fullmatch(value):
+        return None
+    return Decimal(value).quantize(CENTS)
+
+
+def parse_conversion_item(data: Any) -> Optional[dict]:
+    """
+    Returns the validated data of a ConversionItemSerializer, or None to leave it to the serializer.
+    """
+    if not isinstance(data, dict) or isinstance(data, QueryDict):
+        return None
+    from_currency = parse_string(data.get("from_currency"), CURRENCY_PATTERN)
+    to_currency = parse_string(data.get("to_currency"), CURRENCY_PATTERN)
+    amount = parse_amount(data.get("amount"))
+    if from_currency is None or to_currency is None or amount is None:
+        return None
+    return {
+        "from_currency": from_currency,
+        "to_currency": to_currency,
+        "amount": amount,
+    }
+
+
+def parse_conversion_request(data: Any) -> Optional[dict]:
+    """
+    Returns the validated data of a ConversionRequestSerializer, or None to leave it to the serializer.
+    """
+    validated_data = parse_conversion_item(data)
+    if validated_data is None:
+        return None
+    user_id = parse_string(data.get("user_id"), USER_ID_PATTERN)
+    if user_id is None:
+        return None
+    validated_data["user_id"] = user_id
+    return validated_data
+
+
+def decimal_representation(value: Any) -> str:
+    if not isinstance(value, Decimal):
+        value = Decimal(str(value).strip())
+    return format(value.quantize(CENTS, context=DECIMAL_CONTEXT), "f")
+
+
+def datetime_representation(
+    value: Optional[datetime.datetime],
+    current_timezone: Optional[datetime.tzinfo] = None,
+) -> Optional[str]:
+    if not value:
+        return None
+    if not settings.USE_TZ:
+        return value.strftime(DATETIME_FORMAT)
+    if current_timezone is None:
+        current_timezone = timezone.get_current_timezone()
+    if timezone.is_aware(value):
+        value = value.astimezone(current_timezone)
+    else:
+        value = timezone.make_aware(value, current_timezone)
+    if value.year < 1000:
+        # strftime doesn't zero-pad those years
+        return value.strftime(DATETIME_FORMAT)
+
+    key = (value.tzname(), value.utcoffset())
+    suffix = _timezone_suffixes.get(key)
+    if suffix is None:
+        suffix = _timezone_suffixes[key] = value.strftime("%Z%z")
+    return f"{value.isoformat(' ', 'seconds')[:19]} {suffix}"
+
+
+def conversion_representation(
+    conversion: Conversion, current_timezone: Optional[datetime.tzinfo] = None
+) -> dict:
+    """
+    Renders a conversion the way ConversionResponseSerializer(format_conversion(conversion)).data does.
+    Looking the current timezone up is slow, callers rendering many conversions pass it.
+    """
+    if current_timezone is None:
+        current_timezone = timezone.get_current_timezone()
+    return {
+        "from_currency": conversion.request.from_currency,
+        "to_currency": conversion.request.to_currency,
+        "amount": decimal_representation(conversion.request.amount),
+        "user_id": conversion.user_id,
+        "id": conversion.id,
+        "to_amount": decimal_representation(conversion.response.converted_amount),
+        "rate": decimal_representation(conversion.response.rate),
+        "rates_timestamp": datetime_representation(
+            conversion.response.rates_timestamp, current_timezone
+        ),
+        "created_at": datetime_representation(
+            conversion.response.created_at, current_timezone
+        ),
+    }
@@ -0,0 +1,220 @@
+"""
+Load driver of the load_test command: replays a weighted mix of requests against a running
+server from concurrent workers, and reports throughput and latency percentiles per endpoint.
+"""
+
+import math
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+import requests  # type: ignore
+
+from devtools.upstream_stub import DEFAULT_RATES
+
+ENDPOINTS = ("create", "history", "quote")
+
+
+@dataclass
+class Sample:
+    endpoint: str
+    seconds: float
+    # 0 when the request didn't get a response
+    status: int
+
+
+@dataclass
+class EndpointStats:
+    endpoint: str
+    count: int
+    errors: int
+    throughput: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+
+
+@dataclass
+class LoadReport:
+    seconds: float
+    samples: list[Sample] = field(default_factory=list)
+
+    def stats(self) -> list[EndpointStats]:
+        by_endpoint: dict[str, list[Sample]] = {}
+        for sample in self.samples:
+            by_endpoint.setdefault(sample.endpoint, []).append(sample)
+        return [
+            endpoint_stats(endpoint, samples, self.seconds)
+            for endpoint, samples in sorted(by_endpoint.items())
+        ]
+
+    def format(self) -> str:
+        lines = [
+            f"{'endpoint':<10} {'requests':>9} {'errors':>7} {'req/s':>9} "
+            f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+        ]
+        for stats in self.stats():
+            lines.append(
+                f"{stats.endpoint:<10} {stats.count:>9} {stats.errors:>7} "
+                f"{stats.throughput:>9.1f} {stats.p50_ms:>9.1f} {stats.p95_ms:>9.1f} "
+                f"{stats.p99_ms:>9.1f}"
+            )
+        return "\n".join(lines)
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    """The nearest-rank q-th percentile of sorted_values."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(q / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def endpoint_stats(
+    endpoint: str, samples: list[Sample], seconds: float
+) -> EndpointStats:
+    latencies = sorted(sample.seconds * 1000 for sample in samples)
+    return EndpointStats(
+        endpoint=endpoint,
+        count=len(samples),
+        errors=sum(not 200 <= sample.status < 400 for sample in samples),
+        throughput=len(samples) / seconds if seconds else 0.0,
+        p50_ms=percentile(latencies, 50),
+        p95_ms=percentile(latencies, 95),
+        p99_ms=percentile(latencies, 99),
+    )
+
+
+def parse_mix(value: str) -> dict[str, int]:
+    """Parses a mix like "create=8,history=2" into endpoint weights."""
+    mix = {}
+    for part in value.split(","):
+        endpoint, _, weight = part.partition("=")
+        endpoint = endpoint.strip()
+        if endpoint not in ENDPOINTS:
+            raise ValueError(
+                f"Unknown endpoint {endpoint!r}, use {', '.join(ENDPOINTS)}"
+            )
+        mix[endpoint] = int(weight or 1)
+    if not any(mix.values()):
+        raise ValueError("The mix has no requests")
+    return mix
+
+
+class LoadDriver:
+    """
+    Sends requests from concurrency workers, each picking the next endpoint at random with the
+    weights of mix, until duration seconds went by or max_requests were sent in total.
+    Every worker keeps its connection alive, like a client behind a pooled proxy would.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        user_ids: list[str],
+        mix: dict[str, int],
+        concurrency: int = 10,
+        duration: float = 30,
+        max_requests: Optional[int] = None,
+        history_limit: int = 100,
+        timeout: float = 10,
+    ) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.user_ids = user_ids
+        self.endpoints = [endpoint for endpoint, weight in mix.items() if weight]
+        self.weights = [mix[endpoint] for endpoint in self.endpoints]
+        self.concurrency = concurrency
+        self.duration = duration
+        self.max_requests = max_requests
+        self.history_limit = history_limit
+        self.timeout = timeout
+        self.currencies = list(DEFAULT_RATES)
+        self._sent = 0
+        self._lock = threading.Lock()
+
+    def run(self) -> LoadReport:
+        samples: list[Sample] = []
+        deadline = time.monotonic() + self.duration
+        start = time.perf_counter()
+        workers = [
+            threading.Thread(target=self.work, args=(deadline, samples))
+            for _ in range(self.concurrency)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return LoadReport(seconds=time.perf_counter() - start, samples=samples)
+
+    def work(self, deadline: float, samples: list[Sample]) -> None:
+        session = requests.Session()
+        requesters: dict[str, Callable[[requests.Session], requests.Response]] = {
+            "create": self.create,
+            "history": self.history,
+            "quote": self.quote,
+        }
+        try:
+            while time.monotonic() < deadline and self.take_request():
+                endpoint = random.choices(self.endpoints, self.weights)[0]
+                start = time.perf_counter()
+                try:
+                    status = requesters[endpoint](session).status_code
+                except requests.RequestException:
+                    status = 0
+                # list.append is atomic, the workers share samples
+                samples.append(Sample(endpoint, time.perf_counter() - start, status))
+        finally:
+            session.close()
+
+    def take_request(self) -> bool:
+        if self.max_requests is None:
+            return True
+        with self._lock:
+            if self._sent >= self.max_requests:
+                return False
+            self._sent += 1
+            return True
+
+    def pair(self) -> tuple[str, str]:
+        from_currency, to_currency = random.sample(self.currencies, 2)
+        return from_currency, to_currency
+
+    def amount(self, from_currency: str, to_currency: str) -> str:
+        # amounts and converted amounts are stored with 5 digits, 2 of them decimals
+        rate = DEFAULT_RATES[to_currency] / DEFAULT_RATES[from_currency]
+        return f"{random.uniform(1, min(999, 900 / rate)):.2f}"
+
+    def create(self, session: requests.Session) -> requests.Response:
+        from_currency, to_currency = self.pair()
+        return session.post(
+            f"{self.base_url}/api/conversions/",
+            json={
+                "from_currency": from_currency,
+                "to_currency": to_currency,
+                "amount": self.amount(from_currency, to_currency),
+                "user_id": random.choice(self.user_ids),
+            },
+            timeout=self.timeout,
+        )
+
+    def history(self, session: requests.Session) -> requests.Response:
+        user_id = random.choice(self.user_ids)
+        return session.get(
+            f"{self.base_url}/api/users/{user_id}/conversions/",
+            params={"limit": self.history_limit},
+            timeout=self.timeout,
+        )
+
+    def quote(self, session: requests.Session) -> requests.Response:
+        from_currency, to_currency = self.pair()
+        return session.get(
+            f"{self.base_url}/api/quote/",
+            params={
+                "from": from_currency,
+                "to": to_currency,
+                "amount": self.amount(from_currency, to_currency),
+            },
+            timeout=self.timeout,
+        )
@@ -0,0 +1,89 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from conversion.load_test import LoadDriver, parse_mix
+from users.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = (
+        "Replays a mix of POST conversions, history GETs and quotes against a running server "
+        "and reports throughput and p50/p95/p99 latency per endpoint. Run the server with "
+        "EXCHANGE_API_URL pointing at the stub_rates command and a THROTTLE_ANON_RATE high "
+        "enough, e.g. 100000/second, or most requests get a 429."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://127.0.0.1:8000")
+        parser.add_argument(
+            "--mix",
+            default="create=8,history=2",
+            help="Weights of the endpoints: create, history and quote",
+        )
+        parser.add_argument("--concurrency", type=int, default=10)
+        parser.add_argument(
+            "--duration", type=float, default=30, help="Seconds to run for"
+        )
+        parser.add_argument(
+            "--requests",
+            type=int,
+            default=None,
+            help="Stop after this many requests, if before --duration",
+        )
+        parser.add_argument(
+            "--user-id",
+            action="append",
+            dest="user_ids",
+            default=[],
+            help="user_id to convert for, repeatable. Without it --users are created",
+        )
+        parser.add_argument(
+            "--users",
+            type=int,
+            default=10,
+            help="Users to create in this project's database when no --user-id is given",
+        )
+        parser.add_argument(
+            "--history-limit",
+            type=int,
+            default=100,
+            help="Page size of the history GETs",
+        )
+        parser.add_argument("--timeout", type=float, default=10)
+
+    def handle(self, *args, **options):
+        try:
+            mix = parse_mix(options["mix"])
+        except ValueError as e:
+            raise CommandError(str(e))
+        user_ids = options["user_ids"] or self.load_test_users(options["users"])
+
+        driver = LoadDriver(
+            options["url"],
+            user_ids,
+            mix,
+            concurrency=options["concurrency"],
+            duration=options["duration"],
+            max_requests=options["requests"],
+            history_limit=options["history_limit"],
+            timeout=options["timeout"],
+        )
+        self.stdout.write(
+            f"Sending {options['mix']} to {options['url']} from "
+            f"{options['concurrency']} workers for {len(user_ids)} users..."
+        )
+        report = driver.run()
+        self.stdout.write(report.format())
+        self.stdout.write(
+            f"{len(report.samples)} requests in {report.seconds:.1f}s, "
+            f"{len(report.samples) / report.seconds:.1f} req/s"
+        )
+
+    def load_test_users(self, count: int) -> list[str]:
+        users: list[str] = []
+        for i in range(count):
+            email = f"load-test-{i}@example.com"
+            user = CustomUser.objects.filter(email=email).first()
+            if user is None:
+                user = CustomUser.objects.create_user(email=email, password=None)
+            users.append(user.external_id)
+        return users
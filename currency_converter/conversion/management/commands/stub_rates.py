@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand
+
+from devtools.upstream_stub import StubExchangeRatesServer
+
+
+class Command(BaseCommand):
+    help = (
+        "Serves a local stand-in for exchangeratesapi.io's /v1/latest endpoint, for load "
+        "tests: point EXCHANGE_API_URL at the URL it prints. Latency, HTTP failures and "
+        "`success: false` errors can be injected."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8001)
+        parser.add_argument(
+            "--latency",
+            type=float,
+            default=0.0,
+            help="Seconds to wait before answering",
+        )
+        parser.add_argument(
+            "--failure-rate",
+            type=float,
+            default=0.0,
+            help="Fraction of the requests answered with an HTTP error",
+        )
+        parser.add_argument(
+            "--failure-status",
+            type=int,
+            default=503,
+            help="Status of the HTTP errors",
+        )
+        parser.add_argument(
+            "--error-rate",
+            type=float,
+            default=0.0,
+            help="Fraction of the requests answered with a `success: false` error",
+        )
+
+    def handle(self, *args, **options):
+        stub = StubExchangeRatesServer(
+            host=options["host"],
+            port=options["port"],
+            latency=options["latency"],
+            failure_rate=options["failure_rate"],
+            failure_status=options["failure_status"],
+            error_rate=options["error_rate"],
+        )
+        self.stdout.write(f"Serving rates on {stub.url}, quit with CONTROL-C.")
+        try:
+            stub.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stub.stop()
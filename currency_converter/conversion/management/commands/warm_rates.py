@@ -0,0 +1,96 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from conversion.services import (
+    ConversionRatesCacheService,
+    ExchangeRatesAPI,
+    get_rate_snapshot_store,
+    get_rates_cache,
+    seconds_until_midnight,
+)
+
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Fetches the conversion rates into the cache before users need them. "
+        "Close to midnight they are saved under tomorrow's key as well, until --interval "
+        "seconds past midnight. "
+        "With --loop it keeps running and refreshes them every --interval seconds."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep running and refresh the rates periodically",
+        )
+        parser.add_argument(
+            "--interval",
+            type=int,
+            default=settings.RATES_WARM_INTERVAL,
+            help="Seconds between refreshes in loop mode",
+        )
+        parser.add_argument(
+            "--ahead",
+            type=int,
+            default=settings.RATES_WARM_AHEAD,
+            help="Seconds before midnight from which tomorrow's key is warmed too",
+        )
+
+    def handle(self, *args, **options):
+        service = ExchangeRatesAPI(
+            ConversionRatesCacheService(get_rates_cache()),
+            snapshot_store=get_rate_snapshot_store(),
+        )
+        if not options["loop"]:
+            self.warm(service, options["interval"], options["ahead"])
+            return
+
+        while True:
+            try:
+                self.warm(service, options["interval"], options["ahead"])
+            except CommandError:
+                pass  # already logged, the next run may succeed
+            time.sleep(
+                self.seconds_until_next_run(options["interval"], options["ahead"])
+            )
+
+    def warm(self, service: ExchangeRatesAPI, interval: int, ahead: int) -> None:
+        include_tomorrow = seconds_until_midnight() <= ahead
+        try:
+            data = service.warm_rates(
+                include_tomorrow=include_tomorrow, refresh_interval=interval
+            )
+        except Exception as e:
+            logger.exception("Rates warming failed", error=str(e))
+            raise CommandError(f"Rates warming failed: {e}")
+
+        if not data["success"]:
+            logger.error(
+                "Rates warming failed",
+                code=data["error"]["code"],
+                info=data["error"]["info"],
+            )
+            raise CommandError(
+                f"Rates warming failed: {data['error']['code']}: {data['error']['info']}"
+            )
+
+        keys = [service.todays_key] + (
+            [service.tomorrows_key] if include_tomorrow else []
+        )
+        logger.info("Rates warmed", keys=keys)
+        self.stdout.write(self.style.SUCCESS(f"Rates warmed: {', '.join(keys)}"))
+
+    def seconds_until_next_run(self, interval: int, ahead: int) -> int:
+        left = seconds_until_midnight()
+        if left > ahead:
+            # wake up in time to warm tomorrow's key
+            return max(1, min(interval, left - ahead))
+        # tomorrow's key is warm, refresh again once the day has changed
+        return max(1, min(interval, left + 1))
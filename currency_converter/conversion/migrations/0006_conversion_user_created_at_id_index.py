@@ -0,0 +1,20 @@
+# Generated by Django 5.0.14 on 2026-10-17 04:04
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("conversion", "0005_alter_conversion_created_at"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="conversion",
+            index=models.Index(
+                fields=["user", "created_at", "id"], name="conversion_user_created_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.0.14 on 2026-10-17 04:21
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("conversion", "0006_conversion_user_created_at_id_index"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="conversion",
+            name="created_at",
+            field=models.DateTimeField(
+                default=django.utils.timezone.now, verbose_name="Created At"
+            ),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.0.14 on 2026-10-17 04:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("conversion", "0007_alter_conversion_created_at_default"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RateSnapshot",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("base", models.CharField(max_length=3)),
+                ("date", models.DateField(verbose_name="Date")),
+                ("timestamp", models.BigIntegerField(verbose_name="Timestamp")),
+                ("rates", models.BinaryField(verbose_name="Rates")),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now, verbose_name="Created At"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Rate Snapshot",
+                "verbose_name_plural": "Rate Snapshots",
+                "indexes": [
+                    models.Index(
+                        fields=["date", "timestamp"], name="rate_snapshot_date_idx"
+                    )
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="ratesnapshot",
+            constraint=models.UniqueConstraint(
+                fields=("base", "timestamp"), name="rate_snapshot_base_timestamp_uniq"
+            ),
+        ),
+    ]
@@ -0,0 +1,48 @@
+"""
+Compact binary encoding of the rates table, for GET /api/rates/ and GET /api/currencies/ with
+?format=bin or Accept: application/octet-stream.
+
+Both start with the base currency, 3 ASCII letters, and the upstream timestamp, a little-endian
+int64. The rates table follows with the rates as encoded in snapshots (see
+conversion.codec.encode_rates), the currency list with the 3-letter codes, concatenated.
+"""
+
+import struct
+
+from rest_framework.renderers import BaseRenderer
+
+from conversion.codec import decode_rates, encode_rates
+
+HEADER = struct.Struct("<3sq")
+
+
+class RatesBinaryRenderer(BaseRenderer):
+    media_type = "application/octet-stream"
+    format = "bin"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        header = HEADER.pack(data["base"].encode("ascii"), data["timestamp"])
+        if "rates" in data:
+            return header + encode_rates(data["rates"])
+        return header + "".join(data["currencies"]).encode("ascii")
+
+
+def decode_rates_table(content: bytes) -> dict:
+    base, timestamp = HEADER.unpack_from(content)
+    return {
+        "base": base.decode("ascii"),
+        "timestamp": timestamp,
+        "rates": decode_rates(content[HEADER.size :]),
+    }
+
+
+def decode_currencies(content: bytes) -> dict:
+    base, timestamp = HEADER.unpack_from(content)
+    codes = content[HEADER.size :].decode("ascii")
+    return {
+        "base": base.decode("ascii"),
+        "timestamp": timestamp,
+        "currencies": [codes[i : i + 3] for i in range(0, len(codes), 3)],
+    }
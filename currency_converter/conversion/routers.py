@@ -0,0 +1,64 @@
+"""
+Routes reads of conversions to the "replica" database, when one is configured (see
+DATABASE_REPLICA_NAME in settings), and everything else to "default".
+
+A replica lags behind the primary, so a user who just converted could miss the new
+conversion in their history. Writing a conversion pins its user to the primary for
+DATABASE_REPLICA_PIN_SECONDS (pin_to_primary), and the queries of a user's conversions
+carry a user_id hint (ConversionDbService.filter_by_user) that the router checks.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_DB_ALIAS = "replica"
+PIN_KEY_PREFIX = "replica-pin"
+
+
+def has_replica() -> bool:
+    return REPLICA_DB_ALIAS in connections.settings
+
+
+def pin_key(user_id: str) -> str:
+    return f"{PIN_KEY_PREFIX}:{user_id}"
+
+
+def pin_to_primary(user_id: str) -> None:
+    if has_replica():
+        cache.set(pin_key(user_id), True, timeout=settings.DATABASE_REPLICA_PIN_SECONDS)
+
+
+async def apin_to_primary(user_id: str) -> None:
+    if has_replica():
+        await cache.aset(
+            pin_key(user_id), True, timeout=settings.DATABASE_REPLICA_PIN_SECONDS
+        )
+
+
+def is_pinned_to_primary(user_id: str) -> bool:
+    return cache.get(pin_key(user_id), False)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.label != "conversion.Conversion" or not has_replica():
+            return None
+        instance = hints.get("instance")
+        if instance is not None:
+            # e.g. user.conversion_set, read where the user was
+            return instance._state.db
+        user_id = hints.get("user_id")
+        if user_id is not None and is_pinned_to_primary(user_id):
+            return DEFAULT_DB_ALIAS
+        return REPLICA_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replica is a copy of the primary, objects from both may be related
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None
@@ -1,57 +1,207 @@
+import asyncio
+import atexit
 import dataclasses
 import datetime
+import hashlib
+import random
+import threading
+import time
+import weakref
+from collections import OrderedDict
 from decimal import Decimal
-from typing import Any, Protocol
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Iterator,
+    Optional,
+    Protocol,
+    Sequence,
+    Union,
+)
 
 import pytz  # type: ignore
 import requests  # type: ignore
+from requests.adapters import HTTPAdapter  # type: ignore
+from urllib3.util.retry import Retry
 
 from conversion.models import Conversion as ConversionModel  # type: ignore
+from conversion.models import RateSnapshot  # type: ignore
+from conversion.routers import apin_to_primary, pin_to_primary
 from conversion.domain import Conversion, ConversionRequest, ConversionResponse
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
+from django.utils import timezone
+from django.db import (
+    IntegrityError,
+    close_old_connections,
+    connection,
+    transaction,
+)
+from django.db.models import Q
 
 from conversion.exceptions import (
     ConversionRateServiceException,
+    ConversionRateServiceTimeoutException,
+    ConversionRateServiceUnavailableException,
     CurrencyNotFoundException,
+    IdempotencyKeyInProgressException,
+    IdempotencyKeyReusedException,
 )
+from conversion.timing import phase
 
+from asgiref.sync import sync_to_async
 import structlog
 
 logger = structlog.get_logger(__name__)
 
+_rates_refresh_lock = threading.Lock()
+_async_rates_refreshes: weakref.WeakKeyDictionary[
+    asyncio.AbstractEventLoop, dict[str, asyncio.Future[dict]]
+] = weakref.WeakKeyDictionary()
+
 
 class ConversionRatesProtocol(Protocol):
     def __init__(self, cache: "ConversionRatesCacheService") -> None: ...
     def get_conversion_from(self, request: ConversionRequest) -> ConversionResponse: ...
+    def get_conversions_from(
+        self, requests: list[ConversionRequest]
+    ) -> list[Union[ConversionResponse, CurrencyNotFoundException]]: ...
+
+
+class AsyncConversionRatesProtocol(Protocol):
+    def __init__(self, cache: "ConversionRatesCacheService") -> None: ...
+    async def get_conversion_from(
+        self, request: ConversionRequest
+    ) -> ConversionResponse: ...
+
+
+class RatesHttpClient:
+    """
+    RatesHttpClient is a connection-pooled HTTP client for the rates providers.
+    Connections are kept alive between refreshes, every request is bounded by a connect and a read timeout,
+    and connection errors and 5xx responses are retried a bounded number of times with exponential backoff.
+    Read timeouts are not retried, so a slow upstream holds a worker for at most read_timeout seconds.
+    """
+
+    def __init__(
+        self,
+        connect_timeout: float = 3.05,
+        read_timeout: float = 10,
+        retries: int = 2,
+        backoff_factor: float = 0.5,
+        pool_size: int = 10,
+        gzip: bool = True,
+    ) -> None:
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=False,
+            status=retries,
+            other=0,
+            backoff_factor=backoff_factor,
+            status_forcelist=(500, 502, 503, 504),
+            allowed_methods=frozenset({"GET"}),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_size, max_retries=retry
+        )
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if not gzip:
+            self.session.headers["Accept-Encoding"] = "identity"
+
+    @property
+    def total_timeout(self) -> float:
+        """The longest a get_json call can take: every attempt timing out, and the backoffs between them."""
+        connect_timeout, read_timeout = self.timeout
+        backoffs = sum(self.backoff_factor * 2**n for n in range(self.retries))
+        return (self.retries + 1) * (connect_timeout + read_timeout) + backoffs
+
+    def get_json(self, url: str) -> dict:
+        try:
+            response = self.session.get(url, timeout=self.timeout)
+        except requests.exceptions.Timeout as e:
+            raise ConversionRateServiceTimeoutException(
+                "Rates service timed out"
+            ) from e
+        except requests.exceptions.RequestException as e:
+            raise ConversionRateServiceUnavailableException(
+                "Rates service unavailable"
+            ) from e
+
+        if response.status_code >= 500:
+            raise ConversionRateServiceUnavailableException(
+                f"Rates service unavailable: {response.status_code}"
+            )
+        try:
+            return response.json()
+        except ValueError as e:
+            raise ConversionRateServiceUnavailableException(
+                "Rates service returned an invalid response"
+            ) from e
 
 
 class ExchangeRatesAPI:
-    def __init__(self, cache_service: "ConversionRatesCacheService") -> None:
+    """
+    Rates are read from the cache, then from the stored snapshots (snapshot_store, when given),
+    then from the provider, whose successful responses are stored as snapshots.
+    When the provider fails to give the day's rates, or its error is cached, the last known rates
+    are served instead if they are recent enough (see stale_while_revalidate).
+    """
+
+    def __init__(
+        self,
+        cache_service: "ConversionRatesCacheService",
+        http_client: Optional[RatesHttpClient] = None,
+        snapshot_store: Optional["RateSnapshotDbService"] = None,
+    ) -> None:
         self.cache_service = cache_service
+        self.http_client = http_client or rates_http_client
+        self.snapshot_store = snapshot_store
 
     # By default it uses EUR as base
-    url = f"http://api.exchangeratesapi.io/v1/latest?access_key={settings.EXCHANGE_API_KEY}"
+    url = f"{settings.EXCHANGE_API_URL}?access_key={settings.EXCHANGE_API_KEY}"
 
     def get_conversion_from(self, request: ConversionRequest) -> ConversionResponse:
+        response = self.get_successful_rates()
+        self.check_currencies(request, response)
+        logger.info("Conversion success", **dataclasses.asdict(request))
+        return self.convert_amount(request, response)
+
+    def get_conversions_from(
+        self, requests: list[ConversionRequest]
+    ) -> list[Union[ConversionResponse, CurrencyNotFoundException]]:
+        """
+        Converts every request against the same rates, loaded once.
+        A currency not found only fails its own request: the exception is returned in its place.
+        """
+        response = self.get_successful_rates()
+        conversions: list[Union[ConversionResponse, CurrencyNotFoundException]] = []
+        for request in requests:
+            try:
+                self.check_currencies(request, response)
+            except CurrencyNotFoundException as cnfe:
+                conversions.append(cnfe)
+                continue
+            conversions.append(self.convert_amount(request, response))
+        logger.info("Conversions success", count=len(requests))
+        return conversions
+
+    def get_successful_rates(self) -> dict:
         response = self.get_latest_rates()
-        if response["success"]:
-            if (
-                request.from_currency not in response["rates"]
-                or request.to_currency not in response["rates"]
-            ):
-                logger.exception(
-                    "Currency not found",
-                    from_currency=request.from_currency,
-                    to_currency=request.to_currency,
-                )
-                raise CurrencyNotFoundException(
-                    f"{request.from_currency} or {request.to_currency} not found"
-                )
-            logger.info("Conversion success", **dataclasses.asdict(request))
-            return self.convert_amount(request, response)
-        else:
+        self.check_rates(response)
+        return response
+
+    def check_rates(self, response: dict) -> None:
+        if not response["success"]:
             logger.exception(
                 "Api internal error",
                 code=response["error"]["code"],
@@ -61,58 +211,443 @@ class ExchangeRatesAPI:
                 f"{response['error']['code']}: {response['error']['info']}"
             )
 
+    def check_currencies(self, request: ConversionRequest, rates: dict) -> None:
+        if (
+            request.from_currency not in rates["rates"]
+            or request.to_currency not in rates["rates"]
+        ):
+            logger.exception(
+                "Currency not found",
+                from_currency=request.from_currency,
+                to_currency=request.to_currency,
+            )
+            raise CurrencyNotFoundException(
+                f"{request.from_currency} or {request.to_currency} not found"
+            )
+
     def parse_timestamp_to_datetime(self, timestamp: int) -> datetime.datetime:
         return datetime.datetime.fromtimestamp(timestamp, pytz.UTC)
 
     def get_latest_rates(self) -> dict:
-        data_in_cache = self.cache_service.get_rates(self.todays_key)
-        if data_in_cache:
+        key = self.todays_key
+        with phase("cache"):
+            data_in_cache = self.cache_service.get_rates(key)
+        if data_in_cache and data_in_cache["success"]:
             logger.info("Rates from cache")
+            last_known_rates.set(data_in_cache)
             return data_in_cache
-        else:
-            logger.info("Rates from API")
-            response = requests.get(self.url)
-            data = response.json()
-            self.cache_service.save_rates(self.todays_key, data)
+
+        stored_data = self.stored_rates(key)
+        if stored_data:
+            return stored_data
+        if data_in_cache:
+            logger.info("Rates from cache")
+            return self.stale_on_error(key, data_in_cache)
+
+        # Concurrent misses in this process wait for a single in-flight refresh
+        with _rates_refresh_lock:
+            data_in_cache = self.cache_service.get_rates(key)
+            if data_in_cache:
+                logger.info("Rates from cache")
+                return self.stale_on_error(key, data_in_cache)
+            try:
+                data = self.refresh_rates(key)
+            except ConversionRateServiceException:
+                stale_data = self.stale_while_revalidate(key)
+                if stale_data is None:
+                    raise
+                return stale_data
+        if data["success"] and not data.get("stale"):
+            last_known_rates.set(data)
+        return self.stale_on_error(key, data)
+
+    def stored_rates(self, key: str) -> Optional[dict]:
+        """
+        The day's snapshot, stored by a previous fetch, which spares the upstream call when the
+        day's rates aren't cached.
+        """
+        stored_data = self.load_snapshot(key)
+        if stored_data:
+            logger.info("Rates from snapshot")
+            self.cache_service.save_rates(key, stored_data)
+            last_known_rates.set(stored_data)
+        return stored_data
+
+    def stale_on_error(self, key: str, data: dict) -> dict:
+        """Returns data, or the last known rates in place of the provider's error (see stale_while_revalidate)."""
+        if data["success"]:
+            return data
+        return self.stale_while_revalidate(key) or data
+
+    def stale_while_revalidate(self, key: str) -> Optional[dict]:
+        """
+        Returns the last known rates, marked stale (see stale_rates), and fetches the day's rates
+        in the background. Only for when the provider failed to give them.
+        """
+        stale_data = self.stale_rates()
+        if stale_data is None:
+            return None
+        self.revalidate_in_background(key)
+        return stale_data
+
+    def stale_rates(self) -> Optional[dict]:
+        """
+        Returns the last known rates, marked stale, when they are at most RATES_STALE_WINDOW
+        seconds older than now.
+        """
+        if not settings.RATES_STALE_WINDOW:
+            return None
+        stale_data = self.last_known_rates()
+        if stale_data is None:
+            return None
+        if time.time() - stale_data["timestamp"] > settings.RATES_STALE_WINDOW:
+            return None
+        logger.info("Stale rates", rates_timestamp=stale_data["timestamp"])
+        return {**stale_data, "stale": True}
+
+    def last_known_rates(self) -> Optional[dict]:
+        data = last_known_rates.get()
+        if data is None:
+            data = self.cache_service.get_rates(self.previous_key)
+        if data is None and self.snapshot_store is not None:
+            data = self.snapshot_store.latest()
+        if data is not None and data["success"]:
+            last_known_rates.set(data)
             return data
+        return None
+
+    def revalidate_in_background(self, key: str) -> None:
+        # the refresh lock makes it one revalidation at a time, across processes
+        if self.cache_service.acquire_refresh_lock(key):
+            threading.Thread(
+                target=self._revalidate_in_thread, args=(key,), daemon=True
+            ).start()
+
+    def revalidate(self, key: str) -> None:
+        """
+        Fetches and saves the rates under key, holding the refresh lock. On failure the lock is left
+        to expire, so the provider is tried again at most every RATES_REFRESH_LOCK_TIMEOUT seconds.
+        """
+        try:
+            data = self.load_snapshot(key) or self.fetch_rates()
+            if not data["success"]:
+                logger.warning("Rates revalidation failed", code=data["error"]["code"])
+                return
+            self.store_snapshot(data)
+            self.cache_service.save_rates(key, data)
+            last_known_rates.set(data)
+            self.cache_service.release_refresh_lock(key)
+        except Exception as e:
+            logger.warning("Rates revalidation failed", error=str(e))
+
+    def _revalidate_in_thread(self, key: str) -> None:
+        try:
+            self.revalidate(key)
+        finally:
+            connection.close()
+
+    def refresh_rates(self, key: str) -> dict:
+        """
+        Fetches the rates and saves them under key, making sure that only one process at a time goes upstream.
+        The others serve the previous day's rates, or else the last known ones, marked stale, or wait for the
+        refresh to finish (see refresh_wait). If it doesn't, they serve the last known rates, marked stale,
+        rather than going upstream as well.
+        """
+        if not self.cache_service.acquire_refresh_lock(key):
+            stale_data = self.previous_rates() or self.stale_rates()
+            if stale_data:
+                return stale_data
+
+            deadline = time.monotonic() + self.refresh_wait
+            while time.monotonic() < deadline:
+                time.sleep(settings.RATES_REFRESH_POLL_INTERVAL)
+                data_in_cache = self.cache_service.get_rates(key)
+                if data_in_cache:
+                    logger.info("Rates from cache after waiting refresh")
+                    return data_in_cache
+            logger.info("Rates refresh lock timed out")
+            if not self.cache_service.acquire_refresh_lock(key):
+                return self.rates_after_refresh_timeout()
+
+        try:
+            return self.fetch_and_save_rates(key)
+        finally:
+            self.cache_service.release_refresh_lock(key)
+
+    @property
+    def refresh_wait(self) -> float:
+        # by then the refresh lock expired, or the lock holder's request timed out
+        return min(settings.RATES_REFRESH_LOCK_TIMEOUT, self.http_client.total_timeout)
+
+    def previous_rates(self) -> Optional[dict]:
+        previous_data = self.cache_service.get_rates(self.previous_key)
+        if previous_data and previous_data["success"]:
+            logger.info("Rates from previous day while refreshing")
+            return {**previous_data, "stale": True}
+        return None
+
+    def rates_after_refresh_timeout(self) -> dict:
+        stale_data = self.stale_rates()
+        if stale_data is None:
+            raise ConversionRateServiceTimeoutException(
+                "Rates refresh still in progress"
+            )
+        return stale_data
+
+    def fetch_and_save_rates(self, key: str) -> dict:
+        data = self.fetch_rates()
+        self.store_snapshot(data)
+        self.cache_service.save_rates(key, data)
+        return data
+
+    def fetch_rates(self) -> dict:
+        logger.info("Rates from API")
+        with phase("upstream"):
+            return self.http_client.get_json(self.url)
+
+    def store_snapshot(self, data: dict) -> None:
+        if self.snapshot_store is not None and data["success"]:
+            self.snapshot_store.save(data)
+
+    def load_snapshot(self, key: str) -> Optional[dict]:
+        if self.snapshot_store is None:
+            return None
+        return self.snapshot_store.latest_for(datetime.date.fromisoformat(key))
+
+    def warm_rates(
+        self, include_tomorrow: bool = False, refresh_interval: Optional[int] = None
+    ) -> dict:
+        """
+        Fetches the rates and saves them under today's key and, close to the day boundary,
+        under tomorrow's key too, so the first requests of the day don't have to go upstream.
+        Those are still today's rates: tomorrow's key only keeps them for refresh_interval
+        seconds (RATES_WARM_INTERVAL by default) past midnight, by when the next warming
+        has replaced them, or requests fetch the new day's.
+        Error responses are not cached.
+        """
+        if refresh_interval is None:
+            refresh_interval = settings.RATES_WARM_INTERVAL
+        data = self.fetch_rates()
+        if data["success"]:
+            self.store_snapshot(data)
+            self.cache_service.save_rates(self.todays_key, data)
+            if include_tomorrow:
+                self.cache_service.save_rates(
+                    self.tomorrows_key, data, past_midnight=refresh_interval
+                )
+        return data
+
+    def key_for(self, day: datetime.date) -> str:
+        return f"{day:%Y-%m-%d}"
 
     @property
     def todays_key(self) -> str:
         today = datetime.datetime.now(tz=pytz.UTC)
-        return f"{today:%Y-%m-%d}"
+        return self.key_for(today)
+
+    @property
+    def tomorrows_key(self) -> str:
+        tomorrow = datetime.datetime.now(tz=pytz.UTC) + datetime.timedelta(days=1)
+        return self.key_for(tomorrow)
+
+    @property
+    def previous_key(self) -> str:
+        yesterday = datetime.datetime.now(tz=pytz.UTC) - datetime.timedelta(days=1)
+        return self.key_for(yesterday)
 
     def convert_amount(
         self, request: ConversionRequest, rates: dict
     ) -> ConversionResponse:
-        rates_timestamp = self.parse_timestamp_to_datetime(rates["timestamp"])
-        now = datetime.datetime.now(tz=pytz.UTC)
-        if request.from_currency == rates["base"]:
-            rate = rates["rates"][request.to_currency]
-            return ConversionResponse(
-                rate=rate,
-                rates_timestamp=rates_timestamp,
-                converted_amount=Decimal(request.amount)
-                * Decimal(rates["rates"][request.to_currency]),
-                created_at=now,
-            )
-        elif request.to_currency == rates["base"]:
-            rate = Decimal(1) / Decimal(rates["rates"][request.from_currency])
+        with phase("convert"):
+            matrix = RatesMatrix.for_rates(rates)
+            rate = matrix.rate(request.from_currency, request.to_currency)
             return ConversionResponse(
                 rate=rate,
-                rates_timestamp=rates_timestamp,
+                rates_timestamp=matrix.rates_timestamp,
                 converted_amount=Decimal(request.amount) * rate,
-                created_at=now,
+                created_at=datetime.datetime.now(tz=pytz.UTC),
+                stale=rates.get("stale", False),
             )
-        else:
-            from_currency_rate = Decimal(rates["rates"][request.from_currency])
-            to_currency_rate = Decimal(rates["rates"][request.to_currency])
-            final_rate = to_currency_rate / from_currency_rate
-            return ConversionResponse(
-                rate=final_rate,
-                rates_timestamp=rates_timestamp,
-                converted_amount=Decimal(request.amount) * final_rate,
-                created_at=now,
+
+
+class RatesMatrix:
+    """
+    RatesMatrix holds the rate of every currency pair of a rates snapshot, in a flat row-major tuple
+    indexed through a currency-to-index map, so a conversion is an index lookup plus one multiply.
+    Rates are Decimals computed the same way as the base, to-base and cross conversions always did.
+    The snapshot's timestamp is parsed once as well.
+    Matrices are built once per snapshot (base, date and timestamp) and kept for the last max_snapshots ones.
+    """
+
+    max_snapshots = 2
+    _snapshots: OrderedDict[tuple, "RatesMatrix"] = OrderedDict()
+    _snapshots_lock = threading.Lock()
+
+    def __init__(self, rates: dict) -> None:
+        base = rates["base"]
+        currencies = list(rates["rates"])
+        values = [Decimal(rates["rates"][currency]) for currency in currencies]
+        one = Decimal(1)
+        matrix: list[Decimal] = []
+        for from_currency, from_rate in zip(currencies, values):
+            if from_currency == base:
+                matrix.extend(values)
+                continue
+            for to_currency, to_rate in zip(currencies, values):
+                if to_currency == base:
+                    matrix.append(one / from_rate)
+                else:
+                    matrix.append(to_rate / from_rate)
+
+        self.index = {currency: i for i, currency in enumerate(currencies)}
+        self.size = len(currencies)
+        self.matrix = tuple(matrix)
+        self.rates_timestamp = datetime.datetime.fromtimestamp(
+            rates["timestamp"], pytz.UTC
+        )
+
+    def rate(self, from_currency: str, to_currency: str) -> Decimal:
+        return self.matrix[
+            self.index[from_currency] * self.size + self.index[to_currency]
+        ]
+
+    @classmethod
+    def for_rates(cls, rates: dict) -> "RatesMatrix":
+        key = (rates["base"], rates.get("date"), rates["timestamp"])
+        matrix = cls._snapshots.get(key)
+        if matrix is None:
+            matrix = cls(rates)
+            with cls._snapshots_lock:
+                cls._snapshots[key] = matrix
+                while len(cls._snapshots) > cls.max_snapshots:
+                    cls._snapshots.popitem(last=False)
+        return matrix
+
+
+class LastKnownRates:
+    """
+    The most recent successful rates this process has seen, served while the current ones can't be
+    fetched (see ExchangeRatesAPI.stale_while_revalidate).
+    """
+
+    def __init__(self) -> None:
+        self._data: Optional[dict] = None
+
+    def get(self) -> Optional[dict]:
+        return self._data
+
+    def set(self, data: dict) -> None:
+        current = self._data
+        if current is None or data["timestamp"] >= current["timestamp"]:
+            self._data = data
+
+    def clear(self) -> None:
+        self._data = None
+
+
+last_known_rates = LastKnownRates()
+
+
+class AsyncExchangeRatesAPI:
+    """
+    AsyncExchangeRatesAPI is the asyncio counterpart of ExchangeRatesAPI, used by the ASGI views.
+    The cache is accessed through its async API and the upstream request runs on the pooled client
+    in a worker thread, so a pending refresh doesn't hold up the event loop. Concurrent misses on
+    the same event loop await a single refresh; across processes the same cache lock as
+    ExchangeRatesAPI is used.
+    """
+
+    def __init__(
+        self,
+        cache_service: "ConversionRatesCacheService",
+        http_client: Optional[RatesHttpClient] = None,
+        snapshot_store: Optional["RateSnapshotDbService"] = None,
+    ) -> None:
+        self.cache_service = cache_service
+        self.rates_api = ExchangeRatesAPI(cache_service, http_client, snapshot_store)
+
+    async def get_conversion_from(
+        self, request: ConversionRequest
+    ) -> ConversionResponse:
+        response = await self.get_latest_rates()
+        self.rates_api.check_rates(response)
+        self.rates_api.check_currencies(request, response)
+        logger.info("Conversion success", **dataclasses.asdict(request))
+        return self.rates_api.convert_amount(request, response)
+
+    async def get_latest_rates(self) -> dict:
+        key = self.rates_api.todays_key
+        with phase("cache"):
+            data_in_cache = await self.cache_service.aget_rates(key)
+        if data_in_cache and data_in_cache["success"]:
+            logger.info("Rates from cache")
+            last_known_rates.set(data_in_cache)
+            return data_in_cache
+
+        if self.rates_api.snapshot_store is not None:
+            stored_data = await sync_to_async(self.rates_api.stored_rates)(key)
+            if stored_data:
+                return stored_data
+        if data_in_cache:
+            logger.info("Rates from cache")
+            return await self.stale_on_error(key, data_in_cache)
+
+        refreshes = _async_rates_refreshes.setdefault(asyncio.get_running_loop(), {})
+        refresh = refreshes.get(key)
+        if refresh is None:
+            refresh = asyncio.ensure_future(self.refresh_rates(key))
+            refreshes[key] = refresh
+            refresh.add_done_callback(lambda _: refreshes.pop(key, None))
+        try:
+            data: dict = await asyncio.shield(refresh)
+        except ConversionRateServiceException:
+            stale_data = await sync_to_async(self.rates_api.stale_while_revalidate)(key)
+            if stale_data is None:
+                raise
+            return stale_data
+        if data["success"] and not data.get("stale"):
+            last_known_rates.set(data)
+        return await self.stale_on_error(key, data)
+
+    async def stale_on_error(self, key: str, data: dict) -> dict:
+        if data["success"]:
+            return data
+        return await sync_to_async(self.rates_api.stale_on_error)(key, data)
+
+    async def refresh_rates(self, key: str) -> dict:
+        if not await self.cache_service.aacquire_refresh_lock(key):
+            previous_data = await self.cache_service.aget_rates(
+                self.rates_api.previous_key
             )
+            if previous_data and previous_data["success"]:
+                logger.info("Rates from previous day while refreshing")
+                return {**previous_data, "stale": True}
+            stale_data = await sync_to_async(self.rates_api.stale_rates)()
+            if stale_data:
+                return stale_data
+
+            deadline = time.monotonic() + self.rates_api.refresh_wait
+            while time.monotonic() < deadline:
+                await asyncio.sleep(settings.RATES_REFRESH_POLL_INTERVAL)
+                data_in_cache = await self.cache_service.aget_rates(key)
+                if data_in_cache:
+                    logger.info("Rates from cache after waiting refresh")
+                    return data_in_cache
+            logger.info("Rates refresh lock timed out")
+            if not await self.cache_service.aacquire_refresh_lock(key):
+                return await sync_to_async(self.rates_api.rates_after_refresh_timeout)()
+
+        try:
+            return await self.fetch_and_save_rates(key)
+        finally:
+            await self.cache_service.arelease_refresh_lock(key)
+
+    async def fetch_and_save_rates(self, key: str) -> dict:
+        data = await sync_to_async(self.rates_api.fetch_rates, thread_sensitive=False)()
+        if self.rates_api.snapshot_store is not None:
+            await sync_to_async(self.rates_api.store_snapshot)(data)
+        await self.cache_service.asave_rates(key, data)
+        return data
 
 
 class ConversionService:
@@ -122,11 +657,77 @@ class ConversionService:
     def convert_currency(self, request: ConversionRequest) -> ConversionResponse:
         return self.conversion_rate_service.get_conversion_from(request)
 
+    def convert_currencies(
+        self, requests: list[ConversionRequest]
+    ) -> list[Union[ConversionResponse, CurrencyNotFoundException]]:
+        return self.conversion_rate_service.get_conversions_from(requests)
+
+
+class AsyncConversionService:
+    def __init__(self, conversion_rate_service: AsyncConversionRatesProtocol) -> None:
+        self.conversion_rate_service = conversion_rate_service
+
+    async def convert_currency(self, request: ConversionRequest) -> ConversionResponse:
+        return await self.conversion_rate_service.get_conversion_from(request)
+
+
+class RateSnapshotDbService:
+    """
+    Stores the rates fetched from the provider, so they outlive the cache: after the cache is
+    flushed, the day's rates are read back from the database instead of upstream.
+    """
+
+    def save(self, data: dict) -> None:
+        try:
+            snapshot = RateSnapshot.from_rates(data)
+        except (KeyError, ValueError) as e:
+            logger.warning("Rates not stored", error=str(e))
+            return
+        # a table already stored (same base and timestamp) is left as is
+        RateSnapshot.objects.bulk_create([snapshot], ignore_conflicts=True)
+
+    def latest(self) -> Optional[dict]:
+        """The latest rates stored."""
+        snapshot = (
+            RateSnapshot.objects.only("base", "date", "timestamp", "rates")
+            .order_by("-date", "-timestamp")
+            .first()
+        )
+        return None if snapshot is None else snapshot.to_rates()
+
+    def latest_for(self, day: datetime.date) -> Optional[dict]:
+        """The latest rates stored for day, the date the provider gave them."""
+        snapshot = (
+            RateSnapshot.objects.filter(date=day)
+            .only("base", "date", "timestamp", "rates")
+            .order_by("-timestamp")
+            .first()
+        )
+        return None if snapshot is None else snapshot.to_rates()
+
 
 class ConversionDbService:
-    def create(self, conversion: Conversion) -> Conversion:
+    """
+    The user_pk arguments take the primary key of a user already resolved from its external_id
+    (see users.services.UserIdResolver), which spares a users query.
+    Writes pin their user to the primary database, and the reads of a user's conversions go to
+    the replica otherwise, when there is one (see conversion.routers).
+    """
+
+    def create(
+        self, conversion: Conversion, user_pk: Optional[int] = None
+    ) -> Conversion:
+        if user_pk is None:
+            user_pk = (
+                get_user_model()
+                .objects.values_list("pk", flat=True)
+                .get(external_id=conversion.user_id)
+            )
+        pin_to_primary(conversion.user_id)
+        if settings.CONVERSION_WRITE_BEHIND:
+            return conversion_write_buffer.add(conversion, user_pk)
         conversion_obj = ConversionModel.objects.create(
-            user=get_user_model().objects.get(external_id=conversion.user_id),
+            user_id=user_pk,
             from_currency=conversion.request.from_currency,
             from_amount=conversion.request.amount,
             to_currency=conversion.request.to_currency,
@@ -134,38 +735,596 @@ class ConversionDbService:
             rate=conversion.response.rate,
             rates_timestamp=conversion.response.rates_timestamp,
         )
+        conversion_history_cache.bump(user_pk)
         new_conversion: Conversion = dataclasses.replace(conversion)
         new_conversion.id = conversion_obj.id
         new_conversion.response.created_at = conversion_obj.created_at
         return new_conversion
 
-    def listByUser(self, user_id: str) -> list[Conversion]:
-        user_conversions: list[Conversion] = []
-        conversions_list = ConversionModel.objects.filter(user__external_id=user_id)
-        for conversion in conversions_list:
-            user_conversions.append(
-                Conversion(
-                    id=conversion.id,
-                    user_id=conversion.user.external_id,
-                    request=ConversionRequest(
-                        from_currency=conversion.from_currency,
-                        amount=conversion.from_amount,
-                        to_currency=conversion.to_currency,
-                    ),
-                    response=ConversionResponse(
-                        converted_amount=conversion.to_amount,
-                        rate=conversion.rate,
-                        rates_timestamp=conversion.rates_timestamp,
-                        created_at=conversion.created_at,
-                    ),
+    async def acreate(
+        self, conversion: Conversion, user_pk: Optional[int] = None
+    ) -> Conversion:
+        if settings.CONVERSION_WRITE_BEHIND:
+            # queueing may flush, synchronously
+            return await sync_to_async(self.create)(conversion, user_pk)
+        if user_pk is None:
+            user_pk = (
+                await get_user_model()
+                .objects.values_list("pk", flat=True)
+                .aget(external_id=conversion.user_id)
+            )
+        await apin_to_primary(conversion.user_id)
+        conversion_obj = await ConversionModel.objects.acreate(
+            user_id=user_pk,
+            from_currency=conversion.request.from_currency,
+            from_amount=conversion.request.amount,
+            to_currency=conversion.request.to_currency,
+            to_amount=conversion.response.converted_amount,
+            rate=conversion.response.rate,
+            rates_timestamp=conversion.response.rates_timestamp,
+        )
+        await conversion_history_cache.abump(user_pk)
+        new_conversion: Conversion = dataclasses.replace(conversion)
+        new_conversion.id = conversion_obj.id
+        new_conversion.response.created_at = conversion_obj.created_at
+        return new_conversion
+
+    def reserve_ids(self, count: int) -> Sequence[int]:
+        """
+        Reserves count ids of the conversions table's sequence, which inserts that don't
+        set the id then skip. SQLite only, which conversion.apps checks when
+        CONVERSION_WRITE_BEHIND is on.
+        """
+        table = ConversionModel._meta.db_table
+        with transaction.atomic(), connection.cursor() as cursor:
+            # the id is an AUTOINCREMENT column, whose last value is in sqlite_sequence
+            cursor.execute(
+                "UPDATE sqlite_sequence SET seq = seq + %s WHERE name = %s",
+                [count, table],
+            )
+            if cursor.rowcount == 0:
+                cursor.execute(
+                    "INSERT INTO sqlite_sequence (name, seq) "
+                    f"SELECT %s, coalesce(max(id), 0) + %s FROM {connection.ops.quote_name(table)}",
+                    [table, count],
+                )
+            cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = %s", [table])
+            last_id = cursor.fetchone()[0]
+        return range(last_id - count + 1, last_id + 1)
+
+    def bulk_create(
+        self, conversions: list[Conversion], user_pk: int
+    ) -> list[Conversion]:
+        """
+        Persists all the conversions of one user with a single INSERT, in one transaction.
+        """
+        conversion_objs = [
+            ConversionModel(
+                user_id=user_pk,
+                from_currency=conversion.request.from_currency,
+                from_amount=conversion.request.amount,
+                to_currency=conversion.request.to_currency,
+                to_amount=conversion.response.converted_amount,
+                rate=conversion.response.rate,
+                rates_timestamp=conversion.response.rates_timestamp,
+            )
+            for conversion in conversions
+        ]
+        if conversions:
+            pin_to_primary(conversions[0].user_id)
+        with transaction.atomic():
+            ConversionModel.objects.bulk_create(conversion_objs)
+        conversion_history_cache.bump(user_pk)
+
+        new_conversions: list[Conversion] = []
+        for conversion, conversion_obj in zip(conversions, conversion_objs):
+            new_conversion: Conversion = dataclasses.replace(conversion)
+            new_conversion.id = conversion_obj.id
+            new_conversion.response.created_at = conversion_obj.created_at
+            new_conversions.append(new_conversion)
+        return new_conversions
+
+    # Columns read to build a Conversion, in the order to_conversion unpacks them
+    conversion_columns = (
+        "id",
+        "from_currency",
+        "from_amount",
+        "to_currency",
+        "to_amount",
+        "rate",
+        "rates_timestamp",
+        "created_at",
+    )
+
+    def listByUser(
+        self,
+        user_id: str,
+        user_pk: Optional[int] = None,
+        limit: Optional[int] = None,
+        after: Optional[tuple[datetime.datetime, int]] = None,
+    ) -> list[Conversion]:
+        """
+        Lists the conversions of a user, ordered by (created_at, id), with a single query on the
+        projected columns. Every row belongs to the user whose external_id is user_id, so it is
+        not read back per row.
+        A page is read with limit and after, the (created_at, id) of the last conversion of the
+        previous page: it seeks on the (user, created_at, id) index, so deep pages cost the same
+        as the first one.
+        """
+        rows = self.rows_by_user(user_id, user_pk, limit, after)
+        return [self.to_conversion(user_id, row) for row in rows]
+
+    async def alistByUser(
+        self,
+        user_id: str,
+        user_pk: Optional[int] = None,
+        limit: Optional[int] = None,
+        after: Optional[tuple[datetime.datetime, int]] = None,
+    ) -> list[Conversion]:
+        rows = self.rows_by_user(user_id, user_pk, limit, after)
+        return [self.to_conversion(user_id, row) async for row in rows]
+
+    def iterByUser(
+        self,
+        user_id: str,
+        user_pk: Optional[int] = None,
+        after: Optional[tuple[datetime.datetime, int]] = None,
+        chunk_size: int = 2000,
+    ) -> Iterator[Conversion]:
+        """
+        Yields the conversions of a user in listByUser's order, reading chunk_size rows at a time,
+        so memory doesn't grow with the size of the history.
+        """
+        rows = self.rows_by_user(user_id, user_pk, after=after)
+        for row in rows.iterator(chunk_size=chunk_size):
+            yield self.to_conversion(user_id, row)
+
+    async def aiterByUser(
+        self,
+        user_id: str,
+        user_pk: Optional[int] = None,
+        after: Optional[tuple[datetime.datetime, int]] = None,
+        chunk_size: int = 2000,
+    ) -> AsyncIterator[Conversion]:
+        # QuerySet.aiterator() can't iterate values_list() querysets in Django 5.0,
+        # so the chunks are read as consecutive keyset pages
+        while True:
+            conversions = await self.alistByUser(user_id, user_pk, chunk_size, after)
+            for conversion in conversions:
+                yield conversion
+            if len(conversions) < chunk_size:
+                return
+            last = conversions[-1]
+            # listed conversions were read back from the database, so they have their id
+            assert last.id is not None
+            after = (last.response.created_at, last.id)
+
+    def last_position(
+        self, user_id: str, user_pk: Optional[int] = None
+    ) -> Optional[tuple[datetime.datetime, int]]:
+        """
+        Returns the (created_at, id) of the user's last conversion in listByUser's order, or None
+        when they have none, with a single seek of the (user, created_at, id) index.
+        """
+        return (
+            self.filter_by_user(user_id, user_pk)
+            .order_by("-created_at", "-id")
+            .values_list("created_at", "id")
+            .first()
+        )
+
+    async def alast_position(
+        self, user_id: str, user_pk: Optional[int] = None
+    ) -> Optional[tuple[datetime.datetime, int]]:
+        return (
+            await self.filter_by_user(user_id, user_pk)
+            .order_by("-created_at", "-id")
+            .values_list("created_at", "id")
+            .afirst()
+        )
+
+    def rows_by_user(
+        self,
+        user_id: str,
+        user_pk: Optional[int] = None,
+        limit: Optional[int] = None,
+        after: Optional[tuple[datetime.datetime, int]] = None,
+    ):
+        conversions = self.filter_by_user(user_id, user_pk)
+        if after is not None:
+            created_at, id = after
+            # (created_at, id) > after; the created_at__gte term is what lets the index seek
+            conversions = conversions.filter(
+                Q(created_at__gt=created_at) | Q(id__gt=id),
+                created_at__gte=created_at,
+            )
+        rows = conversions.order_by("created_at", "id").values_list(
+            *self.conversion_columns
+        )
+        return rows if limit is None else rows[:limit]
+
+    def filter_by_user(self, user_id: str, user_pk: Optional[int] = None):
+        # the hint lets conversion.routers.ReplicaRouter read from the primary right after
+        # the user converted
+        conversions = ConversionModel.objects.db_manager(hints={"user_id": user_id})
+        if user_pk is None:
+            return conversions.filter(user__external_id=user_id)
+        return conversions.filter(user_id=user_pk)
+
+    def to_conversion(self, user_id: str, row: tuple) -> Conversion:
+        (
+            id,
+            from_currency,
+            from_amount,
+            to_currency,
+            to_amount,
+            rate,
+            rates_timestamp,
+            created_at,
+        ) = row
+        return Conversion(
+            id=id,
+            user_id=user_id,
+            request=ConversionRequest(
+                from_currency=from_currency,
+                amount=from_amount,
+                to_currency=to_currency,
+            ),
+            response=ConversionResponse(
+                converted_amount=to_amount,
+                rate=rate,
+                rates_timestamp=rates_timestamp,
+                created_at=created_at,
+            ),
+        )
+
+
+class ConversionWriteBuffer:
+    """
+    ConversionWriteBuffer is the write-behind mode of ConversionDbService.create.
+    Conversions get an id out of a block reserved ahead (see ConversionDbService.reserve_ids)
+    and are queued, then inserted with a single bulk_create: by the request queueing the
+    max_rows-th one, or by a background thread every flush_interval seconds (0 disables it).
+    The queue is flushed when the process exits cleanly, so a crash loses at most the
+    conversions of the last flush_interval seconds, max_rows at most.
+    Queued conversions aren't listed until they are flushed.
+    """
+
+    def __init__(
+        self,
+        max_rows: int = 500,
+        flush_interval: float = 1.0,
+        id_block_size: int = 1000,
+    ) -> None:
+        self.max_rows = max_rows
+        self.flush_interval = flush_interval
+        self.id_block_size = id_block_size
+        self._rows: list[ConversionModel] = []
+        self._ids: Iterator[int] = iter(())
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._closed = threading.Event()
+        self._started = False
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def add(self, conversion: Conversion, user_pk: int) -> Conversion:
+        new_conversion: Conversion = dataclasses.replace(conversion)
+        new_conversion.response.created_at = timezone.now()
+        with self._lock:
+            self._start()
+            new_conversion.id = self._next_id()
+            self._rows.append(
+                ConversionModel(
+                    id=new_conversion.id,
+                    user_id=user_pk,
+                    from_currency=conversion.request.from_currency,
+                    from_amount=conversion.request.amount,
+                    to_currency=conversion.request.to_currency,
+                    to_amount=conversion.response.converted_amount,
+                    rate=conversion.response.rate,
+                    rates_timestamp=conversion.response.rates_timestamp,
+                    created_at=new_conversion.response.created_at,
+                )
+            )
+            full = len(self._rows) >= self.max_rows
+        if full:
+            self.flush()
+        return new_conversion
+
+    def flush(self) -> int:
+        """
+        Inserts the queued conversions, returning how many. If the database fails they stay
+        queued for the next flush; conversions that can't be inserted anymore (their user
+        was deleted meanwhile) are dropped.
+        """
+        with self._flush_lock:
+            with self._lock:
+                rows, self._rows = self._rows, []
+            if not rows:
+                return 0
+            try:
+                with transaction.atomic():
+                    ConversionModel.objects.bulk_create(rows)
+            except IntegrityError:
+                return self._insert_each(rows)
+            except Exception:
+                logger.exception("Conversions flush failed", conversions=len(rows))
+                with self._lock:
+                    self._rows[:0] = rows
+                return 0
+            # the rows can land before conversions already listed (lower ids, earlier
+            # created_at), which only the bumped version tells the history ETags about
+            for user_pk in {row.user_id for row in rows}:
+                conversion_history_cache.bump(user_pk)
+            return len(rows)
+
+    def close(self) -> None:
+        """
+        Stops the background flushes and flushes what is left.
+        """
+        self._closed.set()
+        self.flush()
+
+    def _insert_each(self, rows: list[ConversionModel]) -> int:
+        inserted = 0
+        for row in rows:
+            try:
+                with transaction.atomic():
+                    ConversionModel.objects.bulk_create([row])
+                inserted += 1
+                conversion_history_cache.bump(row.user_id)
+            except IntegrityError:
+                logger.exception("Conversion dropped", id=row.id, user_pk=row.user_id)
+        return inserted
+
+    def _next_id(self) -> int:
+        id = next(self._ids, None)
+        if id is None:
+            self._ids = iter(ConversionDbService().reserve_ids(self.id_block_size))
+            id = next(self._ids)
+        return id
+
+    def _start(self) -> None:
+        if self._started:
+            return
+        self._started = True
+        atexit.register(self.close)
+        if self.flush_interval:
+            threading.Thread(
+                target=self._flush_periodically,
+                name="conversion-write-buffer",
+                daemon=True,
+            ).start()
+
+    def _flush_periodically(self) -> None:
+        while not self._closed.wait(self.flush_interval):
+            close_old_connections()
+            self.flush()
+        connection.close()
+
+
+class ConversionHistoryCache:
+    """
+    Caches rendered responses of a user's conversions under a version of the user's history, which
+    every write of their conversions bumps: a write makes the user's cached responses unreachable at
+    once, without looking for them, and they expire on their own.
+    Versions start from the clock, not from 1, so a version evicted from the cache doesn't come back
+    to a value whose responses are still cached.
+    Bumps follow the writes, so a response rendered from before a write is never cached under the
+    version after it.
+    The version is also part of the ETag of a user's conversions, so it's kept, and bumped, whether
+    the responses are cached (CONVERSION_HISTORY_CACHE) or not.
+    """
+
+    version_prefix = "history-version"
+    response_prefix = "history-response"
+
+    def __init__(self, timeout: int = 600) -> None:
+        self.timeout = timeout
+
+    def get(self, user_pk: int, version: int, variant: str) -> Any:
+        """
+        The version is read first, with version(), and a missed response is set under it: read
+        before the database, it can only be older than what was read.
+        """
+        return cache.get(self.response_key(user_pk, version, variant))
+
+    def set(self, user_pk: int, version: int, variant: str, value: Any) -> None:
+        cache.set(
+            self.response_key(user_pk, version, variant), value, timeout=self.timeout
+        )
+
+    def version(self, user_pk: int) -> int:
+        key = self.version_key(user_pk)
+        version = cache.get(key)
+        if version is None:
+            cache.add(key, time.time_ns(), timeout=self.timeout)
+            version = cache.get(key, 0)
+        return version
+
+    def bump(self, user_pk: int) -> None:
+        try:
+            cache.incr(self.version_key(user_pk))
+        except ValueError:
+            pass  # no version, so nothing cached
+
+    async def aget(self, user_pk: int, version: int, variant: str) -> Any:
+        return await cache.aget(self.response_key(user_pk, version, variant))
+
+    async def aset(self, user_pk: int, version: int, variant: str, value: Any) -> None:
+        await cache.aset(
+            self.response_key(user_pk, version, variant), value, timeout=self.timeout
+        )
+
+    async def aversion(self, user_pk: int) -> int:
+        key = self.version_key(user_pk)
+        version = await cache.aget(key)
+        if version is None:
+            await cache.aadd(key, time.time_ns(), timeout=self.timeout)
+            version = await cache.aget(key, 0)
+        return version
+
+    async def abump(self, user_pk: int) -> None:
+        try:
+            await cache.aincr(self.version_key(user_pk))
+        except ValueError:
+            pass
+
+    def version_key(self, user_pk: int) -> str:
+        return f"{self.version_prefix}:{user_pk}"
+
+    def response_key(self, user_pk: int, version: int, variant: str) -> str:
+        return f"{self.response_prefix}:{user_pk}:{version}:{variant}"
+
+
+class IdempotencyStore:
+    """
+    Keeps the first response of a request sent with an idempotency key, per user and key, and
+    returns it to the repeats of the request instead of running it again.
+    The first request holds a lock on the key while it runs; a repeat arriving meanwhile polls
+    until the response is stored, and runs the request itself if the lock went away without one,
+    e.g. because the first request failed. Only the responses returned are stored, a request
+    that raises can be retried with the same key.
+    The fingerprint of the request is stored with its response: the key reused for another
+    request raises IdempotencyKeyReusedException.
+    """
+
+    key_prefix = "idempotency"
+
+    def __init__(
+        self,
+        ttl: int = 86400,
+        lock_timeout: int = 60,
+        wait: float = 10,
+        poll_interval: float = 0.05,
+    ) -> None:
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout
+        self.wait = wait
+        self.poll_interval = poll_interval
+
+    def run(
+        self, user_id: str, key: str, fingerprint: str, fn: Callable[[], Any]
+    ) -> tuple[Any, bool]:
+        """
+        Returns the response of fn, or the one stored for the key, and whether it was stored.
+        """
+        response_key = self.response_key(user_id, key)
+        lock_key = self.lock_key(user_id, key)
+        deadline = time.monotonic() + self.wait
+        while True:
+            stored = cache.get(response_key)
+            if stored is not None:
+                return self.replay(stored, fingerprint), True
+            if cache.add(lock_key, fingerprint, timeout=self.lock_timeout):
+                break
+            if time.monotonic() >= deadline:
+                raise IdempotencyKeyInProgressException(
+                    "A request with this Idempotency-Key is still in progress"
+                )
+            time.sleep(self.poll_interval)
+
+        try:
+            # the request holding the lock before may have stored its response since
+            stored = cache.get(response_key)
+            if stored is not None:
+                return self.replay(stored, fingerprint), True
+            response = fn()
+            cache.set(
+                response_key,
+                {"fingerprint": fingerprint, "response": response},
+                timeout=self.ttl,
+            )
+            return response, False
+        finally:
+            cache.delete(lock_key)
+
+    async def arun(
+        self,
+        user_id: str,
+        key: str,
+        fingerprint: str,
+        fn: Callable[[], Awaitable[Any]],
+    ) -> tuple[Any, bool]:
+        response_key = self.response_key(user_id, key)
+        lock_key = self.lock_key(user_id, key)
+        deadline = time.monotonic() + self.wait
+        while True:
+            stored = await cache.aget(response_key)
+            if stored is not None:
+                return self.replay(stored, fingerprint), True
+            if await cache.aadd(lock_key, fingerprint, timeout=self.lock_timeout):
+                break
+            if time.monotonic() >= deadline:
+                raise IdempotencyKeyInProgressException(
+                    "A request with this Idempotency-Key is still in progress"
                 )
+            await asyncio.sleep(self.poll_interval)
+
+        try:
+            stored = await cache.aget(response_key)
+            if stored is not None:
+                return self.replay(stored, fingerprint), True
+            response = await fn()
+            await cache.aset(
+                response_key,
+                {"fingerprint": fingerprint, "response": response},
+                timeout=self.ttl,
+            )
+            return response, False
+        finally:
+            await cache.adelete(lock_key)
+
+    def replay(self, stored: dict, fingerprint: str) -> Any:
+        if stored["fingerprint"] != fingerprint:
+            raise IdempotencyKeyReusedException(
+                "This Idempotency-Key was already used for a different request"
             )
-        return user_conversions
+        return stored["response"]
+
+    def response_key(self, user_id: str, key: str) -> str:
+        return f"{self.key_prefix}:{self.digest(user_id, key)}"
+
+    def lock_key(self, user_id: str, key: str) -> str:
+        return f"{self.key_prefix}-lock:{self.digest(user_id, key)}"
+
+    def digest(self, user_id: str, key: str) -> str:
+        # keys and user ids are client input, of any length and characters
+        return hashlib.sha256(f"{user_id}\n{key}".encode()).hexdigest()
 
 
 class CacheProtocol(Protocol):
-    def set(self, key, value, timeout=300, version=None) -> None: ...
+    def set(self, key, value, timeout=300, version=None, past_midnight=0) -> None: ...
     def get(self, key, default=None, version=None) -> Any: ...
+    def add(self, key, value, timeout=300, version=None) -> bool: ...
+    def delete(self, key, version=None) -> bool: ...
+    async def aset(
+        self, key, value, timeout=300, version=None, past_midnight=0
+    ) -> None: ...
+    async def aget(self, key, default=None, version=None) -> Any: ...
+    async def aadd(self, key, value, timeout=300, version=None) -> bool: ...
+    async def adelete(self, key, version=None) -> bool: ...
+
+
+def seconds_until_midnight() -> int:
+    # midnight UTC, when todays_key rolls over, whatever the host's time zone
+    now = datetime.datetime.now(tz=pytz.UTC)
+    midnight = datetime.datetime.combine(
+        now.date(), datetime.time(tzinfo=pytz.UTC)
+    ) + datetime.timedelta(days=1)
+    time_left = (midnight - now).total_seconds()
+    return int(time_left)  # one second less or more is irrelevant
+
+
+def jittered_seconds_until_midnight() -> int:
+    """
+    Spreads expirations over RATES_CACHE_TTL_JITTER seconds after midnight, so the previous
+    day's rates are still around while the new ones are being fetched.
+    """
+    jitter = random.randint(0, settings.RATES_CACHE_TTL_JITTER)
+    return seconds_until_midnight() + jitter
 
 
 class MidnightCache:
@@ -175,26 +1334,139 @@ class MidnightCache:
     It is based on Django's cache object.
     """
 
-    def set(self, key, value, timeout=86400, version=None) -> None:
+    def set(self, key, value, timeout=86400, version=None, past_midnight=0) -> None:
         """
         This method sets a value in the cache with a specific key, a timeout (default is 24 hours), and an optional version.
-        The timeout is overwritten by the number of seconds until midnight.
+        The timeout is overwritten by the number of seconds until midnight, plus a random jitter.
+        With past_midnight, the value lives that many seconds longer.
         The timeout argument is kept for backwards compatibility.
         """
         cache.set(
-            key, value, timeout=self.calculate_seconds_until_midnight(), version=version
+            key,
+            value,
+            timeout=jittered_seconds_until_midnight() + past_midnight,
+            version=version,
         )
 
     def get(self, key, default=None, version=None) -> Any:
         return cache.get(key, default=default, version=version)
 
+    def add(self, key, value, timeout=300, version=None) -> bool:
+        return cache.add(key, value, timeout=timeout, version=version)
+
+    def delete(self, key, version=None) -> bool:
+        return cache.delete(key, version=version)
+
+    async def aset(
+        self, key, value, timeout=86400, version=None, past_midnight=0
+    ) -> None:
+        await cache.aset(
+            key,
+            value,
+            timeout=jittered_seconds_until_midnight() + past_midnight,
+            version=version,
+        )
+
+    async def aget(self, key, default=None, version=None) -> Any:
+        return await cache.aget(key, default=default, version=version)
+
+    async def aadd(self, key, value, timeout=300, version=None) -> bool:
+        return await cache.aadd(key, value, timeout=timeout, version=version)
+
+    async def adelete(self, key, version=None) -> bool:
+        return await cache.adelete(key, version=version)
+
     def calculate_seconds_until_midnight(self) -> int:
-        now = datetime.datetime.now()
-        midnight = datetime.datetime.combine(
-            now.date(), datetime.time()
-        ) + datetime.timedelta(days=1)
-        time_left = (midnight - now).total_seconds()
-        return int(time_left)  # one second less or more is irrelevant
+        return seconds_until_midnight()
+
+
+class LocalMemoryCache:
+    """
+    LocalMemoryCache is an in-process cache tier that sits in front of another cache (usually MidnightCache).
+    Hits are served straight from the worker's memory, skipping the network round trip and the unpickling
+    of the backend. Entries expire at midnight, like MidnightCache ones, or max_age seconds after they were
+    read or set, whichever comes first, so values set by other processes (e.g. the warm_rates command's
+    refreshes) reach this one. At most max_entries keys are kept.
+    Values are shared between callers, so they must be treated as read-only.
+    """
+
+    def __init__(
+        self,
+        backend: CacheProtocol,
+        max_entries: int = 2,
+        max_age: Optional[int] = None,
+    ) -> None:
+        self.backend = backend
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._entries: OrderedDict[tuple, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def set(self, key, value, timeout=86400, version=None, past_midnight=0) -> None:
+        self.backend.set(
+            key, value, timeout=timeout, version=version, past_midnight=past_midnight
+        )
+        self._store((key, version), value, past_midnight)
+
+    def get(self, key, default=None, version=None) -> Any:
+        entry = self._entries.get((key, version))
+        if entry is not None and entry[0] > time.time():
+            return entry[1]
+
+        value = self.backend.get(key, default=default, version=version)
+        if value is not default:
+            self._store((key, version), value)
+        return value
+
+    def add(self, key, value, timeout=300, version=None) -> bool:
+        # only used for locks, which have to be visible to the other workers
+        return self.backend.add(key, value, timeout=timeout, version=version)
+
+    def delete(self, key, version=None) -> bool:
+        with self._lock:
+            self._entries.pop((key, version), None)
+        return self.backend.delete(key, version=version)
+
+    async def aset(
+        self, key, value, timeout=86400, version=None, past_midnight=0
+    ) -> None:
+        await self.backend.aset(
+            key, value, timeout=timeout, version=version, past_midnight=past_midnight
+        )
+        self._store((key, version), value, past_midnight)
+
+    async def aget(self, key, default=None, version=None) -> Any:
+        entry = self._entries.get((key, version))
+        if entry is not None and entry[0] > time.time():
+            return entry[1]
+
+        value = await self.backend.aget(key, default=default, version=version)
+        if value is not default:
+            self._store((key, version), value)
+        return value
+
+    async def aadd(self, key, value, timeout=300, version=None) -> bool:
+        return await self.backend.aadd(key, value, timeout=timeout, version=version)
+
+    async def adelete(self, key, version=None) -> bool:
+        with self._lock:
+            self._entries.pop((key, version), None)
+        return await self.backend.adelete(key, version=version)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def _store(self, local_key: tuple, value: Any, past_midnight: int = 0) -> None:
+        ttl = jittered_seconds_until_midnight() + past_midnight
+        if self.max_age is not None:
+            ttl = min(ttl, self.max_age)
+        expires_at = time.time() + ttl
+        with self._lock:
+            self._entries[local_key] = (expires_at, value)
+            self._entries.move_to_end(local_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
 
 
 class ConversionRatesCacheService:
@@ -204,5 +1476,82 @@ class ConversionRatesCacheService:
     def get_rates(self, key, default=None, version=None) -> Any:
         return self.cache.get(key, default=default, version=version)
 
-    def save_rates(self, key, value, timeout=300, version=None) -> None:
-        self.cache.set(key, value, timeout=timeout, version=version)
+    def save_rates(
+        self, key, value, timeout=300, version=None, past_midnight=0
+    ) -> None:
+        self.cache.set(
+            key, value, timeout=timeout, version=version, past_midnight=past_midnight
+        )
+
+    def acquire_refresh_lock(self, key) -> bool:
+        return self.cache.add(
+            f"{key}:refresh-lock", 1, timeout=settings.RATES_REFRESH_LOCK_TIMEOUT
+        )
+
+    def release_refresh_lock(self, key) -> None:
+        self.cache.delete(f"{key}:refresh-lock")
+
+    async def aget_rates(self, key, default=None, version=None) -> Any:
+        return await self.cache.aget(key, default=default, version=version)
+
+    async def asave_rates(
+        self, key, value, timeout=300, version=None, past_midnight=0
+    ) -> None:
+        await self.cache.aset(
+            key, value, timeout=timeout, version=version, past_midnight=past_midnight
+        )
+
+    async def aacquire_refresh_lock(self, key) -> bool:
+        return await self.cache.aadd(
+            f"{key}:refresh-lock", 1, timeout=settings.RATES_REFRESH_LOCK_TIMEOUT
+        )
+
+    async def arelease_refresh_lock(self, key) -> None:
+        await self.cache.adelete(f"{key}:refresh-lock")
+
+
+# One instance per worker process, so the in-memory tier and the pooled
+# connections survive across requests
+rates_http_client = RatesHttpClient(
+    connect_timeout=settings.EXCHANGE_API_CONNECT_TIMEOUT,
+    read_timeout=settings.EXCHANGE_API_READ_TIMEOUT,
+    retries=settings.EXCHANGE_API_RETRIES,
+    backoff_factor=settings.EXCHANGE_API_RETRY_BACKOFF,
+    pool_size=settings.EXCHANGE_API_POOL_SIZE,
+    gzip=settings.EXCHANGE_API_GZIP,
+)
+
+conversion_write_buffer = ConversionWriteBuffer(
+    max_rows=settings.CONVERSION_WRITE_BEHIND_MAX_ROWS,
+    flush_interval=settings.CONVERSION_WRITE_BEHIND_INTERVAL,
+    id_block_size=settings.CONVERSION_ID_BLOCK_SIZE,
+)
+
+conversion_history_cache = ConversionHistoryCache(
+    timeout=settings.CONVERSION_HISTORY_CACHE_TIMEOUT
+)
+
+idempotency_store = IdempotencyStore(
+    ttl=settings.IDEMPOTENCY_KEY_TTL,
+    lock_timeout=settings.IDEMPOTENCY_LOCK_TIMEOUT,
+    wait=settings.IDEMPOTENCY_WAIT,
+    poll_interval=settings.IDEMPOTENCY_POLL_INTERVAL,
+)
+
+rates_local_cache = LocalMemoryCache(
+    MidnightCache(),
+    max_entries=settings.RATES_LOCAL_CACHE_MAX_ENTRIES,
+    max_age=settings.RATES_WARM_INTERVAL,
+)
+
+
+def get_rates_cache() -> CacheProtocol:
+    if settings.RATES_LOCAL_CACHE_ENABLED:
+        return rates_local_cache
+    return MidnightCache()
+
+
+def get_rate_snapshot_store() -> Optional[RateSnapshotDbService]:
+    if settings.RATES_SNAPSHOTS_ENABLED:
+        return RateSnapshotDbService()
+    return None
@@ -1,15 +1,51 @@
+import json
+import time
 from decimal import Decimal
 from unittest.mock import patch
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.test import AsyncClient
 import pytest
 import datetime
+from freezegun import freeze_time
 from django.urls import reverse
+from django.utils.http import http_date
 from pytz import timezone  # type: ignore
 from rest_framework import status
 
-from conversion.services import ExchangeRatesAPI
+from conversion.exceptions import (
+    ConversionRateServiceTimeoutException,
+    ConversionRateServiceUnavailableException,
+)
+from conversion.domain import Conversion, ConversionRequest, ConversionResponse
+from conversion.services import (
+    AsyncExchangeRatesAPI,
+    ConversionDbService,
+    ConversionRatesCacheService,
+    ConversionWriteBuffer,
+    ExchangeRatesAPI,
+    MidnightCache,
+    RatesHttpClient,
+    idempotency_store,
+    last_known_rates,
+)
 from conversion.test_services import MOCK_ERROR_EXCHANGE_RATES, MOCK_EXCHANGE_RATES
 from conversion.models import Conversion as ConversionModel  # type: ignore
-from conversion.api import CreateConversionView, GetUserConversionsView  # type: ignore
+from conversion.renderers import decode_currencies, decode_rates_table
+from conversion.routers import pin_key
+from users.services import user_id_resolver
+from conversion.api import (  # type: ignore
+    IDEMPOTENCY_KEY_HEADER,
+    IDEMPOTENT_REPLAYED_HEADER,
+    RATES_STALE_HEADER,
+    AsyncCreateConversionView,
+    CreateConversionBatchView,
+    CreateConversionView,
+    CurrenciesView,
+    GetUserConversionsView,
+    QuoteView,
+    RatesView,
+)
 
 
 DATE_FORMAT = "%Y-%m-%d %H:%M:%S %Z%z"
@@ -94,6 +130,83 @@ class TestCreateConversionView:
         assert data["rates_timestamp"]
         assert data["created_at"]
 
+    @patch.object(
+        ExchangeRatesAPI, "get_latest_rates", return_value=MOCK_EXCHANGE_RATES
+    )
+    def test_user_is_resolved_once_expect_only_insert_on_next_requests(
+        self,
+        mocked_get_latest_rates,
+        client,
+        user,
+        disable_throttling,
+        django_assert_num_queries,
+    ):
+        payload = {
+            "from_currency": "EUR",
+            "to_currency": "USD",
+            "amount": 100,
+            "user_id": user.external_id,
+        }
+        response = client.post(reverse("conversion-create"), payload, format="json")
+        assert response.status_code == status.HTTP_201_CREATED
+
+        with django_assert_num_queries(1):
+            response = client.post(reverse("conversion-create"), payload, format="json")
+        assert response.status_code == status.HTTP_201_CREATED
+
+    @pytest.mark.django_db(transaction=True)
+    @patch.object(
+        ExchangeRatesAPI, "get_latest_rates", return_value=MOCK_EXCHANGE_RATES
+    )
+    def test_user_deleted_by_another_process_expect_exception_status_403(
+        self, mocked_get_latest_rates, client, user, disable_throttling
+    ):
+        payload = {
+            "from_currency": "EUR",
+            "to_currency": "USD",
+            "amount": 100,
+            "user_id": user.external_id,
+        }
+        response = client.post(reverse("conversion-create"), payload, format="json")
+        assert response.status_code == status.HTTP_201_CREATED
+        # another process only invalidates its own mapping
+        with patch.object(user_id_resolver, "invalidate"):
+            user.delete()
+
+        response = client.post(reverse("conversion-create"), payload, format="json")
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+        assert user_id_resolver.resolve(user.external_id) is None
+
+    @patch.object(
+        ExchangeRatesAPI, "get_latest_rates", return_value=MOCK_EXCHANGE_RATES
+    )
+    def test_write_behind_expect_same_conversion_listed_once_flushed(
+        self,
+        mocked_get_latest_rates,
+        client,
+        user,
+        teardown_conversions,
+        disable_throttling,
+        settings,
+        monkeypatch,
+    ):
+        buffer = ConversionWriteBuffer(max_rows=10, flush_interval=0)
+        monkeypatch.setattr("conversion.services.conversion_write_buffer", buffer)
+        settings.CONVERSION_WRITE_BEHIND = True
+        payload = {
+            "from_currency": "EUR",
+            "to_currency": "USD",
+            "amount": 100,
+            "user_id": user.external_id,
+        }
+        response = client.post(reverse("conversion-create"), payload)
+        assert response.status_code == status.HTTP_201_CREATED
+        url = reverse("conversions-user-list", args=[user.external_id])
+        assert client.get(url).json() == []
+
+        buffer.flush()
+        assert client.get(url).json() == [response.json()]
+
     @pytest.mark.parametrize(
         "from_currency, to_currency",
         [
@@ -141,6 +254,33 @@ class TestCreateConversionView:
             == f"{MOCK_ERROR_EXCHANGE_RATES['error']['code']}: {MOCK_ERROR_EXCHANGE_RATES['error']['info']}"
         )
 
+    @pytest.mark.parametrize(
+        "exception, expected_status",
+        [
+            (
+                ConversionRateServiceTimeoutException("Rates service timed out"),
+                status.HTTP_504_GATEWAY_TIMEOUT,
+            ),
+            (
+                ConversionRateServiceUnavailableException("Rates service unavailable"),
+                status.HTTP_502_BAD_GATEWAY,
+            ),
+            (ValueError("Unexpected"), status.HTTP_500_INTERNAL_SERVER_ERROR),
+        ],
+    )
+    def test_rates_service_failure_expect_mapped_status(
+        self, exception, expected_status, client, user, disable_throttling
+    ):
+        payload = {
+            "from_currency": "EUR",
+            "to_currency": "USD",
+            "amount": 98.12,
+            "user_id": user.external_id,
+        }
+        with patch.object(ExchangeRatesAPI, "get_latest_rates", side_effect=exception):
+            response = client.post(reverse("conversion-create"), payload, format="json")
+        assert response.status_code == expected_status
+
     @patch.object(
         ExchangeRatesAPI, "get_latest_rates", return_value=MOCK_EXCHANGE_RATES
     )
@@ -163,6 +303,155 @@ class TestCreateConversionView:
                 assert response.status_code == status.HTTP_201_CREATED
 
 
+@pytest.mark.django_db()
+class TestCreateConversionBatchView:
+    @pytest.fixture(autouse=True)
+    def disable_throttling(self):
+        throttling_clases = CreateConversionBatchView.throttle_classes
+        CreateConversionBatchView.throttle_classes = ()
+        yield
+        CreateConversionBatchView.throttle_classes = throttling_clases
+
+    def post(self, client, payload):
+        return client.post(
+            reverse("conversion-batch-create"),
+            payload,
+            content_type="application/json",
+        )
+
+    @patch.object(
+        ExchangeRatesAPI, "get_latest_rates", return_value=MOCK_EXCHANGE_RATES
+    )
+    def test_all_items_valid_expect_all_created_with_one_rates_load(
+        self,
+        mocked_get_latest_rates,
+        client,
+        user,
+        teardown_conversions,
+        django_assert_max_num_queries,
+    ):
+        payload = {
+            "user_id": user.external_id,
+            "conversions": [
+                {"from_currency": "EUR", "to_currency": "USD", "amount": 100},
+                {"from_currency": "USD", "to_currency": "EUR", "amount": 200},
+                {"from_currency": "BRL", "to_currency": "GBP", "amount": 500},
+            ],
+        }
+        # user lookup, savepoint, INSERT and savepoint release
+        with django_assert_max_num_queries(4):
+            response = self.post(client, payload)
+
+        assert response.status_code == status.HTTP_201_CREATED
+        data = response.json()
+        assert data["user_id"] == user.external_id
+        assert [result["index"] for result in data["results"]] == [0, 1, 2]
+        assert [result["conversion"]["to_amount"] for result in data["results"]] == [
+            "108.40",
+            "184.51",
+            "75.44",
+        ]
+        assert all(result["conversion"]["id"] for result in data["results"])
+        assert mocked_get_latest_rates.call_count == 1
+        assert ConversionModel.objects.filter(user=user).count() == 3
+
+    @patch.object(
+        ExchangeRatesAPI, "get_latest_rates", return_value=MOCK_EXCHANGE_RATES
+    )
+    def test_invalid_items_expect_reported_individually(
+        self, mocked_get_latest_rates, client, user, teardown_conversions
+    ):
+        payload = {
+            "user_id": user.external_id,
+            "conversions": [
+                {"from_currency": "EUR", "to_currency": "YYY", "amount": 100},
+                {"from_currency": "EUR", "to_currency": "USD", "amount": 100},
+                {"from_currency": "EUR", "to_currency": "USD"},
+            ],
+        }
+        response = self.post(client, payload)
+
+        assert response.status_code == status.HTTP_201_CREATED
+        results = response.json()["results"]
+        assert results[0] == {"index": 0, "detail": "EUR or YYY not found"}
+        assert results[1]["conversion"]["to_amount"] == "108.40"
+        assert "amount" in results[2]["detail"]
+        assert ConversionModel.objects.filter(user=user).count() == 1
+
+    @patch.object(
+        ExchangeRatesAPI, "get_latest_rates", return_value=MOCK_EXCHANGE_RATES
+    )
+    def test_no_valid_items_expect_status_400_and_nothing_created(
+        self, mocked_get_latest_rates, client, user
+    ):
+        payload = {
+            "user_id": user.external_id,
+            "conversions": [
+                {"from_currency": "EUR", "to_currency": "YYY", "amount": 100},
+            ],
+        }
+        response = self.post(client, payload)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.json()["results"] == [
+            {"index": 0, "detail": "EUR or YYY not found"}
+        ]
+        assert ConversionModel.objects.count() == 0
+
+    def test_user_does_not_exist_expect_exception_status_403(self, client, user):
+        payload = {
+            "user_id": "123",
+            "conversions": [
+                {"from_currency": "EUR", "to_currency": "USD", "amount": 100}
+            ],
+        }
+        response = self.post(client, payload)
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    @pytest.mark.django_db(transaction=True)
+    @patch.object(
+        ExchangeRatesAPI, "get_latest_rates", return_value=MOCK_EXCHANGE_RATES
+    )
+    def test_user_deleted_by_another_process_expect_exception_status_403(
+        self, mocked_get_latest_rates, client, user
+    ):
+        user_id_resolver.resolve(user.external_id)
+        with patch.object(user_id_resolver, "invalidate"):
+            user.delete()
+
+        payload = {
+            "user_id": user.external_id,
+            "conversions": [
+                {"from_currency": "EUR", "to_currency": "USD", "amount": 100}
+            ],
+        }
+        response = self.post(client, payload)
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+        assert ConversionModel.objects.count() == 0
+
+    def test_too_many_items_expect_exception_status_400(self, client, user, settings):
+        item = {"from_currency": "EUR", "to_currency": "USD", "amount": 100}
+        max_items = settings.CONVERSION_BATCH_MAX_ITEMS
+        payload = {"user_id": user.external_id, "conversions": [item] * (max_items + 1)}
+        response = self.post(client, payload)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    @patch.object(
+        ExchangeRatesAPI, "get_latest_rates", return_value=MOCK_ERROR_EXCHANGE_RATES
+    )
+    def test_failed_response_expect_exception_status_500(
+        self, mocked_get_latest_rates, client, user
+    ):
+        payload = {
+            "user_id": user.external_id,
+            "conversions": [
+                {"from_currency": "EUR", "to_currency": "USD", "amount": 100}
+            ],
+        }
+        response = self.post(client, payload)
+        assert response.status_code == status.HTTP_500_INTERNAL_SERVER_ERROR
+        assert ConversionModel.objects.count() == 0
+
+
 @pytest.mark.django_db()
 class TestGetUserConversionsView:
     @pytest.fixture
@@ -212,3 +501,1000 @@ class TestGetUserConversionsView:
     ):
         response = client.get(reverse("conversions-user-list", args=[1]))
         assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    @pytest.fixture
+    def conversions(self, user, teardown_conversions):
+        rates_timestamp = datetime.datetime.now(timezone("UTC"))
+        with freeze_time("2024-06-02 15:00:00"):
+            # same created_at, so the pages are told apart by id
+            ConversionModel.objects.bulk_create(
+                ConversionModel(
+                    user=user,
+                    from_currency="EUR",
+                    from_amount=amount,
+                    to_currency="USD",
+                    to_amount=amount,
+                    rate=1,
+                    rates_timestamp=rates_timestamp,
+                )
+                for amount in range(1, 4)
+            )
+        with freeze_time("2024-06-02 16:00:00"):
+            ConversionModel.objects.bulk_create(
+                ConversionModel(
+                    user=user,
+                    from_currency="EUR",
+                    from_amount=amount,
+                    to_currency="USD",
+                    to_amount=amount,
+                    rate=1,
+                    rates_timestamp=rates_timestamp,
+                )
+                for amount in range(4, 6)
+            )
+
+    def test_paginated_expect_all_conversions_once_in_order(
+        self, client, user, conversions, disable_throttling
+    ):
+        url = reverse("conversions-user-list", args=[user.external_id])
+        amounts = []
+        pages = 0
+        params = {"limit": 2}
+        while True:
+            response = client.get(url, params)
+            assert response.status_code == status.HTTP_200_OK
+            data = response.json()
+            assert len(data["results"]) <= 2
+            amounts += [conversion["amount"] for conversion in data["results"]]
+            pages += 1
+            if data["next"] is None:
+                break
+            params = {"limit": 2, "cursor": data["next"]}
+
+        assert pages == 3
+        assert amounts == ["1.00", "2.00", "3.00", "4.00", "5.00"]
+
+    def test_not_paginated_expect_whole_list_in_order(
+        self, client, user, conversions, disable_throttling
+    ):
+        response = client.get(reverse("conversions-user-list", args=[user.external_id]))
+        assert response.status_code == status.HTTP_200_OK
+        assert [conversion["amount"] for conversion in response.json()] == [
+            "1.00",
+            "2.00",
+            "3.00",
+            "4.00",
+            "5.00",
+        ]
+
+    def test_last_page_expect_next_none(
+        self, client, user, conversions, disable_throttling
+    ):
+        response = client.get(
+            reverse("conversions-user-list", args=[user.external_id]), {"limit": 5}
+        )
+        data = response.json()
+        assert len(data["results"]) == 5
+        assert data["next"] is None
+
+    def test_page_expect_same_number_of_queries_at_any_depth(
+        self,
+        client,
+        user,
+        conversions,
+        disable_throttling,
+        django_assert_num_queries,
+    ):
+        url = reverse("conversions-user-list", args=[user.external_id])
+        first_page = client.get(url, {"limit": 1}).json()
+
+        # the history version, for the ETag, and the page
+        with django_assert_num_queries(2):
+            client.get(url, {"limit": 1, "cursor": first_page["next"]})
+
+    @pytest.mark.parametrize("chunk_size", [1, 2, 5, 100])
+    def test_streamed_expect_same_list_as_not_paginated(
+        self, client, user, conversions, disable_throttling, settings, chunk_size
+    ):
+        settings.CONVERSION_STREAM_CHUNK_SIZE = chunk_size
+        url = reverse("conversions-user-list", args=[user.external_id])
+
+        response = client.get(url, {"stream": "true"})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.streaming
+        assert response["Content-Type"] == "application/json"
+        chunks = list(response.streaming_content)
+        # the opening and closing brackets, and ceil(5 / chunk_size) chunks of conversions
+        assert len(chunks) == 2 + -(-5 // chunk_size)
+        assert json.loads(b"".join(chunks)) == client.get(url).json()
+
+    def test_streamed_from_cursor_expect_remaining_conversions(
+        self, client, user, conversions, disable_throttling
+    ):
+        url = reverse("conversions-user-list", args=[user.external_id])
+        first_page = client.get(url, {"limit": 3}).json()
+
+        response = client.get(url, {"stream": "true", "cursor": first_page["next"]})
+        data = json.loads(b"".join(response.streaming_content))
+        assert [conversion["amount"] for conversion in data] == ["4.00", "5.00"]
+
+    def test_streamed_without_conversions_expect_empty_list(
+        self, client, user, disable_throttling
+    ):
+        response = client.get(
+            reverse("conversions-user-list", args=[user.external_id]),
+            {"stream": "true"},
+        )
+        assert json.loads(b"".join(response.streaming_content)) == []
+
+    @pytest.mark.parametrize(
+        "params",
+        [
+            {"limit": 0},
+            {"limit": "a"},
+            {"limit": 100_000},
+            {"cursor": "not-a-cursor"},
+            {"stream": "true", "limit": 10},
+        ],
+    )
+    def test_invalid_page_params_expect_exception_status_400(
+        self, client, user, params, disable_throttling
+    ):
+        response = client.get(
+            reverse("conversions-user-list", args=[user.external_id]), params
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_etag_matches_expect_not_modified_without_loading_rows(
+        self, client, user, conversions, disable_throttling, django_assert_num_queries
+    ):
+        url = reverse("conversions-user-list", args=[user.external_id])
+        response = client.get(url)
+        assert "no-cache" in response["Cache-Control"]
+
+        with django_assert_num_queries(1) as captured:
+            not_modified = client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        assert not_modified.status_code == status.HTTP_304_NOT_MODIFIED
+        # the last conversion, seeked in the index, not an aggregate of all of them
+        (query,) = captured.captured_queries
+        assert "COUNT" not in query["sql"]
+        assert query["sql"].endswith("LIMIT 1")
+        assert not_modified.content == b""
+        assert not_modified["ETag"] == response["ETag"]
+
+    def test_conversion_added_expect_new_etag(
+        self, client, user, conversions, disable_throttling
+    ):
+        url = reverse("conversions-user-list", args=[user.external_id])
+        etag = client.get(url)["ETag"]
+        ConversionModel.objects.create(
+            user=user,
+            from_currency="EUR",
+            from_amount=1,
+            to_currency="USD",
+            to_amount=1,
+            rate=1,
+            rates_timestamp=datetime.datetime.now(timezone("UTC")),
+        )
+
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_200_OK
+        assert len(response.json()) == 6
+        assert response["ETag"] != etag
+
+    def test_conversions_added_within_one_second_expect_modified(
+        self, client, user, teardown_conversions, disable_throttling
+    ):
+        url = reverse("conversions-user-list", args=[user.external_id])
+        conversion = {
+            "user": user,
+            "from_currency": "EUR",
+            "from_amount": 1,
+            "to_currency": "USD",
+            "to_amount": 1,
+            "rate": 1,
+            "rates_timestamp": datetime.datetime.now(timezone("UTC")),
+        }
+        with freeze_time("2024-06-02 16:00:00.100"):
+            ConversionModel.objects.create(**conversion)
+            response = client.get(url)
+        with freeze_time("2024-06-02 16:00:00.900"):
+            ConversionModel.objects.create(**conversion)
+            modified_since = client.get(
+                url, HTTP_IF_MODIFIED_SINCE=http_date(time.time())
+            )
+            none_match = client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+
+        assert "Last-Modified" not in response
+        for modified in (modified_since, none_match):
+            assert modified.status_code == status.HTTP_200_OK
+            assert len(modified.json()) == 2
+            assert modified["ETag"] != response["ETag"]
+
+    def test_write_behind_rows_flushed_before_listed_ones_expect_new_etag(
+        self, client, user, teardown_conversions, disable_throttling, settings
+    ):
+        buffer = ConversionWriteBuffer(max_rows=10, flush_interval=0)
+        settings.CONVERSION_WRITE_BEHIND = True
+        url = reverse("conversions-user-list", args=[user.external_id])
+        with patch("conversion.services.conversion_write_buffer", buffer):
+            queued = ConversionDbService().create(
+                Conversion(
+                    user_id=user.external_id,
+                    request=ConversionRequest("EUR", "USD", Decimal("1")),
+                    response=ConversionResponse(
+                        rate=Decimal("1"),
+                        rates_timestamp=datetime.datetime.now(timezone("UTC")),
+                        created_at=None,  # type: ignore
+                        converted_amount=Decimal("1"),
+                    ),
+                ),
+                user_pk=user.pk,
+            )
+            # inserted after the queued one, with a greater id and created_at
+            ConversionModel.objects.create(
+                user=user,
+                from_currency="EUR",
+                from_amount=1,
+                to_currency="USD",
+                to_amount=1,
+                rate=1,
+                rates_timestamp=datetime.datetime.now(timezone("UTC")),
+            )
+            etag = client.get(url)["ETag"]
+            buffer.flush()
+
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()[0]["id"] == queued.id
+        assert response["ETag"] != etag
+
+    def test_other_query_expect_other_etag(
+        self, client, user, conversions, disable_throttling
+    ):
+        url = reverse("conversions-user-list", args=[user.external_id])
+        etag = client.get(url)["ETag"]
+
+        response = client.get(url, {"limit": 2}, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_200_OK
+        assert response["ETag"] != etag
+
+    def test_no_conversions_expect_etag(self, client, user, disable_throttling):
+        url = reverse("conversions-user-list", args=[user.external_id])
+        response = client.get(url)
+        response = client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+
+@pytest.mark.django_db()
+class TestConversionHistoryCache:
+    @pytest.fixture(autouse=True)
+    def history_cache(self, settings):
+        settings.CONVERSION_HISTORY_CACHE = True
+        throttling_clases = GetUserConversionsView.throttle_classes
+        GetUserConversionsView.throttle_classes = ()
+        yield
+        GetUserConversionsView.throttle_classes = throttling_clases
+
+    def create_conversion(self, user):
+        return ConversionDbService().create(
+            Conversion(
+                user_id=user.external_id,
+                request=ConversionRequest("EUR", "USD", Decimal("100")),
+                response=ConversionResponse(
+                    rate=Decimal("1.08"),
+                    rates_timestamp=datetime.datetime.now(timezone("UTC")),
+                    created_at=None,  # type: ignore
+                    converted_amount=Decimal("108.40"),
+                ),
+            ),
+            user_pk=user.pk,
+        )
+
+    @pytest.mark.parametrize(
+        "url", ["conversions-user-list", "async-conversions-user-list"]
+    )
+    @pytest.mark.parametrize("params", [{}, {"limit": 1}])
+    def test_hit_expect_same_response_without_queries(
+        self, client, user, teardown_conversions, django_assert_num_queries, url, params
+    ):
+        self.create_conversion(user)
+        url = reverse(url, args=[user.external_id])
+        response = client.get(url, params)
+
+        with django_assert_num_queries(0):
+            cached = client.get(url, params)
+        assert cached.content == response.content
+        assert cached["Content-Type"] == response["Content-Type"]
+        assert cached["ETag"] == response["ETag"]
+
+        with django_assert_num_queries(0):
+            not_modified = client.get(url, params, HTTP_IF_NONE_MATCH=response["ETag"])
+        assert not_modified.status_code == status.HTTP_304_NOT_MODIFIED
+
+    def test_user_converts_expect_new_response(
+        self, client, user, teardown_conversions
+    ):
+        url = reverse("conversions-user-list", args=[user.external_id])
+        assert client.get(url).json() == []
+        conversion = self.create_conversion(user)
+        assert [c["id"] for c in client.get(url).json()] == [conversion.id]
+
+    def test_write_behind_flush_expect_new_response(
+        self, client, settings, user, teardown_conversions
+    ):
+        settings.CONVERSION_WRITE_BEHIND = True
+        buffer = ConversionWriteBuffer(max_rows=100, flush_interval=0)
+        url = reverse("conversions-user-list", args=[user.external_id])
+        with patch("conversion.services.conversion_write_buffer", buffer):
+            assert client.get(url).json() == []
+            conversion = self.create_conversion(user)
+            assert client.get(url).json() == []
+            buffer.flush()
+        assert [c["id"] for c in client.get(url).json()] == [conversion.id]
+
+    def test_browsable_api_expect_not_cached(self, client, user):
+        url = reverse("conversions-user-list", args=[user.external_id])
+        with patch("conversion.api.conversion_history_cache") as history_cache:
+            response = client.get(url, HTTP_ACCEPT="text/html")
+        assert response["Content-Type"].startswith("text/html")
+        # the version still makes the ETag
+        history_cache.get.assert_not_called()
+        history_cache.set.assert_not_called()
+
+
+@pytest.mark.django_db()
+class TestAsyncConversionViews:
+    def post(self, payload):
+        return async_to_sync(AsyncClient().post)(
+            reverse("async-conversion-create"),
+            payload,
+            content_type="application/json",
+        )
+
+    def get(self, user_id, params=None):
+        return async_to_sync(AsyncClient().get)(
+            reverse("async-conversions-user-list", args=[user_id]), params
+        )
+
+    @patch.object(
+        AsyncExchangeRatesAPI, "get_latest_rates", return_value=MOCK_EXCHANGE_RATES
+    )
+    def test_success_conversion_expect_same_format_as_sync_view(
+        self, mocked_get_latest_rates, user, teardown_conversions
+    ):
+        response = self.post(
+            {
+                "from_currency": "EUR",
+                "to_currency": "USD",
+                "amount": 100,
+                "user_id": user.external_id,
+            }
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+        data = response.json()
+        assert data["to_amount"] == "108.40"
+        assert data["user_id"] == user.external_id
+        assert data["id"] == ConversionModel.objects.get().id
+
+        response = self.get(user.external_id)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == [data]
+
+        response = self.get(user.external_id, {"limit": 1})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == {"results": [data], "next": None}
+        assert self.get(user.external_id, {"cursor": "x"}).status_code == 400
+
+        response = self.get(user.external_id, {"stream": "true"})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.streaming
+
+        async def content():
+            return b"".join([chunk async for chunk in response.streaming_content])
+
+        assert json.loads(async_to_sync(content)()) == [data]
+
+        response = async_to_sync(AsyncClient().get)(
+            reverse("async-conversions-user-list", args=[user.external_id]),
+            headers={"If-None-Match": self.get(user.external_id)["ETag"]},
+        )
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    @pytest.mark.parametrize(
+        "payload_update, expected_status",
+        [
+            ({"amount": None}, status.HTTP_400_BAD_REQUEST),
+            ({"to_currency": "YYY"}, status.HTTP_400_BAD_REQUEST),
+            ({"user_id": "123"}, status.HTTP_403_FORBIDDEN),
+        ],
+    )
+    @patch.object(
+        AsyncExchangeRatesAPI, "get_latest_rates", return_value=MOCK_EXCHANGE_RATES
+    )
+    def test_invalid_request_expect_exception_status(
+        self, mocked_get_latest_rates, payload_update, expected_status, user
+    ):
+        payload = {
+            "from_currency": "EUR",
+            "to_currency": "USD",
+            "amount": 100,
+            "user_id": user.external_id,
+        }
+        payload.update(payload_update)
+        assert self.post(payload).status_code == expected_status
+
+    @patch.object(
+        AsyncExchangeRatesAPI,
+        "get_latest_rates",
+        return_value=MOCK_ERROR_EXCHANGE_RATES,
+    )
+    def test_failed_response_expect_exception_status_500(
+        self, mocked_get_latest_rates, user
+    ):
+        response = self.post(
+            {
+                "from_currency": "EUR",
+                "to_currency": "USD",
+                "amount": 100,
+                "user_id": user.external_id,
+            }
+        )
+        assert response.status_code == status.HTTP_500_INTERNAL_SERVER_ERROR
+        assert (
+            response.json()["detail"]
+            == f"{MOCK_ERROR_EXCHANGE_RATES['error']['code']}: {MOCK_ERROR_EXCHANGE_RATES['error']['info']}"
+        )
+
+    def test_user_does_not_exist_expect_exception_status_403(self, user):
+        assert self.get("123").status_code == status.HTTP_403_FORBIDDEN
+
+    @pytest.mark.django_db(transaction=True)
+    @patch.object(
+        AsyncExchangeRatesAPI, "get_latest_rates", return_value=MOCK_EXCHANGE_RATES
+    )
+    def test_user_deleted_by_another_process_expect_exception_status_403(
+        self, mocked_get_latest_rates, user
+    ):
+        user_id_resolver.resolve(user.external_id)
+        with patch.object(user_id_resolver, "invalidate"):
+            user.delete()
+
+        response = self.post(
+            {
+                "from_currency": "EUR",
+                "to_currency": "USD",
+                "amount": 100,
+                "user_id": user.external_id,
+            }
+        )
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+        assert user_id_resolver.resolve(user.external_id) is None
+
+    def test_throttling_expect_error_429(self, user):
+        for request_num in range(101):
+            response = self.get(user.external_id)
+            if request_num == 100:
+                assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+                assert "Retry-After" in response
+            else:
+                assert response.status_code == status.HTTP_200_OK
+
+    def test_throttled_by_sync_views_expect_error_429(self, client, user):
+        for _ in range(100):
+            client.get(reverse("conversions-user-list", args=[user.external_id]))
+        assert self.get(user.external_id).status_code == (
+            status.HTTP_429_TOO_MANY_REQUESTS
+        )
+
+
+@pytest.mark.django_db()
+class TestFastSerialization:
+    @pytest.fixture(autouse=True)
+    def disable_throttling(self):
+        views = (CreateConversionView, GetUserConversionsView)
+        throttle_classes = [view.throttle_classes for view in views]
+        for view in views:
+            view.throttle_classes = ()
+        yield
+        for view, view_throttle_classes in zip(views, throttle_classes):
+            view.throttle_classes = view_throttle_classes
+
+    def post_content(self, client, settings, payload, fast):
+        settings.CONVERSION_FAST_SERIALIZATION = fast
+        response = client.post(
+            reverse("conversion-create"), payload, content_type="application/json"
+        )
+        if response.status_code != status.HTTP_201_CREATED:
+            return response.status_code, response.content
+        # ids aside, as every request creates a conversion
+        return response.status_code, response.content.replace(
+            b'"id":%d' % response.json()["id"], b'"id":0'
+        )
+
+    @pytest.mark.parametrize(
+        "payload_update",
+        [
+            {},
+            {"amount": "0.5"},
+            {"amount": None},
+            {"amount": 1000},
+            {"from_currency": ""},
+            {"to_currency": "YYY"},
+            {"user_id": "123"},
+        ],
+    )
+    @freeze_time("2024-06-02 15:57:01")
+    @patch.object(
+        ExchangeRatesAPI, "get_latest_rates", return_value=MOCK_EXCHANGE_RATES
+    )
+    def test_create_expect_same_response_as_serializers(
+        self,
+        mocked_get_latest_rates,
+        client,
+        user,
+        settings,
+        teardown_conversions,
+        payload_update,
+    ):
+        payload = {
+            "from_currency": "EUR",
+            "to_currency": "USD",
+            "amount": 100,
+            "user_id": user.external_id,
+            **payload_update,
+        }
+        assert self.post_content(
+            client, settings, payload, fast=True
+        ) == self.post_content(client, settings, payload, fast=False)
+
+    @pytest.mark.parametrize("params", [{}, {"limit": 1}, {"stream": "true"}])
+    @patch.object(
+        ExchangeRatesAPI, "get_latest_rates", return_value=MOCK_EXCHANGE_RATES
+    )
+    def test_list_expect_same_response_as_serializers(
+        self,
+        mocked_get_latest_rates,
+        client,
+        user,
+        settings,
+        teardown_conversions,
+        params,
+    ):
+        for amount in (1, 22.5, 333):
+            client.post(
+                reverse("conversion-create"),
+                {
+                    "from_currency": "BRL",
+                    "to_currency": "GBP",
+                    "amount": amount,
+                    "user_id": user.external_id,
+                },
+                content_type="application/json",
+            )
+
+        def content(fast):
+            settings.CONVERSION_FAST_SERIALIZATION = fast
+            response = client.get(
+                reverse("conversions-user-list", args=[user.external_id]), params
+            )
+            if response.streaming:
+                return b"".join(response.streaming_content)
+            return response.content
+
+        assert content(fast=True) == content(fast=False)
+
+
+@pytest.mark.django_db()
+class TestReplicaRouting:
+    def get(self, client, user_id, asynchronous):
+        if asynchronous:
+            return async_to_sync(AsyncClient().get)(
+                reverse("async-conversions-user-list", args=[user_id])
+            )
+        return client.get(reverse("conversions-user-list", args=[user_id]))
+
+    @pytest.mark.parametrize("asynchronous", [False, True])
+    def test_history_expect_read_from_replica(
+        self, client, user, replica, teardown_conversions, asynchronous
+    ):
+        ConversionModel.objects.create(
+            user=user,
+            from_currency="EUR",
+            from_amount=100,
+            to_currency="USD",
+            to_amount=108.40,
+            rate=1.2,
+            rates_timestamp=datetime.datetime.now(timezone("UTC")),
+        )
+
+        response = self.get(client, user.external_id, asynchronous)
+        assert response.status_code == status.HTTP_200_OK
+        # the replica was copied before the conversion was written
+        assert response.json() == []
+
+    @pytest.mark.parametrize("asynchronous", [False, True])
+    @patch.object(
+        ExchangeRatesAPI, "get_latest_rates", return_value=MOCK_EXCHANGE_RATES
+    )
+    @patch.object(
+        AsyncExchangeRatesAPI, "get_latest_rates", return_value=MOCK_EXCHANGE_RATES
+    )
+    def test_user_just_converted_expect_history_read_from_primary(
+        self, _, __, client, user, replica, teardown_conversions, asynchronous
+    ):
+        payload = {
+            "from_currency": "EUR",
+            "to_currency": "USD",
+            "amount": 100,
+            "user_id": user.external_id,
+        }
+        url = reverse(
+            "async-conversion-create" if asynchronous else "conversion-create"
+        )
+        if asynchronous:
+            response = async_to_sync(AsyncClient().post)(
+                url, payload, content_type="application/json"
+            )
+        else:
+            response = client.post(url, payload, content_type="application/json")
+        assert response.status_code == status.HTTP_201_CREATED
+
+        response = self.get(client, user.external_id, asynchronous)
+        assert [conversion["id"] for conversion in response.json()] == [
+            ConversionModel.objects.using("default").get().id
+        ]
+
+        cache.delete(pin_key(user.external_id))
+        assert self.get(client, user.external_id, asynchronous).json() == []
+
+
+@pytest.mark.django_db()
+@freeze_time("2024-05-31 10:00:00")
+@patch.object(ExchangeRatesAPI, "revalidate_in_background")
+@patch.object(
+    RatesHttpClient,
+    "get_json",
+    side_effect=ConversionRateServiceUnavailableException("down"),
+)
+class TestStaleRates:
+    payload = {"from_currency": "EUR", "to_currency": "USD", "amount": 100}
+
+    @pytest.fixture(autouse=True)
+    def disable_throttling(self):
+        throttling_clases = CreateConversionView.throttle_classes
+        CreateConversionView.throttle_classes = ()
+        yield
+        CreateConversionView.throttle_classes = throttling_clases
+
+    def test_upstream_down_without_last_known_rates_expect_error(
+        self, _, __, client, user
+    ):
+        response = client.post(
+            reverse("conversion-create"),
+            {**self.payload, "user_id": user.external_id},
+            content_type="application/json",
+        )
+        assert response.status_code == status.HTTP_502_BAD_GATEWAY
+
+    @pytest.mark.parametrize("url", ["conversion-create", "async-conversion-create"])
+    def test_upstream_down_expect_last_known_rates_flagged_stale(
+        self, _, __, client, user, teardown_conversions, url
+    ):
+        last_known_rates.set(MOCK_EXCHANGE_RATES)
+        response = client.post(
+            reverse(url),
+            {**self.payload, "user_id": user.external_id},
+            content_type="application/json",
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response[RATES_STALE_HEADER] == "true"
+        data = response.json()
+        assert data["to_amount"] == "108.40"
+        assert data["rates_timestamp"] == "2024-05-30 18:29:04 UTC+0000"
+
+    def test_batch_upstream_down_expect_last_known_rates_flagged_stale(
+        self, _, __, client, user, teardown_conversions
+    ):
+        last_known_rates.set(MOCK_EXCHANGE_RATES)
+        response = client.post(
+            reverse("conversion-batch-create"),
+            {"user_id": user.external_id, "conversions": [self.payload]},
+            content_type="application/json",
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response[RATES_STALE_HEADER] == "true"
+
+    def test_fresh_rates_expect_no_stale_header(
+        self, mocked_get, _, client, user, teardown_conversions
+    ):
+        mocked_get.side_effect = None
+        mocked_get.return_value = {**MOCK_EXCHANGE_RATES, "date": "2024-05-31"}
+        response = client.post(
+            reverse("conversion-create"),
+            {**self.payload, "user_id": user.external_id},
+            content_type="application/json",
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+        assert RATES_STALE_HEADER not in response
+
+
+@pytest.mark.django_db()
+@freeze_time("2024-05-31 10:00:00")
+@patch.object(
+    RatesHttpClient,
+    "get_json",
+    return_value={**MOCK_EXCHANGE_RATES, "date": "2024-05-31"},
+)
+class TestIdempotencyKeys:
+    payload = {"from_currency": "EUR", "to_currency": "USD", "amount": 100}
+
+    @pytest.fixture(autouse=True)
+    def disable_throttling(self):
+        throttling_clases = CreateConversionView.throttle_classes
+        CreateConversionView.throttle_classes = ()
+        yield
+        CreateConversionView.throttle_classes = throttling_clases
+
+    def post(self, client, url, payload, key):
+        return client.post(
+            reverse(url),
+            payload,
+            content_type="application/json",
+            headers={IDEMPOTENCY_KEY_HEADER: key},
+        )
+
+    @pytest.mark.parametrize(
+        "url,view",
+        [
+            ("conversion-create", CreateConversionView),
+            ("async-conversion-create", AsyncCreateConversionView),
+        ],
+    )
+    def test_repeated_key_expect_first_response_without_converting_again(
+        self, mocked_get, client, user, teardown_conversions, url, view
+    ):
+        payload = {**self.payload, "user_id": user.external_id}
+        first = self.post(client, url, payload, "key-1")
+        with patch.object(view, "create") as create:
+            repeat = self.post(client, url, payload, "key-1")
+        create.assert_not_called()
+
+        assert first.status_code == repeat.status_code == status.HTTP_201_CREATED
+        assert repeat.json() == first.json()
+        assert IDEMPOTENT_REPLAYED_HEADER not in first
+        assert repeat[IDEMPOTENT_REPLAYED_HEADER] == "true"
+        assert mocked_get.call_count == 1
+        assert ConversionModel.objects.count() == 1
+
+    def test_other_key_expect_new_conversion(
+        self, _, client, user, teardown_conversions
+    ):
+        payload = {**self.payload, "user_id": user.external_id}
+        first = self.post(client, "conversion-create", payload, "key-1")
+        second = self.post(client, "conversion-create", payload, "key-2")
+        assert first.json()["id"] != second.json()["id"]
+        assert ConversionModel.objects.count() == 2
+
+    @pytest.mark.parametrize("url", ["conversion-create", "async-conversion-create"])
+    def test_key_reused_for_other_payload_expect_422(
+        self, _, client, user, teardown_conversions, url
+    ):
+        payload = {**self.payload, "user_id": user.external_id}
+        self.post(client, url, payload, "key-1")
+        response = self.post(client, url, {**payload, "amount": 50}, "key-1")
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+        assert ConversionModel.objects.count() == 1
+
+    @pytest.mark.parametrize("url", ["conversion-create", "async-conversion-create"])
+    def test_key_in_progress_expect_409(
+        self, _, client, user, teardown_conversions, url
+    ):
+        payload = {**self.payload, "user_id": user.external_id}
+        with patch.object(idempotency_store, "wait", 0):
+            cache.set(idempotency_store.lock_key(user.external_id, "key-1"), "")
+            response = self.post(client, url, payload, "key-1")
+        assert response.status_code == status.HTTP_409_CONFLICT
+        assert ConversionModel.objects.count() == 0
+
+    def test_failed_request_expect_not_stored(
+        self, mocked_get, client, user, teardown_conversions
+    ):
+        payload = {**self.payload, "user_id": user.external_id}
+        with patch.object(
+            RatesHttpClient,
+            "get_json",
+            side_effect=ConversionRateServiceUnavailableException("down"),
+        ):
+            failed = self.post(client, "conversion-create", payload, "key-1")
+        retried = self.post(client, "conversion-create", payload, "key-1")
+
+        assert failed.status_code == status.HTTP_502_BAD_GATEWAY
+        assert retried.status_code == status.HTTP_201_CREATED
+        assert IDEMPOTENT_REPLAYED_HEADER not in retried
+        assert ConversionModel.objects.count() == 1
+
+    @pytest.mark.parametrize("url", ["conversion-create", "async-conversion-create"])
+    @pytest.mark.parametrize("key", ["", "k" * 256])
+    def test_invalid_key_expect_400(self, _, client, user, url, key):
+        payload = {**self.payload, "user_id": user.external_id}
+        response = self.post(client, url, payload, key)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert IDEMPOTENCY_KEY_HEADER in response.json()
+
+
+@pytest.mark.django_db()
+@freeze_time("2024-05-31 10:00:00")
+@patch.object(
+    RatesHttpClient,
+    "get_json",
+    return_value={**MOCK_EXCHANGE_RATES, "date": "2024-05-31"},
+)
+class TestQuoteView:
+    query = {"from": "EUR", "to": "USD", "amount": "100"}
+
+    @pytest.fixture(autouse=True)
+    def disable_throttling(self):
+        throttling_clases = QuoteView.throttle_classes
+        QuoteView.throttle_classes = ()
+        yield
+        QuoteView.throttle_classes = throttling_clases
+
+    def test_quote_expect_conversion_without_writes(
+        self, _, client, django_assert_num_queries
+    ):
+        client.get(reverse("quote"), self.query)  # fetches and stores the rates
+
+        with django_assert_num_queries(0):
+            response = client.get(reverse("quote"), self.query)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == {
+            "from_currency": "EUR",
+            "to_currency": "USD",
+            "amount": "100.00",
+            "to_amount": "108.40",
+            "rate": "1.08",
+            "rates_timestamp": "2024-05-30 18:29:04 UTC+0000",
+        }
+        assert ConversionModel.objects.count() == 0
+
+    def test_quote_expect_cacheable_until_midnight(self, _, client):
+        response = client.get(reverse("quote"), self.query)
+        assert "public" in response["Cache-Control"]
+        assert "max-age=50400" in response["Cache-Control"]
+        assert response["Expires"] == "Sat, 01 Jun 2024 00:00:00 GMT"
+        assert RATES_STALE_HEADER not in response
+
+    def test_quote_from_last_known_rates_expect_not_cacheable(self, mocked_get, client):
+        mocked_get.side_effect = ConversionRateServiceUnavailableException("down")
+        last_known_rates.set(MOCK_EXCHANGE_RATES)
+        with patch.object(ExchangeRatesAPI, "revalidate_in_background"):
+            response = client.get(reverse("quote"), self.query)
+        assert response.status_code == status.HTTP_200_OK
+        assert response[RATES_STALE_HEADER] == "true"
+        assert response["Cache-Control"] == "no-cache"
+
+    def test_quote_from_previous_day_rates_expect_not_cacheable(
+        self, mocked_get, client
+    ):
+        rates_cache = ConversionRatesCacheService(MidnightCache())
+        rates_cache.save_rates("2024-05-30", MOCK_EXCHANGE_RATES)
+        # another process is fetching the day's rates
+        rates_cache.acquire_refresh_lock("2024-05-31")
+
+        response = client.get(reverse("quote"), self.query)
+        assert mocked_get.call_count == 0
+        assert response.status_code == status.HTTP_200_OK
+        assert response[RATES_STALE_HEADER] == "true"
+        assert response["Cache-Control"] == "no-cache"
+        assert "Expires" not in response
+
+    @pytest.mark.parametrize("missing", ["from", "to", "amount"])
+    def test_parameter_missing_expect_400(self, _, client, missing):
+        query = {**self.query}
+        query.pop(missing)
+        response = client.get(reverse("quote"), query)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert list(response.json()) == [missing]
+
+    def test_currency_not_found_expect_400(self, _, client):
+        response = client.get(reverse("quote"), {**self.query, "to": "YYY"})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert "detail" in response.json()
+
+    def test_upstream_error_expect_502(self, mocked_get, client):
+        mocked_get.side_effect = ConversionRateServiceUnavailableException("down")
+        response = client.get(reverse("quote"), self.query)
+        assert response.status_code == status.HTTP_502_BAD_GATEWAY
+
+
+@pytest.mark.django_db()
+@freeze_time("2024-05-31 10:00:00")
+@patch.object(
+    RatesHttpClient,
+    "get_json",
+    return_value={**MOCK_EXCHANGE_RATES, "date": "2024-05-31"},
+)
+class TestRatesTableViews:
+    @pytest.fixture(autouse=True)
+    def disable_throttling(self):
+        views = (RatesView, CurrenciesView)
+        throttle_classes = [view.throttle_classes for view in views]
+        for view in views:
+            view.throttle_classes = ()
+        yield
+        for view, view_throttle_classes in zip(views, throttle_classes):
+            view.throttle_classes = view_throttle_classes
+
+    def test_rates_expect_cached_table(self, mocked_get, client):
+        client.get(reverse("rates"))
+        response = client.get(reverse("rates"))
+
+        assert response.status_code == status.HTTP_200_OK
+        assert mocked_get.call_count == 1
+        assert response.json() == {
+            "base": "EUR",
+            "date": "2024-05-31",
+            "timestamp": 1717093744,
+            "rates": MOCK_EXCHANGE_RATES["rates"],
+        }
+        assert response["ETag"] == '"EUR-1717093744-json"'
+        assert "max-age=50400" in response["Cache-Control"]
+
+    def test_currencies_expect_sorted_codes(self, _, client):
+        response = client.get(reverse("currencies"))
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["currencies"] == sorted(MOCK_EXCHANGE_RATES["rates"])
+
+    @pytest.mark.parametrize("query", [{"format": "bin"}, {}])
+    def test_rates_binary_expect_compact_table(self, _, client, query):
+        headers = {} if query else {"Accept": "application/octet-stream"}
+        response = client.get(reverse("rates"), query, headers=headers)
+        json_response = client.get(reverse("rates"))
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response["Content-Type"] == "application/octet-stream"
+        assert response["ETag"] == '"EUR-1717093744-bin"'
+        assert decode_rates_table(response.content) == {
+            "base": "EUR",
+            "timestamp": 1717093744,
+            "rates": MOCK_EXCHANGE_RATES["rates"],
+        }
+        assert len(response.content) < len(json_response.content) * 0.7
+
+    def test_currencies_binary_expect_codes(self, _, client):
+        response = client.get(reverse("currencies"), {"format": "bin"})
+        assert decode_currencies(response.content)["currencies"] == sorted(
+            MOCK_EXCHANGE_RATES["rates"]
+        )
+
+    @pytest.mark.parametrize("url", ["rates", "currencies"])
+    def test_etag_matches_expect_304(self, mocked_get, client, url):
+        etag = client.get(reverse(url))["ETag"]
+        response = client.get(reverse(url), headers={"If-None-Match": etag})
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert response["ETag"] == etag
+        assert response.content == b""
+
+    def test_etag_of_previous_rates_expect_new_table(self, mocked_get, client):
+        response = client.get(
+            reverse("rates"), headers={"If-None-Match": '"EUR-1717000000-json"'}
+        )
+        assert response.status_code == status.HTTP_200_OK
+
+    def test_upstream_error_binary_expect_json_error(self, mocked_get, client):
+        mocked_get.side_effect = ConversionRateServiceUnavailableException("down")
+        response = client.get(reverse("rates"), {"format": "bin"})
+        assert response.status_code == status.HTTP_502_BAD_GATEWAY
+        assert response.json() == {"detail": "down"}
+
+    def test_last_known_rates_expect_stale_not_cacheable(self, mocked_get, client):
+        mocked_get.side_effect = ConversionRateServiceUnavailableException("down")
+        last_known_rates.set(MOCK_EXCHANGE_RATES)
+        with patch.object(ExchangeRatesAPI, "revalidate_in_background"):
+            response = client.get(reverse("rates"))
+        assert response.status_code == status.HTTP_200_OK
+        assert response[RATES_STALE_HEADER] == "true"
+        assert response["Cache-Control"] == "no-cache"
+        assert "stale" not in response.json()
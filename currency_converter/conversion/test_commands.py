@@ -0,0 +1,183 @@
+from io import StringIO
+from unittest.mock import patch
+
+import pytest
+from django.core.management import CommandError, call_command
+from freezegun import freeze_time
+
+from conversion.api import CreateConversionView, GetUserConversionsView, QuoteView
+from conversion.load_test import LoadReport, Sample, parse_mix, percentile
+from conversion.management.commands.warm_rates import Command as WarmRatesCommand
+from conversion.models import RateSnapshot  # type: ignore
+from conversion.services import (
+    ConversionRatesCacheService,
+    ExchangeRatesAPI,
+    MidnightCache,
+    RatesHttpClient,
+    get_rates_cache,
+)
+from conversion.test_services import MOCK_ERROR_EXCHANGE_RATES, MOCK_EXCHANGE_RATES
+
+
+class TestWarmRatesCommand:
+    @pytest.mark.django_db()
+    @freeze_time("2024-05-30 12:00:00")
+    @patch.object(RatesHttpClient, "get_json", return_value=MOCK_EXCHANGE_RATES)
+    def test_warm_expect_todays_rates_cached(self, mocked_get):
+        call_command("warm_rates", stdout=StringIO())
+        assert mocked_get.call_count == 1
+        assert MidnightCache().get("2024-05-30") == MOCK_EXCHANGE_RATES
+        assert MidnightCache().get("2024-05-31") is None
+        assert RateSnapshot.objects.get().to_rates() == MOCK_EXCHANGE_RATES
+
+    @pytest.mark.django_db()
+    @freeze_time("2024-05-30 23:55:00")
+    @patch.object(RatesHttpClient, "get_json", return_value=MOCK_EXCHANGE_RATES)
+    def test_warm_close_to_midnight_expect_tomorrows_rates_cached(self, mocked_get):
+        call_command("warm_rates", "--ahead", "600", stdout=StringIO())
+        assert mocked_get.call_count == 1
+        assert MidnightCache().get("2024-05-30") == MOCK_EXCHANGE_RATES
+        assert MidnightCache().get("2024-05-31") == MOCK_EXCHANGE_RATES
+
+    @pytest.mark.django_db()
+    def test_warm_close_to_midnight_expect_tomorrows_key_refreshed_after_it(
+        self, settings
+    ):
+        settings.RATES_CACHE_TTL_JITTER = 0
+        todays_rates = {**MOCK_EXCHANGE_RATES, "date": "2024-05-31"}
+        service = ExchangeRatesAPI(ConversionRatesCacheService(get_rates_cache()))
+
+        with patch.object(
+            RatesHttpClient, "get_json", return_value=MOCK_EXCHANGE_RATES
+        ):
+            with freeze_time("2024-05-30 23:55:00"):
+                # a one-shot run, e.g. WARM_RATES_ON_BOOT
+                call_command("warm_rates", stdout=StringIO())
+            with freeze_time("2024-05-31 00:00:01"):
+                assert service.get_latest_rates() == MOCK_EXCHANGE_RATES
+
+        with patch.object(RatesHttpClient, "get_json", return_value=todays_rates):
+            with freeze_time("2024-05-31 00:00:02"):
+                # the next run of warm_rates --loop, in its own process
+                warmer = ExchangeRatesAPI(ConversionRatesCacheService(MidnightCache()))
+                warmer.warm_rates()
+            # the in-memory tier keeps entries for RATES_WARM_INTERVAL at most
+            with freeze_time("2024-05-31 01:00:02"):
+                assert service.get_latest_rates() == todays_rates
+
+    @pytest.mark.django_db()
+    def test_warm_close_to_midnight_without_refresh_expect_new_day_fetched(
+        self, settings
+    ):
+        settings.RATES_CACHE_TTL_JITTER = 0
+        todays_rates = {**MOCK_EXCHANGE_RATES, "date": "2024-05-31"}
+        service = ExchangeRatesAPI(ConversionRatesCacheService(get_rates_cache()))
+
+        with patch.object(
+            RatesHttpClient, "get_json", return_value=MOCK_EXCHANGE_RATES
+        ):
+            with freeze_time("2024-05-30 23:55:00"):
+                call_command("warm_rates", stdout=StringIO())
+
+        with patch.object(
+            RatesHttpClient, "get_json", return_value=todays_rates
+        ) as mocked_get:
+            with freeze_time("2024-05-31 00:30:00"):
+                assert service.get_latest_rates() == MOCK_EXCHANGE_RATES
+            with freeze_time("2024-05-31 01:00:01"):
+                assert service.get_latest_rates() == todays_rates
+        assert mocked_get.call_count == 1
+
+    @freeze_time("2024-05-30 12:00:00")
+    @patch.object(RatesHttpClient, "get_json", return_value=MOCK_ERROR_EXCHANGE_RATES)
+    def test_upstream_error_expect_command_error_and_nothing_cached(self, mocked_get):
+        with pytest.raises(CommandError):
+            call_command("warm_rates", stdout=StringIO())
+        assert MidnightCache().get("2024-05-30") is None
+
+    @pytest.mark.parametrize(
+        "now, interval, ahead, expected",
+        [
+            ("2024-05-30 12:00:00", 3600, 600, 3600),
+            ("2024-05-30 23:00:00", 3600, 600, 3000),
+            ("2024-05-30 23:55:00", 3600, 600, 301),
+        ],
+    )
+    def test_seconds_until_next_run(self, now, interval, ahead, expected):
+        with freeze_time(now):
+            assert (
+                WarmRatesCommand().seconds_until_next_run(interval, ahead) == expected
+            )
+
+
+class TestLoadTestCommand:
+    @pytest.fixture
+    def disable_throttling(self):
+        views = [CreateConversionView, GetUserConversionsView, QuoteView]
+        throttle_classes = [view.throttle_classes for view in views]
+        for view in views:
+            view.throttle_classes = ()
+        yield
+        for view, classes in zip(views, throttle_classes):
+            view.throttle_classes = classes
+
+    @pytest.mark.django_db(transaction=True)
+    def test_load_test_expect_report_per_endpoint(
+        self, live_server, rates_stub, disable_throttling
+    ):
+        stdout = StringIO()
+        with patch.object(ExchangeRatesAPI, "url", rates_stub.url):
+            call_command(
+                "load_test",
+                "--url",
+                live_server.url,
+                "--mix",
+                "create=2,history=1,quote=1",
+                # the live server's threads share an in-memory SQLite database, which
+                # locks its tables against concurrent writers
+                "--concurrency",
+                "1",
+                "--requests",
+                "40",
+                "--users",
+                "2",
+                stdout=stdout,
+            )
+
+        lines = stdout.getvalue().splitlines()
+        rows = {line.split()[0]: line.split()[1:] for line in lines[2:-1]}
+        assert set(rows) == {"create", "history", "quote"}
+        assert sum(int(row[0]) for row in rows.values()) == 40
+        assert all(row[1] == "0" for row in rows.values())  # no errors
+        assert rates_stub.requests_count == 1
+        assert lines[-1].startswith("40 requests in ")
+
+    def test_unknown_endpoint_in_mix_expect_command_error(self):
+        with pytest.raises(CommandError):
+            call_command("load_test", "--mix", "create=1,delete=1", stdout=StringIO())
+
+    def test_parse_mix(self):
+        assert parse_mix("create=8, history=2,quote") == {
+            "create": 8,
+            "history": 2,
+            "quote": 1,
+        }
+
+    @pytest.mark.parametrize(
+        "q, expected", [(50, 50), (95, 95), (99, 99), (100, 100), (1, 1)]
+    )
+    def test_percentile(self, q, expected):
+        assert percentile([float(i) for i in range(1, 101)], q) == expected
+
+    def test_report_stats(self):
+        report = LoadReport(
+            seconds=2,
+            samples=[Sample("create", 0.01 * i, 201) for i in range(1, 11)]
+            + [Sample("create", 1, 0), Sample("history", 0.5, 500)],
+        )
+        create, history = report.stats()
+        assert (create.endpoint, create.count, create.errors) == ("create", 11, 1)
+        assert create.throughput == 5.5
+        assert create.p50_ms == 60
+        assert create.p99_ms == 1000
+        assert (history.count, history.errors) == (1, 1)
@@ -0,0 +1,150 @@
+import datetime
+from decimal import Decimal
+
+import pytest
+import pytz  # type: ignore
+from django.utils import timezone
+
+from conversion.api import (  # type: ignore
+    ConversionItemSerializer,
+    ConversionRequestSerializer,
+    ConversionResponseSerializer,
+    format_conversion,
+)
+from conversion.domain import Conversion, ConversionRequest, ConversionResponse
+from conversion.fast_serializers import (
+    conversion_representation,
+    parse_conversion_item,
+    parse_conversion_request,
+)
+
+VALID_REQUEST = {
+    "from_currency": "EUR",
+    "to_currency": "USD",
+    "amount": 100,
+    "user_id": "user_3aemZNca2qnvRZhwP8qbL3",
+}
+
+
+def make_conversion(amount, converted_amount, rate, rates_timestamp, created_at):
+    return Conversion(
+        id=1,
+        user_id="user_3aemZNca2qnvRZhwP8qbL3",
+        request=ConversionRequest(
+            from_currency="EUR", to_currency="USD", amount=amount
+        ),
+        response=ConversionResponse(
+            converted_amount=converted_amount,
+            rate=rate,
+            rates_timestamp=rates_timestamp,
+            created_at=created_at,
+        ),
+    )
+
+
+class TestParseConversionRequest:
+    @pytest.mark.parametrize(
+        "update",
+        [
+            {},
+            {"amount": "100"},
+            {"amount": " 5.5 "},
+            {"amount": 999.99},
+            {"amount": -0.01},
+            {"amount": "000.10"},
+            {"from_currency": " eur "},
+        ],
+    )
+    def test_valid_expect_same_validated_data_as_serializer(self, update):
+        data = {**VALID_REQUEST, **update}
+        serializer = ConversionRequestSerializer(data=data)
+        assert serializer.is_valid()
+
+        validated_data = parse_conversion_request(data)
+        assert validated_data == dict(serializer.validated_data)
+        assert str(validated_data["amount"]) == str(serializer.validated_data["amount"])
+
+    @pytest.mark.parametrize(
+        "update",
+        [
+            {"amount": None},
+            {"amount": True},
+            {"amount": "1000"},
+            {"amount": "1.001"},
+            {"amount": "1e2"},
+            {"amount": "NaN"},
+            {"amount": "１００"},
+            {"from_currency": ""},
+            {"from_currency": "EURO"},
+            {"to_currency": 123},
+            {"user_id": " "},
+            {"user_id": "user\x00"},
+            {"user_id": None},
+        ],
+    )
+    def test_not_plainly_valid_expect_left_to_serializer(self, update):
+        assert parse_conversion_request({**VALID_REQUEST, **update}) is None
+
+    def test_missing_field_expect_left_to_serializer(self):
+        for field in VALID_REQUEST:
+            data = {k: v for k, v in VALID_REQUEST.items() if k != field}
+            assert parse_conversion_request(data) is None
+
+    def test_item_expect_same_validated_data_as_serializer(self):
+        data = {"from_currency": "EUR", "to_currency": "BRL", "amount": "12.3"}
+        serializer = ConversionItemSerializer(data=data)
+        assert serializer.is_valid()
+        assert parse_conversion_item(data) == dict(serializer.validated_data)
+
+
+class TestConversionRepresentation:
+    @pytest.mark.parametrize(
+        "amount, converted_amount, rate",
+        [
+            (Decimal("100"), Decimal("108.3952"), Decimal("1.083952")),
+            (Decimal("0.5"), Decimal("0.005"), Decimal("0.015")),
+            (Decimal("-1.25"), Decimal("-1.255"), Decimal("2")),
+            (100, 108.4, 1.2),
+        ],
+    )
+    def test_expect_same_data_as_serializer(self, amount, converted_amount, rate):
+        conversion = make_conversion(
+            amount,
+            converted_amount,
+            rate,
+            datetime.datetime(2024, 6, 2, 15, 56, 58, tzinfo=datetime.timezone.utc),
+            datetime.datetime(2024, 6, 2, 15, 57, 1, 123456, tzinfo=pytz.UTC),
+        )
+        assert conversion_representation(conversion) == dict(
+            ConversionResponseSerializer(format_conversion(conversion)).data
+        )
+
+    @pytest.mark.parametrize(
+        "current_timezone, created_at",
+        [
+            ("UTC", datetime.datetime(2024, 6, 2, 15, 57, 1)),
+            (
+                "America/Sao_Paulo",
+                datetime.datetime(2024, 6, 2, 15, 57, 1, tzinfo=datetime.UTC),
+            ),
+            (
+                "Asia/Kolkata",
+                datetime.datetime(2024, 12, 31, 23, 59, 59, tzinfo=datetime.UTC),
+            ),
+            ("Europe/Lisbon", None),
+        ],
+    )
+    def test_timezones_expect_same_data_as_serializer(
+        self, current_timezone, created_at
+    ):
+        conversion = make_conversion(
+            Decimal("1"),
+            Decimal("1"),
+            Decimal("1"),
+            datetime.datetime(2024, 3, 31, 1, 30, tzinfo=datetime.UTC),
+            created_at,
+        )
+        with timezone.override(current_timezone):
+            assert conversion_representation(conversion) == dict(
+                ConversionResponseSerializer(format_conversion(conversion)).data
+            )
@@ -1,27 +1,55 @@
 # Create your tests here.
 from decimal import Decimal
+from asgiref.sync import async_to_sync
 from freezegun import freeze_time
 import pytest
+import asyncio
 import datetime
+import json
+import threading
+import time
+from typing import Any
 from unittest.mock import patch
 
 import pytz  # type: ignore
+from django.apps import apps
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, connections
 
 from conversion.domain import Conversion, ConversionRequest, ConversionResponse
 from conversion.exceptions import (
     ConversionRateServiceException,
+    ConversionRateServiceTimeoutException,
+    ConversionRateServiceUnavailableException,
     CurrencyNotFoundException,
+    IdempotencyKeyInProgressException,
+    IdempotencyKeyReusedException,
 )
 from conversion.services import (
+    AsyncExchangeRatesAPI,
     ConversionDbService,
+    ConversionHistoryCache,
+    ConversionRatesCacheService,
+    ConversionWriteBuffer,
     ExchangeRatesAPI,
+    IdempotencyStore,
+    LocalMemoryCache,
     MidnightCache,
-    requests,
+    RatesHttpClient,
+    RateSnapshotDbService,
+    RatesMatrix,
+    conversion_history_cache,
+    last_known_rates,
+    seconds_until_midnight,
 )
 from conversion.models import Conversion as ConversionModel  # type: ignore
+from conversion.codec import decode_rates, encode_rates
+from conversion.models import RateSnapshot  # type: ignore
+from devtools.upstream_stub import DEFAULT_ERROR, DEFAULT_RATES
 
 
-MOCK_EXCHANGE_RATES = {
+MOCK_EXCHANGE_RATES: dict[str, Any] = {
     "success": True,
     "timestamp": 1717093744,
     "base": "EUR",
@@ -217,6 +245,12 @@ class MockedConversionRatesCacheService:
     def save_rates(self, *args, **kwargs):
         pass
 
+    def acquire_refresh_lock(self, *args, **kwargs):
+        return True
+
+    def release_refresh_lock(self, *args, **kwargs):
+        pass
+
 
 class TestExchangeRatesAPI:
     @patch.object(
@@ -332,6 +366,37 @@ class TestExchangeRatesAPI:
         assert conversion.rate == final_rate
         assert conversion.converted_amount == amount * final_rate
 
+    @patch.object(
+        ExchangeRatesAPI, "get_latest_rates", return_value=MOCK_EXCHANGE_RATES
+    )
+    def test_many_conversions_expect_rates_loaded_once_and_errors_in_place(
+        self, mocked_get_latest_rates
+    ):
+        service = ExchangeRatesAPI(MockedConversionRatesCacheService())
+        conversions = service.get_conversions_from(
+            [
+                ConversionRequest("EUR", "USD", Decimal(10)),
+                ConversionRequest("EUR", "INVALID", Decimal(10)),
+                ConversionRequest("USD", "BRL", Decimal(10)),
+            ]
+        )
+        assert mocked_get_latest_rates.call_count == 1
+        assert conversions[0].rate == MOCK_EXCHANGE_RATES["rates"]["USD"]
+        assert isinstance(conversions[1], CurrencyNotFoundException)
+        assert conversions[2].rate == Decimal(
+            MOCK_EXCHANGE_RATES["rates"]["BRL"]
+        ) / Decimal(MOCK_EXCHANGE_RATES["rates"]["USD"])
+
+    @patch.object(
+        ExchangeRatesAPI, "get_latest_rates", return_value=MOCK_ERROR_EXCHANGE_RATES
+    )
+    def test_many_conversions_error_response_expect_exception(
+        self, mocked_get_latest_rates
+    ):
+        service = ExchangeRatesAPI(MockedConversionRatesCacheService())
+        with pytest.raises(ConversionRateServiceException):
+            service.get_conversions_from([ConversionRequest("EUR", "USD", Decimal(1))])
+
     def test_get_datetime_from_timestamp(self):
         timestamp = MOCK_EXCHANGE_RATES["timestamp"]
         expected_datetime = "2024-05-30 18:29:04+00:00"
@@ -348,7 +413,7 @@ class TestExchangeRatesAPI:
             == ExchangeRatesAPI(MockedConversionRatesCacheService()).todays_key
         )
 
-    @patch.object(requests, "get")
+    @patch.object(RatesHttpClient, "get_json")
     @patch.object(MockedConversionRatesCacheService, "save_rates")
     @patch.object(
         MockedConversionRatesCacheService, "get_rates", return_value=MOCK_EXCHANGE_RATES
@@ -360,7 +425,7 @@ class TestExchangeRatesAPI:
         assert mocked_cache_set.call_count == 0
         assert mocked_get.call_count == 0
 
-    @patch.object(requests, "get")
+    @patch.object(RatesHttpClient, "get_json")
     @patch.object(MockedConversionRatesCacheService, "save_rates")
     @patch.object(MockedConversionRatesCacheService, "get_rates", return_value=None)
     def test_get_latest_rates_expect_fetch_rates(
@@ -412,6 +477,36 @@ class TestConversionDbService:
         conversions = service.listByUser(user_id=other_user.external_id)
         assert len(conversions) == 1
 
+    @pytest.mark.parametrize("num_of_conversions", [1_000, 10_000])
+    def test_list_by_user_expect_a_single_query(
+        self, user, teardown_conversions, django_assert_num_queries, num_of_conversions
+    ):
+        rates_timestamp = datetime.datetime.now(tz=datetime.timezone.utc)
+        ConversionModel.objects.bulk_create(
+            ConversionModel(
+                user=user,
+                from_currency="USD",
+                from_amount=Decimal("100.00"),
+                to_currency="EUR",
+                to_amount=Decimal("92.25"),
+                rate=Decimal("0.92"),
+                rates_timestamp=rates_timestamp,
+            )
+            for _ in range(num_of_conversions)
+        )
+
+        service = ConversionDbService()
+        with django_assert_num_queries(1):
+            conversions = service.listByUser(user_id=user.external_id)
+        assert len(conversions) == num_of_conversions
+
+        with django_assert_num_queries(1):
+            conversions = service.listByUser(user_id=user.external_id, user_pk=user.pk)
+        assert len(conversions) == num_of_conversions
+        assert conversions[0].user_id == user.external_id
+        assert conversions[0].request.amount == Decimal("100.00")
+        assert conversions[0].response.rates_timestamp == rates_timestamp
+
     def test_conversion_is_properly_created_expect_all_fields_properly_set(
         self, user, teardown_conversions
     ):
@@ -452,9 +547,872 @@ class TestConversionDbService:
             == conversion.response.rates_timestamp
         )
 
+    def test_bulk_create_expect_all_persisted_with_ids(
+        self, user, teardown_conversions
+    ):
+        conversions = [
+            Conversion(
+                user_id=user.external_id,
+                request=ConversionRequest(
+                    from_currency="EUR", to_currency="USD", amount=Decimal(amount)
+                ),
+                response=ConversionResponse(
+                    converted_amount=Decimal(amount),
+                    rate=Decimal(1.0),
+                    rates_timestamp=datetime.datetime.now(tz=pytz.UTC),
+                    created_at=datetime.datetime.now(tz=pytz.UTC),
+                ),
+            )
+            for amount in (1, 2, 3)
+        ]
+        created_conversions = ConversionDbService().bulk_create(
+            conversions, user_pk=user.pk
+        )
+        assert len({conversion.id for conversion in created_conversions}) == 3
+        assert all(conversion.id for conversion in created_conversions)
+        assert ConversionModel.objects.filter(user=user).count() == 3
+
+
+def make_conversion(user_id: str, amount: str = "10.00") -> Conversion:
+    return Conversion(
+        user_id=user_id,
+        request=ConversionRequest(
+            from_currency="EUR", to_currency="USD", amount=Decimal(amount)
+        ),
+        response=ConversionResponse(
+            converted_amount=Decimal("10.84"),
+            rate=Decimal("1.08"),
+            rates_timestamp=datetime.datetime.fromtimestamp(
+                MOCK_EXCHANGE_RATES["timestamp"], pytz.UTC
+            ),
+            created_at=None,  # type: ignore
+        ),
+    )
+
+
+@pytest.mark.django_db()
+class TestConversionWriteBuffer:
+    def test_reserve_ids_expect_skipped_by_inserts(self, user, teardown_conversions):
+        service = ConversionDbService()
+        first = service.create(make_conversion(user.external_id), user_pk=user.pk)
+
+        ids = service.reserve_ids(10)
+        assert list(ids) == list(range(first.id + 1, first.id + 11))
+        assert list(service.reserve_ids(5)) == list(range(first.id + 11, first.id + 16))
+
+        last = service.create(make_conversion(user.external_id), user_pk=user.pk)
+        assert last.id == first.id + 16
+
+    def test_reserve_ids_on_an_empty_table_expect_a_block(self):
+        assert len(ConversionDbService().reserve_ids(3)) == 3
+
+    def test_add_expect_queued_until_flushed(self, user, teardown_conversions):
+        buffer = ConversionWriteBuffer(max_rows=10, flush_interval=0, id_block_size=2)
+
+        conversions = [
+            buffer.add(make_conversion(user.external_id, amount), user.pk)
+            for amount in ("1.00", "2.00", "3.00")
+        ]
+        assert len({conversion.id for conversion in conversions}) == 3
+        assert all(conversion.response.created_at for conversion in conversions)
+        assert not ConversionModel.objects.exists()
+        assert len(buffer) == 3
+
+        assert buffer.flush() == 3
+        assert len(buffer) == 0
+        listed = ConversionDbService().listByUser(user_id=user.external_id)
+        assert [(c.id, c.request.amount, c.response.created_at) for c in listed] == [
+            (c.id, c.request.amount, c.response.created_at) for c in conversions
+        ]
+
+    def test_max_rows_expect_flushed_by_the_last_add(self, user, teardown_conversions):
+        buffer = ConversionWriteBuffer(max_rows=3, flush_interval=0)
+        for _ in range(4):
+            buffer.add(make_conversion(user.external_id), user.pk)
+        assert ConversionModel.objects.count() == 3
+        assert len(buffer) == 1
+        buffer.flush()
+
+    def test_failed_flush_expect_conversions_kept_for_the_next_one(
+        self, user, teardown_conversions
+    ):
+        buffer = ConversionWriteBuffer(max_rows=10, flush_interval=0)
+        buffer.add(make_conversion(user.external_id), user.pk)
+        with patch.object(
+            ConversionModel.objects, "bulk_create", side_effect=Exception("locked")
+        ):
+            assert buffer.flush() == 0
+        assert len(buffer) == 1
+
+        buffer.add(make_conversion(user.external_id), user.pk)
+        assert buffer.flush() == 2
+        assert ConversionModel.objects.count() == 2
+
+    def test_flush_expect_history_version_bumped(self, user, teardown_conversions):
+        buffer = ConversionWriteBuffer(max_rows=10, flush_interval=0)
+        version = conversion_history_cache.version(user.pk)
+        buffer.add(make_conversion(user.external_id), user.pk)
+        assert conversion_history_cache.version(user.pk) == version
+
+        buffer.flush()
+        assert conversion_history_cache.version(user.pk) == version + 1
+
+    @pytest.mark.parametrize(
+        "vendor, supported", [("sqlite", True), ("postgresql", False)]
+    )
+    def test_write_behind_on_other_backends_expect_refused_at_startup(
+        self, settings, vendor, supported
+    ):
+        settings.CONVERSION_WRITE_BEHIND = True
+        app_config = apps.get_app_config("conversion")
+        with patch.object(connections[DEFAULT_DB_ALIAS], "vendor", vendor):
+            if supported:
+                app_config.ready()
+            else:
+                with pytest.raises(ImproperlyConfigured, match="postgresql"):
+                    app_config.ready()
+
+    def test_write_behind_expect_create_queued(
+        self, user, teardown_conversions, settings, monkeypatch
+    ):
+        buffer = ConversionWriteBuffer(max_rows=10, flush_interval=0)
+        monkeypatch.setattr("conversion.services.conversion_write_buffer", buffer)
+        settings.CONVERSION_WRITE_BEHIND = True
+
+        created = ConversionDbService().create(make_conversion(user.external_id))
+        assert not ConversionModel.objects.exists()
+        buffer.flush()
+        assert ConversionModel.objects.get().id == created.id
+
+        created = async_to_sync(ConversionDbService().acreate)(
+            make_conversion(user.external_id), user.pk
+        )
+        assert len(buffer) == 1
+        buffer.flush()
+        assert ConversionModel.objects.filter(id=created.id).exists()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_write_buffer_conversion_of_a_deleted_user_expect_dropped_alone(
+    user, django_user_model
+):
+    # foreign keys are only checked on commit, so this test commits
+    other_user = django_user_model.objects.create_user(
+        email="other@email.com", password="something"
+    )
+    buffer = ConversionWriteBuffer(max_rows=10, flush_interval=0)
+    buffer.add(make_conversion(user.external_id), user.pk)
+    buffer.add(make_conversion(other_user.external_id), other_user.pk)
+    other_user.delete()
+
+    assert buffer.flush() == 1
+    assert len(buffer) == 0
+    assert ConversionModel.objects.get().user_id == user.pk
+    ConversionModel.objects.all().delete()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_write_buffer_expect_flushed_periodically(user):
+    buffer = ConversionWriteBuffer(max_rows=10, flush_interval=0.05)
+    buffer.add(make_conversion(user.external_id), user.pk)
+
+    deadline = time.monotonic() + 5
+    while len(buffer) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    buffer.close()
+    assert ConversionModel.objects.count() == 1
+    ConversionModel.objects.all().delete()
+
 
 class TestMidnightCache:
     freeze_time("2024-05-30 23:00:00+00:00")
 
     def test_calculate_midnight_offset(self):
         MidnightCache().calculate_seconds_until_midnight() == 3600
+
+    def test_host_not_in_utc_expect_seconds_until_midnight_utc(self, settings):
+        # sets the process' local time zone, as on a host not running in UTC
+        settings.TIME_ZONE = "America/Sao_Paulo"
+        expected = 86400 - int(time.time()) % 86400
+        assert abs(seconds_until_midnight() - expected) <= 1
+
+
+class TestConversionHistoryCache:
+    @pytest.fixture(autouse=True)
+    def enabled(self, settings):
+        settings.CONVERSION_HISTORY_CACHE = True
+
+    def test_version_expect_started_from_the_clock_and_kept(self):
+        history_cache = ConversionHistoryCache()
+        version = history_cache.version(1)
+        assert version > time.time_ns() - 10**9
+        assert history_cache.version(1) == version
+        assert history_cache.version(2) != version
+
+    def test_bump_expect_responses_of_previous_version_unreachable(self):
+        history_cache = ConversionHistoryCache()
+        version = history_cache.version(1)
+        history_cache.set(1, version, "variant", b"[]")
+        assert history_cache.get(1, version, "variant") == b"[]"
+
+        history_cache.bump(1)
+        new_version = history_cache.version(1)
+        assert new_version == version + 1
+        assert history_cache.get(1, new_version, "variant") is None
+
+    def test_bump_without_version_expect_nothing_to_do(self):
+        ConversionHistoryCache().bump(1)
+        assert cache.get(ConversionHistoryCache().version_key(1)) is None
+
+    def test_disabled_expect_bumped_for_the_etags(self, settings):
+        settings.CONVERSION_HISTORY_CACHE = False
+        history_cache = ConversionHistoryCache()
+        version = history_cache.version(1)
+        history_cache.bump(1)
+        assert history_cache.version(1) == version + 1
+
+    def test_async_expect_same_as_sync(self):
+        history_cache = ConversionHistoryCache()
+
+        async def bumped():
+            version = await history_cache.aversion(1)
+            await history_cache.aset(1, version, "variant", b"[]")
+            assert await history_cache.aget(1, version, "variant") == b"[]"
+            await history_cache.abump(1)
+            return version, await history_cache.aversion(1)
+
+        version, new_version = async_to_sync(bumped)()
+        assert new_version == version + 1 == history_cache.version(1)
+
+
+class TestLocalMemoryCache:
+    class CountingCache:
+        def __init__(self):
+            self.data = {}
+            self.get_calls = 0
+
+        def set(self, key, value, timeout=300, version=None, past_midnight=0):
+            self.data[key] = value
+
+        def get(self, key, default=None, version=None):
+            self.get_calls += 1
+            return self.data.get(key, default)
+
+    def test_hit_expect_backend_not_used(self):
+        backend = self.CountingCache()
+        local_cache = LocalMemoryCache(backend)
+        local_cache.set("2024-05-30", MOCK_EXCHANGE_RATES)
+        assert local_cache.get("2024-05-30") is MOCK_EXCHANGE_RATES
+        assert backend.get_calls == 0
+
+    def test_miss_expect_filled_from_backend(self):
+        backend = self.CountingCache()
+        backend.set("2024-05-30", MOCK_EXCHANGE_RATES)
+        local_cache = LocalMemoryCache(backend)
+        local_cache.get("2024-05-30")
+        local_cache.get("2024-05-30")
+        assert backend.get_calls == 1
+
+    def test_backend_miss_expect_default_not_stored(self):
+        backend = self.CountingCache()
+        local_cache = LocalMemoryCache(backend)
+        assert local_cache.get("2024-05-30") is None
+        assert local_cache.get("2024-05-30") is None
+        assert backend.get_calls == 2
+
+    def test_max_entries_expect_oldest_key_evicted(self):
+        backend = self.CountingCache()
+        local_cache = LocalMemoryCache(backend, max_entries=2)
+        for key in ["2024-05-28", "2024-05-29", "2024-05-30"]:
+            local_cache.set(key, key)
+        local_cache.get("2024-05-28")
+        local_cache.get("2024-05-30")
+        assert backend.get_calls == 1
+
+    def test_entry_expires_at_midnight(self, settings):
+        settings.RATES_CACHE_TTL_JITTER = 0
+        backend = self.CountingCache()
+        local_cache = LocalMemoryCache(backend)
+        with freeze_time("2024-05-30 23:59:00"):
+            local_cache.set("2024-05-30", MOCK_EXCHANGE_RATES)
+            local_cache.get("2024-05-30")
+            assert backend.get_calls == 0
+        with freeze_time("2024-05-31 00:00:01"):
+            local_cache.get("2024-05-30")
+            assert backend.get_calls == 1
+
+    def test_entry_expires_after_max_age(self, settings):
+        settings.RATES_CACHE_TTL_JITTER = 0
+        backend = self.CountingCache()
+        backend.set("2024-05-30", MOCK_EXCHANGE_RATES)
+        local_cache = LocalMemoryCache(backend, max_age=3600)
+        with freeze_time("2024-05-30 10:00:00"):
+            local_cache.get("2024-05-30")
+        with freeze_time("2024-05-30 10:59:59"):
+            local_cache.get("2024-05-30")
+            assert backend.get_calls == 1
+        with freeze_time("2024-05-30 11:00:01"):
+            local_cache.get("2024-05-30")
+            assert backend.get_calls == 2
+
+
+class TestRatesRefreshSingleFlight:
+    class SlowUpstream:
+        def __init__(self, delay=0.2):
+            self.delay = delay
+            self.calls = 0
+            self._lock = threading.Lock()
+
+        def __call__(self, *args, **kwargs):
+            with self._lock:
+                self.calls += 1
+            time.sleep(self.delay)
+            return MOCK_EXCHANGE_RATES
+
+    def make_service(self, http_client=None):
+        return ExchangeRatesAPI(
+            ConversionRatesCacheService(MidnightCache()), http_client=http_client
+        )
+
+    def test_concurrent_misses_expect_single_upstream_call(self):
+        num_of_requests = 20
+        upstream = self.SlowUpstream()
+        barrier = threading.Barrier(num_of_requests)
+        results = []
+
+        def request_rates():
+            barrier.wait()
+            results.append(self.make_service().get_latest_rates())
+
+        with patch.object(RatesHttpClient, "get_json", side_effect=upstream):
+            threads = [
+                threading.Thread(target=request_rates) for _ in range(num_of_requests)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        assert upstream.calls == 1
+        assert len(results) == num_of_requests
+        assert all(result == MOCK_EXCHANGE_RATES for result in results)
+
+    def test_refresh_locked_by_other_process_expect_previous_day_rates(self):
+        service = self.make_service()
+        previous_rates = {**MOCK_EXCHANGE_RATES, "date": "2024-05-29"}
+        MidnightCache().set(service.previous_key, previous_rates)
+        service.cache_service.acquire_refresh_lock(service.todays_key)
+
+        with patch.object(RatesHttpClient, "get_json") as mocked_get:
+            assert service.get_latest_rates() == {**previous_rates, "stale": True}
+        assert mocked_get.call_count == 0
+
+    def test_refresh_locked_by_other_process_expect_wait_for_its_rates(self, settings):
+        settings.RATES_REFRESH_POLL_INTERVAL = 0.01
+        service = self.make_service()
+        service.cache_service.acquire_refresh_lock(service.todays_key)
+        other_process = threading.Timer(
+            0.05, MidnightCache().set, args=(service.todays_key, MOCK_EXCHANGE_RATES)
+        )
+        other_process.start()
+
+        with patch.object(RatesHttpClient, "get_json") as mocked_get:
+            assert service.get_latest_rates() == MOCK_EXCHANGE_RATES
+        assert mocked_get.call_count == 0
+
+    def test_refresh_lock_expired_expect_fetch_after_waiting(self, settings):
+        settings.RATES_REFRESH_LOCK_TIMEOUT = 1
+        settings.RATES_REFRESH_POLL_INTERVAL = 0.01
+        service = self.make_service()
+        service.cache_service.acquire_refresh_lock(service.todays_key)
+
+        with patch.object(
+            RatesHttpClient, "get_json", side_effect=self.SlowUpstream(0)
+        ) as get:
+            assert service.get_latest_rates() == MOCK_EXCHANGE_RATES
+        assert get.call_count == 1
+
+    def test_refresh_outlasting_the_wait_expect_last_known_rates_without_fetch(
+        self, settings
+    ):
+        settings.RATES_REFRESH_POLL_INTERVAL = 0.01
+        http_client = RatesHttpClient(
+            connect_timeout=0.02, read_timeout=0.03, retries=0
+        )
+        service = self.make_service(http_client)
+        service.cache_service.acquire_refresh_lock(service.todays_key)
+        known_rates = {**MOCK_EXCHANGE_RATES, "timestamp": int(time.time())}
+        last_known_rates.set(known_rates)
+
+        with patch.object(RatesHttpClient, "get_json") as mocked_get:
+            assert service.refresh_rates(service.todays_key) == {
+                **known_rates,
+                "stale": True,
+            }
+        assert mocked_get.call_count == 0
+
+    def test_refresh_outlasting_the_wait_without_known_rates_expect_timeout(
+        self, settings
+    ):
+        settings.RATES_REFRESH_POLL_INTERVAL = 0.01
+        http_client = RatesHttpClient(
+            connect_timeout=0.02, read_timeout=0.03, retries=0
+        )
+        service = self.make_service(http_client)
+        service.cache_service.acquire_refresh_lock(service.todays_key)
+
+        with patch.object(RatesHttpClient, "get_json") as mocked_get:
+            with pytest.raises(ConversionRateServiceTimeoutException):
+                service.get_latest_rates()
+        assert mocked_get.call_count == 0
+
+    def test_refresh_wait_expect_bounded_by_lock_and_client_timeouts(self, settings):
+        settings.RATES_REFRESH_LOCK_TIMEOUT = 30
+        http_client = RatesHttpClient(
+            connect_timeout=1, read_timeout=2, retries=2, backoff_factor=0.5
+        )
+        # 3 attempts of 3 seconds, backing off 0.5 and 1 second between them
+        assert http_client.total_timeout == 10.5
+        assert self.make_service(http_client).refresh_wait == 10.5
+        settings.RATES_REFRESH_LOCK_TIMEOUT = 5
+        assert self.make_service(http_client).refresh_wait == 5
+
+    def test_async_refresh_locked_by_other_process_expect_previous_day_rates(self):
+        service = AsyncExchangeRatesAPI(ConversionRatesCacheService(MidnightCache()))
+        previous_rates = {**MOCK_EXCHANGE_RATES, "date": "2024-05-29"}
+        MidnightCache().set(service.rates_api.previous_key, previous_rates)
+        service.cache_service.acquire_refresh_lock(service.rates_api.todays_key)
+
+        with patch.object(RatesHttpClient, "get_json") as mocked_get:
+            assert async_to_sync(service.get_latest_rates)() == {
+                **previous_rates,
+                "stale": True,
+            }
+        assert mocked_get.call_count == 0
+
+
+class TestIdempotencyStore:
+    def make_store(self, **kwargs):
+        return IdempotencyStore(**{"wait": 2, "poll_interval": 0.01, **kwargs})
+
+    def test_repeat_expect_stored_response(self):
+        store = self.make_store()
+        assert store.run("user", "key", "a", lambda: {"id": 1}) == ({"id": 1}, False)
+        assert store.run("user", "key", "a", lambda: {"id": 2}) == ({"id": 1}, True)
+        assert store.run("other", "key", "a", lambda: {"id": 3}) == ({"id": 3}, False)
+
+    def test_other_fingerprint_expect_exception(self):
+        store = self.make_store()
+        store.run("user", "key", "a", lambda: {"id": 1})
+        with pytest.raises(IdempotencyKeyReusedException):
+            store.run("user", "key", "b", lambda: {"id": 2})
+
+    def test_concurrent_duplicates_expect_single_run(self):
+        num_of_requests = 10
+        store = self.make_store()
+        barrier = threading.Barrier(num_of_requests)
+        calls = []
+        results = []
+
+        def create():
+            calls.append(1)
+            time.sleep(0.1)
+            return {"id": len(calls)}
+
+        def request():
+            barrier.wait()
+            results.append(store.run("user", "key", "a", create))
+
+        threads = [threading.Thread(target=request) for _ in range(num_of_requests)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(calls) == 1
+        assert sorted(replayed for _, replayed in results) == [False] + [True] * 9
+        assert all(response == {"id": 1} for response, _ in results)
+
+    def test_failed_run_expect_not_stored_and_lock_released(self):
+        store = self.make_store()
+
+        def fail():
+            raise ConversionRateServiceException("down")
+
+        with pytest.raises(ConversionRateServiceException):
+            store.run("user", "key", "a", fail)
+        assert cache.get(store.lock_key("user", "key")) is None
+        assert store.run("user", "key", "a", lambda: {"id": 1}) == ({"id": 1}, False)
+
+    def test_lock_held_past_wait_expect_exception(self):
+        store = self.make_store(wait=0.05)
+        cache.set(store.lock_key("user", "key"), "a")
+        with pytest.raises(IdempotencyKeyInProgressException):
+            store.run("user", "key", "a", lambda: {"id": 1})
+
+    def test_async_repeat_expect_stored_response(self):
+        store = self.make_store()
+
+        async def create():
+            return {"id": 1}
+
+        async def run_twice():
+            first = await store.arun("user", "key", "a", create)
+            second = await store.arun("user", "key", "a", create)
+            return first, second
+
+        assert async_to_sync(run_twice)() == (({"id": 1}, False), ({"id": 1}, True))
+
+
+class TestRatesHttpClient:
+    def make_client(self, **kwargs):
+        options = {"connect_timeout": 1, "read_timeout": 1, "backoff_factor": 0}
+        options.update(kwargs)
+        return RatesHttpClient(**options)
+
+    def test_success_expect_rates_and_connection_reused(self, rates_stub):
+        client = self.make_client()
+        for _ in range(3):
+            data = client.get_json(rates_stub.url)
+        assert data["success"]
+        assert data["rates"] == DEFAULT_RATES
+        assert rates_stub.requests_count == 3
+        assert rates_stub.connections_count == 1
+
+    def test_gzip_enabled_expect_compressed_response(self, rates_stub):
+        data = self.make_client(gzip=True).get_json(rates_stub.url)
+        assert "gzip" in rates_stub.last_headers["Accept-Encoding"]
+        assert data["rates"] == DEFAULT_RATES
+
+    def test_gzip_disabled_expect_identity_encoding(self, rates_stub):
+        data = self.make_client(gzip=False).get_json(rates_stub.url)
+        assert rates_stub.last_headers["Accept-Encoding"] == "identity"
+        assert data["rates"] == DEFAULT_RATES
+
+    def test_error_rate_expect_unsuccessful_responses(self, rates_stub):
+        rates_stub.error_rate = 1
+        data = self.make_client().get_json(rates_stub.url)
+        assert data == {"success": False, "error": DEFAULT_ERROR}
+
+    def test_slow_upstream_expect_timeout_exception_without_retry(self, rates_stub):
+        rates_stub.latency = 0.5
+        client = self.make_client(read_timeout=0.1)
+        start = time.monotonic()
+        with pytest.raises(ConversionRateServiceTimeoutException):
+            client.get_json(rates_stub.url)
+        assert time.monotonic() - start < 0.5
+        assert rates_stub.requests_count == 1
+
+    def test_transient_server_errors_expect_retried(self, rates_stub):
+        rates_stub.fail_next = 2
+        data = self.make_client(retries=2).get_json(rates_stub.url)
+        assert data["success"]
+        assert rates_stub.requests_count == 3
+
+    def test_persistent_server_errors_expect_unavailable_exception(self, rates_stub):
+        rates_stub.failure_rate = 1
+        with pytest.raises(ConversionRateServiceUnavailableException):
+            self.make_client(retries=2).get_json(rates_stub.url)
+        assert rates_stub.requests_count == 3
+
+    def test_connection_refused_expect_unavailable_exception(self, rates_stub):
+        url = rates_stub.url
+        rates_stub.stop()
+        with pytest.raises(ConversionRateServiceUnavailableException):
+            self.make_client(retries=1).get_json(url)
+
+    def test_upstream_error_payload_expect_returned_as_is(self, rates_stub):
+        rates_stub.error = MOCK_ERROR_EXCHANGE_RATES["error"]
+        assert self.make_client().get_json(rates_stub.url) == MOCK_ERROR_EXCHANGE_RATES
+
+
+class TestRatesMatrix:
+    @pytest.mark.parametrize(
+        "from_currency, to_currency, expected_rate",
+        [
+            ("EUR", "USD", Decimal(MOCK_EXCHANGE_RATES["rates"]["USD"])),
+            ("USD", "EUR", Decimal(1) / Decimal(MOCK_EXCHANGE_RATES["rates"]["USD"])),
+            (
+                "USD",
+                "BRL",
+                Decimal(MOCK_EXCHANGE_RATES["rates"]["BRL"])
+                / Decimal(MOCK_EXCHANGE_RATES["rates"]["USD"]),
+            ),
+            ("EUR", "EUR", Decimal(1)),
+            ("BRL", "BRL", Decimal(1)),
+        ],
+    )
+    def test_rate_expect_same_as_direct_computation(
+        self, from_currency, to_currency, expected_rate
+    ):
+        matrix = RatesMatrix(MOCK_EXCHANGE_RATES)
+        assert matrix.rate(from_currency, to_currency) == expected_rate
+
+    def test_same_snapshot_expect_matrix_built_once(self):
+        first = RatesMatrix.for_rates(MOCK_EXCHANGE_RATES)
+        second = RatesMatrix.for_rates(dict(MOCK_EXCHANGE_RATES))
+        assert first is second
+
+    def test_new_snapshot_expect_new_matrix(self):
+        new_rates = {
+            **MOCK_EXCHANGE_RATES,
+            "timestamp": MOCK_EXCHANGE_RATES["timestamp"] + 3600,
+            "rates": {**MOCK_EXCHANGE_RATES["rates"], "USD": 1.1},
+        }
+        assert RatesMatrix.for_rates(new_rates) is not RatesMatrix.for_rates(
+            MOCK_EXCHANGE_RATES
+        )
+        assert RatesMatrix.for_rates(new_rates).rate("EUR", "USD") == Decimal(1.1)
+
+
+class TestAsyncExchangeRatesAPI:
+    def make_service(self):
+        return AsyncExchangeRatesAPI(ConversionRatesCacheService(MidnightCache()))
+
+    def test_concurrent_misses_expect_single_upstream_call(self):
+        upstream = TestRatesRefreshSingleFlight.SlowUpstream(0.1)
+
+        async def request_rates():
+            return await asyncio.gather(
+                *(self.make_service().get_latest_rates() for _ in range(20))
+            )
+
+        with patch.object(RatesHttpClient, "get_json", side_effect=upstream):
+            results = async_to_sync(request_rates)()
+
+        assert upstream.calls == 1
+        assert all(result == MOCK_EXCHANGE_RATES for result in results)
+
+    def test_cached_rates_expect_no_upstream_call(self):
+        service = self.make_service()
+        MidnightCache().set(service.rates_api.todays_key, MOCK_EXCHANGE_RATES)
+        with patch.object(RatesHttpClient, "get_json") as mocked_get:
+            conversion = async_to_sync(service.get_conversion_from)(
+                ConversionRequest("EUR", "USD", Decimal(10))
+            )
+        assert mocked_get.call_count == 0
+        assert conversion.rate == MOCK_EXCHANGE_RATES["rates"]["USD"]
+
+    @patch.object(
+        AsyncExchangeRatesAPI,
+        "get_latest_rates",
+        return_value=MOCK_ERROR_EXCHANGE_RATES,
+    )
+    def test_error_response_expect_exception(self, mocked_get_latest_rates):
+        with pytest.raises(ConversionRateServiceException):
+            async_to_sync(self.make_service().get_conversion_from)(
+                ConversionRequest("EUR", "USD", Decimal(10))
+            )
+
+
+@pytest.mark.django_db()
+class TestRateSnapshots:
+    def make_service(self):
+        return ExchangeRatesAPI(
+            ConversionRatesCacheService(MidnightCache()),
+            snapshot_store=RateSnapshotDbService(),
+        )
+
+    def test_encoding_expect_same_rates_in_less_space_than_json(self):
+        encoded = encode_rates(MOCK_EXCHANGE_RATES["rates"])
+        assert decode_rates(encoded) == MOCK_EXCHANGE_RATES["rates"]
+        assert len(encoded) < len(json.dumps(MOCK_EXCHANGE_RATES["rates"])) * 0.65
+
+    def test_save_same_table_twice_expect_stored_once(self):
+        RateSnapshotDbService().save(MOCK_EXCHANGE_RATES)
+        RateSnapshotDbService().save(MOCK_EXCHANGE_RATES)
+        assert RateSnapshot.objects.count() == 1
+
+    def test_latest_for_expect_latest_table_of_the_day(self):
+        store = RateSnapshotDbService()
+        later = {**MOCK_EXCHANGE_RATES, "timestamp": 1717097344}
+        store.save(later)
+        store.save(MOCK_EXCHANGE_RATES)
+        assert store.latest_for(datetime.date(2024, 5, 30)) == later
+        assert store.latest_for(datetime.date(2024, 5, 31)) is None
+
+    @freeze_time("2024-05-30 12:00:00")
+    def test_cache_miss_expect_fetched_rates_stored(self):
+        with patch.object(
+            RatesHttpClient, "get_json", return_value=MOCK_EXCHANGE_RATES
+        ) as mocked_get:
+            assert self.make_service().get_latest_rates() == MOCK_EXCHANGE_RATES
+        assert mocked_get.call_count == 1
+        assert RateSnapshot.objects.get().to_rates() == MOCK_EXCHANGE_RATES
+
+    @freeze_time("2024-05-30 12:00:00")
+    def test_error_response_expect_not_stored(self):
+        with patch.object(
+            RatesHttpClient, "get_json", return_value=MOCK_ERROR_EXCHANGE_RATES
+        ):
+            self.make_service().get_latest_rates()
+        assert not RateSnapshot.objects.exists()
+
+    @freeze_time("2024-05-30 12:00:00")
+    def test_cache_flushed_expect_rates_from_snapshot_without_upstream_call(self):
+        RateSnapshotDbService().save(MOCK_EXCHANGE_RATES)
+        with patch.object(RatesHttpClient, "get_json") as mocked_get:
+            assert self.make_service().get_latest_rates() == MOCK_EXCHANGE_RATES
+        assert mocked_get.call_count == 0
+        assert MidnightCache().get("2024-05-30") == MOCK_EXCHANGE_RATES
+
+    @freeze_time("2024-05-30 12:00:00")
+    def test_async_cache_flushed_expect_rates_from_snapshot_without_upstream_call(
+        self,
+    ):
+        RateSnapshotDbService().save(MOCK_EXCHANGE_RATES)
+        service = AsyncExchangeRatesAPI(
+            ConversionRatesCacheService(MidnightCache()),
+            snapshot_store=RateSnapshotDbService(),
+        )
+        with patch.object(RatesHttpClient, "get_json") as mocked_get:
+            assert async_to_sync(service.get_latest_rates)() == MOCK_EXCHANGE_RATES
+        assert mocked_get.call_count == 0
+
+
+@freeze_time("2024-05-31 10:00:00")
+class TestStaleWhileRevalidate:
+    def make_service(self):
+        return ExchangeRatesAPI(ConversionRatesCacheService(MidnightCache()))
+
+    def test_fresh_rates_cached_expect_not_stale(self):
+        service = self.make_service()
+        MidnightCache().set(service.todays_key, MOCK_EXCHANGE_RATES)
+        last_known_rates.set({**MOCK_EXCHANGE_RATES, "timestamp": 1717000000})
+        assert service.get_latest_rates() == MOCK_EXCHANGE_RATES
+
+    @patch.object(ExchangeRatesAPI, "revalidate_in_background")
+    def test_cache_miss_expect_fresh_rates_from_upstream(self, mocked_revalidate):
+        last_known_rates.set({**MOCK_EXCHANGE_RATES, "timestamp": 1717000000})
+        with patch.object(
+            RatesHttpClient, "get_json", return_value=MOCK_EXCHANGE_RATES
+        ) as mocked_get:
+            conversion = self.make_service().get_conversion_from(
+                ConversionRequest("EUR", "USD", Decimal(10))
+            )
+        assert mocked_get.call_count == 1
+        assert mocked_revalidate.call_count == 0
+        assert not conversion.stale
+        assert last_known_rates.get() == MOCK_EXCHANGE_RATES
+
+    @pytest.mark.parametrize(
+        "upstream",
+        [
+            {"return_value": MOCK_ERROR_EXCHANGE_RATES},
+            {"side_effect": ConversionRateServiceUnavailableException("down")},
+        ],
+    )
+    @patch.object(ExchangeRatesAPI, "revalidate_in_background")
+    def test_upstream_failure_expect_last_known_rates_marked_stale(
+        self, mocked_revalidate, upstream
+    ):
+        last_known_rates.set(MOCK_EXCHANGE_RATES)
+        with patch.object(RatesHttpClient, "get_json", **upstream) as mocked_get:
+            conversion = self.make_service().get_conversion_from(
+                ConversionRequest("EUR", "USD", Decimal(10))
+            )
+        assert mocked_get.call_count == 1
+        mocked_revalidate.assert_called_once_with("2024-05-31")
+        assert conversion.stale
+        assert conversion.rates_timestamp == datetime.datetime.fromtimestamp(
+            MOCK_EXCHANGE_RATES["timestamp"], pytz.UTC
+        )
+
+    @patch.object(ExchangeRatesAPI, "revalidate_in_background")
+    def test_previous_day_rates_cached_expect_served_stale(self, mocked_revalidate):
+        service = self.make_service()
+        MidnightCache().set(service.previous_key, MOCK_EXCHANGE_RATES)
+        assert service.get_latest_rates() == {**MOCK_EXCHANGE_RATES, "stale": True}
+
+    @patch.object(ExchangeRatesAPI, "revalidate_in_background")
+    def test_error_response_cached_expect_last_known_rates(self, mocked_revalidate):
+        service = self.make_service()
+        MidnightCache().set(service.todays_key, MOCK_ERROR_EXCHANGE_RATES)
+        last_known_rates.set(MOCK_EXCHANGE_RATES)
+        assert service.get_latest_rates() == {**MOCK_EXCHANGE_RATES, "stale": True}
+
+    @pytest.mark.parametrize("window", [0, 3600])
+    @patch.object(RatesHttpClient, "get_json", return_value=MOCK_ERROR_EXCHANGE_RATES)
+    def test_outside_stale_window_expect_upstream_error(
+        self, mocked_get, settings, window
+    ):
+        settings.RATES_STALE_WINDOW = window
+        last_known_rates.set(MOCK_EXCHANGE_RATES)
+        with pytest.raises(ConversionRateServiceException):
+            self.make_service().get_conversion_from(
+                ConversionRequest("EUR", "USD", Decimal(10))
+            )
+        assert mocked_get.call_count == 1
+
+    def test_revalidate_expect_rates_cached_and_lock_released(self):
+        service = self.make_service()
+        service.cache_service.acquire_refresh_lock(service.todays_key)
+        newer_rates = {**MOCK_EXCHANGE_RATES, "timestamp": 1717149600}
+        with patch.object(RatesHttpClient, "get_json", return_value=newer_rates):
+            service.revalidate(service.todays_key)
+        assert MidnightCache().get(service.todays_key) == newer_rates
+        assert last_known_rates.get() == newer_rates
+        assert service.cache_service.acquire_refresh_lock(service.todays_key)
+
+    @pytest.mark.parametrize(
+        "upstream",
+        [
+            {"return_value": MOCK_ERROR_EXCHANGE_RATES},
+            {"side_effect": ConversionRateServiceUnavailableException("down")},
+        ],
+    )
+    def test_revalidate_fails_expect_nothing_cached_and_lock_kept(self, upstream):
+        service = self.make_service()
+        service.cache_service.acquire_refresh_lock(service.todays_key)
+        with patch.object(RatesHttpClient, "get_json", **upstream):
+            service.revalidate(service.todays_key)
+        assert MidnightCache().get(service.todays_key) is None
+        assert not service.cache_service.acquire_refresh_lock(service.todays_key)
+
+    def test_revalidate_in_background_expect_single_revalidation(self):
+        service = self.make_service()
+        MidnightCache().set(service.todays_key, MOCK_ERROR_EXCHANGE_RATES)
+        upstream = TestRatesRefreshSingleFlight.SlowUpstream(0.1)
+        last_known_rates.set(MOCK_EXCHANGE_RATES)
+        with patch.object(RatesHttpClient, "get_json", side_effect=upstream):
+            for _ in range(10):
+                assert service.get_latest_rates()["stale"]
+            for _ in range(500):  # time is frozen, so no deadline
+                if MidnightCache().get(service.todays_key)["success"]:
+                    break
+                time.sleep(0.01)
+        assert upstream.calls == 1
+        assert service.get_latest_rates() == MOCK_EXCHANGE_RATES
+
+    @pytest.mark.parametrize(
+        "upstream",
+        [
+            {"return_value": MOCK_ERROR_EXCHANGE_RATES},
+            {"side_effect": ConversionRateServiceUnavailableException("down")},
+        ],
+    )
+    @patch.object(ExchangeRatesAPI, "revalidate_in_background")
+    def test_async_upstream_failure_expect_last_known_rates_marked_stale(
+        self, mocked_revalidate, upstream
+    ):
+        last_known_rates.set(MOCK_EXCHANGE_RATES)
+        service = AsyncExchangeRatesAPI(ConversionRatesCacheService(MidnightCache()))
+        with patch.object(RatesHttpClient, "get_json", **upstream) as mocked_get:
+            conversion = async_to_sync(service.get_conversion_from)(
+                ConversionRequest("EUR", "USD", Decimal(10))
+            )
+        assert mocked_get.call_count == 1
+        mocked_revalidate.assert_called_once_with("2024-05-31")
+        assert conversion.stale
+
+    def test_async_cache_miss_expect_fresh_rates_from_upstream(self):
+        last_known_rates.set({**MOCK_EXCHANGE_RATES, "timestamp": 1717000000})
+        service = AsyncExchangeRatesAPI(ConversionRatesCacheService(MidnightCache()))
+        with patch.object(
+            RatesHttpClient, "get_json", return_value=MOCK_EXCHANGE_RATES
+        ) as mocked_get:
+            conversion = async_to_sync(service.get_conversion_from)(
+                ConversionRequest("EUR", "USD", Decimal(10))
+            )
+        assert mocked_get.call_count == 1
+        assert not conversion.stale
@@ -0,0 +1,143 @@
+from unittest.mock import patch
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.test import AsyncClient
+from django.urls import reverse
+from freezegun import freeze_time
+from structlog.contextvars import merge_contextvars
+from structlog.testing import capture_logs
+
+from conversion.api import CreateConversionView, GetUserConversionsView
+from conversion.services import RatesHttpClient
+from conversion.test_services import MOCK_EXCHANGE_RATES
+from conversion.timing import SERVER_TIMING_HEADER, _timings, phase
+
+
+def phases(response) -> list[str]:
+    return [entry.split(";")[0] for entry in response[SERVER_TIMING_HEADER].split(", ")]
+
+
+class TestPhase:
+    def test_outside_of_a_timed_request_expect_nothing_recorded(self):
+        with phase("db"):
+            pass
+        assert _timings.get() is None
+
+    def test_repeated_phase_expect_added_up(self):
+        timings: dict[str, float] = {}
+        token = _timings.set(timings)
+        try:
+            with phase("db"):
+                pass
+            first = timings["db"]
+            with phase("db"):
+                pass
+        finally:
+            _timings.reset(token)
+        assert list(timings) == ["db"]
+        assert timings["db"] > first
+
+
+@pytest.mark.django_db()
+@freeze_time("2024-05-31 10:00:00")
+@patch.object(
+    RatesHttpClient,
+    "get_json",
+    return_value={**MOCK_EXCHANGE_RATES, "date": "2024-05-31"},
+)
+class TestServerTimingMiddleware:
+    payload = {"from_currency": "EUR", "to_currency": "USD", "amount": 100}
+
+    @pytest.fixture(autouse=True)
+    def disable_throttling(self):
+        views = (CreateConversionView, GetUserConversionsView)
+        throttle_classes = [view.throttle_classes for view in views]
+        for view in views:
+            view.throttle_classes = ()
+        yield
+        for view, view_throttle_classes in zip(views, throttle_classes):
+            view.throttle_classes = view_throttle_classes
+
+    @pytest.fixture
+    def server_timing(self, settings):
+        settings.SERVER_TIMING = True
+
+    def test_disabled_expect_no_header(self, _, client, user, teardown_conversions):
+        response = client.post(
+            reverse("conversion-create"),
+            {**self.payload, "user_id": user.external_id},
+            content_type="application/json",
+        )
+        assert SERVER_TIMING_HEADER not in response
+
+    @pytest.mark.parametrize("url", ["conversion-create", "async-conversion-create"])
+    def test_conversion_expect_every_phase(
+        self, _, client, user, teardown_conversions, server_timing, url
+    ):
+        response = client.post(
+            reverse(url),
+            {**self.payload, "user_id": user.external_id},
+            content_type="application/json",
+        )
+        assert phases(response) == [
+            "user",
+            "cache",
+            "upstream",
+            "convert",
+            "db",
+            "serialize",
+            "total",
+        ]
+
+    def test_conversion_with_cached_rates_expect_no_upstream_phase(
+        self, _, client, user, teardown_conversions, server_timing
+    ):
+        payload = {**self.payload, "user_id": user.external_id}
+        client.post(
+            reverse("conversion-create"), payload, content_type="application/json"
+        )
+        response = client.post(
+            reverse("conversion-create"), payload, content_type="application/json"
+        )
+        assert "upstream" not in phases(response)
+
+    @pytest.mark.parametrize(
+        "url", ["conversions-user-list", "async-conversions-user-list"]
+    )
+    def test_history_expect_phases(self, _, client, user, server_timing, url):
+        response = client.get(reverse(url, args=[user.external_id]))
+        assert phases(response) == ["user", "cache", "db", "serialize", "total"]
+
+    def test_timings_expect_logged_with_request_finished(
+        self, _, client, user, teardown_conversions, server_timing
+    ):
+        with capture_logs(processors=[merge_contextvars]) as logs:
+            response = client.post(
+                reverse("conversion-create"),
+                {**self.payload, "user_id": user.external_id},
+                content_type="application/json",
+            )
+        (finished,) = [log for log in logs if log["event"] == "request_finished"]
+        bound = finished["server_timing"]
+        assert list(bound) == phases(response)
+        assert bound["total"] >= bound["db"] >= 0
+
+    def test_asgi_request_expect_phases(
+        self, _, user, teardown_conversions, server_timing
+    ):
+        response = async_to_sync(AsyncClient().post)(
+            reverse("async-conversion-create"),
+            {**self.payload, "user_id": user.external_id},
+            content_type="application/json",
+        )
+        # the upstream fetch runs in a worker thread, timed all the same
+        assert phases(response) == [
+            "user",
+            "cache",
+            "upstream",
+            "convert",
+            "db",
+            "serialize",
+            "total",
+        ]
@@ -0,0 +1,121 @@
+"""
+Per-request timings of the phases of the conversion pipeline (user lookup, rates cache,
+upstream fetch, conversion math, database and serialization), sent in a Server-Timing header
+and logged with the request when settings.SERVER_TIMING is on (see ServerTimingMiddleware).
+
+Phases are timed with `with phase("db"): ...`. Outside of a timed request, which is every
+request when the setting is off, phase() returns a shared no-op context manager: the cost is a
+context variable lookup.
+"""
+
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+import structlog
+
+SERVER_TIMING_HEADER = "Server-Timing"
+
+# seconds spent per phase in the current request, None when it isn't timed; the dict is
+# shared with the threads sync_to_async runs code in, which get a copy of the context
+_timings: ContextVar[Optional[dict[str, float]]] = ContextVar(
+    "server_timing", default=None
+)
+
+
+class _Phase:
+    __slots__ = ("timings", "name", "start")
+
+    def __init__(self, timings: dict[str, float], name: str) -> None:
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info) -> None:
+        elapsed = time.perf_counter() - self.start
+        self.timings[self.name] = self.timings.get(self.name, 0.0) + elapsed
+
+
+class _NoPhase:
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        pass
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+
+_no_phase = _NoPhase()
+
+
+def phase(name: str):
+    """Times the block as the phase name of the current request, adding up repeated phases."""
+    timings = _timings.get()
+    if timings is None:
+        return _no_phase
+    return _Phase(timings, name)
+
+
+def server_timing(timings: dict[str, float]) -> str:
+    return ", ".join(
+        f"{name};dur={seconds * 1000:.2f}" for name, seconds in timings.items()
+    )
+
+
+class ServerTimingMiddleware:
+    """
+    Times the phases of every request, adds them and the total to the response as a
+    Server-Timing header and binds them, in milliseconds, to the structlog context, so
+    django_structlog's request_finished event carries them. It has to come after
+    django_structlog.middlewares.RequestMiddleware in MIDDLEWARE for that.
+    Without settings.SERVER_TIMING, Django leaves it out of the middleware chain.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response) -> None:
+        if not settings.SERVER_TIMING:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings: dict[str, float] = {}
+        token = _timings.set(timings)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _timings.reset(token)
+        return self.with_timings(response, timings, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        timings: dict[str, float] = {}
+        token = _timings.set(timings)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _timings.reset(token)
+        return self.with_timings(response, timings, time.perf_counter() - start)
+
+    def with_timings(self, response, timings: dict[str, float], total: float):
+        timings = {**timings, "total": total}
+        response[SERVER_TIMING_HEADER] = server_timing(timings)
+        structlog.contextvars.bind_contextvars(
+            server_timing={
+                name: round(seconds * 1000, 2) for name, seconds in timings.items()
+            }
+        )
+        return response
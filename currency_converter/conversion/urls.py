@@ -1,6 +1,15 @@
 from django.urls import path
 
-from conversion.api import CreateConversionView, GetUserConversionsView
+from conversion.api import (
+    AsyncCreateConversionView,
+    AsyncGetUserConversionsView,
+    CreateConversionBatchView,
+    CreateConversionView,
+    CurrenciesView,
+    GetUserConversionsView,
+    QuoteView,
+    RatesView,
+)
 
 urlpatterns = [
     path(
@@ -9,4 +18,23 @@ urlpatterns = [
         name="conversions-user-list",
     ),
     path("api/conversions/", CreateConversionView.as_view(), name="conversion-create"),
+    path(
+        "api/conversions/batch/",
+        CreateConversionBatchView.as_view(),
+        name="conversion-batch-create",
+    ),
+    path("api/quote/", QuoteView.as_view(), name="quote"),
+    path("api/rates/", RatesView.as_view(), name="rates"),
+    path("api/currencies/", CurrenciesView.as_view(), name="currencies"),
+    # async variants, for ASGI deployments
+    path(
+        "api/async/users/<str:user_id>/conversions/",
+        AsyncGetUserConversionsView.as_view(),
+        name="async-conversions-user-list",
+    ),
+    path(
+        "api/async/conversions/",
+        AsyncCreateConversionView.as_view(),
+        name="async-conversion-create",
+    ),
 ]
@@ -60,6 +60,7 @@ MIDDLEWARE = [
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "django_structlog.middlewares.RequestMiddleware",
+    "conversion.timing.ServerTimingMiddleware",
 ]
 
 ROOT_URLCONF = "currency_converter.urls"
@@ -93,6 +94,44 @@ DATABASES = {
     }
 }
 
+# "production" tunes SQLite for concurrent workers: WAL, so readers don't block the writer,
+# relaxed fsyncs (safe in WAL mode), a bigger page cache, a busy timeout instead of
+# "database is locked" errors, write transactions taking the lock up front, and connections
+# kept across requests
+DATABASE_PROFILE = env.str("DATABASE_PROFILE", default="default")
+if DATABASE_PROFILE == "production":
+    DATABASES["default"].update(
+        {
+            "ENGINE": "currency_converter.sqlite_backend",
+            "CONN_MAX_AGE": env.int("CONN_MAX_AGE", default=600),
+            "CONN_HEALTH_CHECKS": True,
+            "OPTIONS": {
+                "transaction_mode": "IMMEDIATE",
+                "pragmas": {
+                    "journal_mode": "WAL",
+                    "synchronous": "NORMAL",
+                    "busy_timeout": env.int("SQLITE_BUSY_TIMEOUT", default=5000),
+                    "mmap_size": env.int("SQLITE_MMAP_SIZE", default=256 * 2**20),
+                    "cache_size": env.int("SQLITE_CACHE_SIZE", default=-64_000),
+                    "temp_store": "MEMORY",
+                },
+            },
+        }
+    )
+
+# Conversion history reads go to this copy of the default database, when set, kept in sync
+# outside of the app (e.g. by Litestream). After converting, a user reads from the primary
+# for DATABASE_REPLICA_PIN_SECONDS, the replica lag this tolerates.
+DATABASE_REPLICA_NAME = env.str("DATABASE_REPLICA_NAME", default="")
+if DATABASE_REPLICA_NAME:
+    DATABASES["replica"] = {
+        **DATABASES["default"],
+        "NAME": DATABASE_REPLICA_NAME,
+        "TEST": {"MIRROR": "default"},
+    }
+DATABASE_ROUTERS = ["conversion.routers.ReplicaRouter"]
+DATABASE_REPLICA_PIN_SECONDS = env.int("DATABASE_REPLICA_PIN_SECONDS", default=5)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -136,9 +175,28 @@ STATIC_URL = "static/"
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 EXCHANGE_API_KEY = env("EXCHANGE_API_KEY")
+EXCHANGE_API_URL = env(
+    "EXCHANGE_API_URL", default="http://api.exchangeratesapi.io/v1/latest"
+)
+# Connection pool, timeouts (seconds) and retries of the rates provider client
+EXCHANGE_API_CONNECT_TIMEOUT = env.float("EXCHANGE_API_CONNECT_TIMEOUT", default=3.05)
+EXCHANGE_API_READ_TIMEOUT = env.float("EXCHANGE_API_READ_TIMEOUT", default=10)
+EXCHANGE_API_RETRIES = env.int("EXCHANGE_API_RETRIES", default=2)
+EXCHANGE_API_RETRY_BACKOFF = env.float("EXCHANGE_API_RETRY_BACKOFF", default=0.5)
+EXCHANGE_API_POOL_SIZE = env.int("EXCHANGE_API_POOL_SIZE", default=10)
+EXCHANGE_API_GZIP = env.bool("EXCHANGE_API_GZIP", default=True)
 
 AUTH_USER_MODEL = "users.CustomUser"
 
+# Time the phases of each request (user lookup, rates cache, upstream, conversion math,
+# database, serialization) into a Server-Timing response header and the request's logs
+SERVER_TIMING = env.bool("SERVER_TIMING", default=False)
+
+# Requests allowed per client, e.g. "100/day". Load tests (see the load_test command)
+# raise the anonymous rate, e.g. THROTTLE_ANON_RATE=100000/second.
+THROTTLE_ANON_RATE = env.str("THROTTLE_ANON_RATE", default="100/day")
+THROTTLE_USER_RATE = env.str("THROTTLE_USER_RATE", default="1000/day")
+
 REST_FRAMEWORK = {
     # YOUR SETTINGS
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
@@ -147,8 +205,8 @@ REST_FRAMEWORK = {
         "rest_framework.throttling.UserRateThrottle",
     ],
     "DEFAULT_THROTTLE_RATES": {
-        "anon": "100/day",
-        "user": "1000/day",  # it won't work because there's no actual authentication
+        "anon": THROTTLE_ANON_RATE,
+        "user": THROTTLE_USER_RATE,  # it won't work because there's no actual authentication
     },
 }
 
@@ -229,3 +287,91 @@ CACHES = {
         "LOCATION": "redis://redis:6379",
     }
 }
+
+# Conversion rates
+
+# Per-worker, in-memory tier kept in front of the cache above. It holds at most
+# RATES_LOCAL_CACHE_MAX_ENTRIES day keys, each one expiring at midnight or after
+# RATES_WARM_INTERVAL seconds, so the refreshes of warm_rates --loop reach the workers.
+RATES_LOCAL_CACHE_ENABLED = env.bool("RATES_LOCAL_CACHE_ENABLED", default=True)
+RATES_LOCAL_CACHE_MAX_ENTRIES = env.int("RATES_LOCAL_CACHE_MAX_ENTRIES", default=2)
+
+# Expirations are spread over this many seconds after midnight
+RATES_CACHE_TTL_JITTER = env.int("RATES_CACHE_TTL_JITTER", default=300)
+
+# Only one worker refreshes the rates at a time. The others serve the previous
+# day's rates, flagged stale, or wait for the refresh for as long as it can take:
+# RATES_REFRESH_LOCK_TIMEOUT seconds, or the EXCHANGE_API_* timeouts, retries and
+# backoffs, if shorter. Then they serve the last known rates, flagged stale.
+RATES_REFRESH_LOCK_TIMEOUT = env.int("RATES_REFRESH_LOCK_TIMEOUT", default=30)
+RATES_REFRESH_POLL_INTERVAL = env.float("RATES_REFRESH_POLL_INTERVAL", default=0.1)
+
+# When the day's rates can't be fetched, the last known ones are served,
+# with an X-Rates-Stale: true header, for up to RATES_STALE_WINDOW seconds after their
+# timestamp, while they are refreshed in the background. 0 disables it.
+RATES_STALE_WINDOW = env.int("RATES_STALE_WINDOW", default=36 * 3600)
+
+# manage.py warm_rates: refresh interval of its --loop mode and how long before
+# midnight it starts warming tomorrow's rates as well, which are kept until
+# RATES_WARM_INTERVAL seconds past midnight
+RATES_WARM_INTERVAL = env.int("RATES_WARM_INTERVAL", default=3600)
+RATES_WARM_AHEAD = env.int("RATES_WARM_AHEAD", default=600)
+
+# Store every rates table fetched from the provider in the database (RateSnapshot), where
+# the day's rates are read from after a cache flush or restart instead of going upstream
+RATES_SNAPSHOTS_ENABLED = env.bool("RATES_SNAPSHOTS_ENABLED", default=True)
+
+# Maximum number of conversions accepted by POST /api/conversions/batch/
+CONVERSION_BATCH_MAX_ITEMS = env.int("CONVERSION_BATCH_MAX_ITEMS", default=100)
+
+# Page size of GET /api/users/<user_id>/conversions/ when paging with ?cursor= alone,
+# and the largest one accepted in ?limit=
+CONVERSION_LIST_DEFAULT_LIMIT = env.int("CONVERSION_LIST_DEFAULT_LIMIT", default=100)
+CONVERSION_LIST_MAX_LIMIT = env.int("CONVERSION_LIST_MAX_LIMIT", default=500)
+
+# Rows read from the database, and written to the response, at a time by
+# GET /api/users/<user_id>/conversions/?stream=true
+CONVERSION_STREAM_CHUNK_SIZE = env.int("CONVERSION_STREAM_CHUNK_SIZE", default=2000)
+
+# Cache the rendered responses of GET /api/users/<user_id>/conversions/ (not the streamed
+# ones) for CONVERSION_HISTORY_CACHE_TIMEOUT seconds. Writing a user's conversions bumps
+# a version of their history, so the responses cached before are not served anymore.
+CONVERSION_HISTORY_CACHE = env.bool("CONVERSION_HISTORY_CACHE", default=False)
+CONVERSION_HISTORY_CACHE_TIMEOUT = env.int(
+    "CONVERSION_HISTORY_CACHE_TIMEOUT", default=600
+)
+
+# Validate conversion requests and render conversions with conversion.fast_serializers
+# instead of the DRF serializers (same input rules and output bytes, less CPU)
+CONVERSION_FAST_SERIALIZATION = env.bool("CONVERSION_FAST_SERIALIZATION", default=False)
+
+# Write-behind persistence of conversions: they are queued in the worker and inserted
+# together once CONVERSION_WRITE_BEHIND_MAX_ROWS are queued or every
+# CONVERSION_WRITE_BEHIND_INTERVAL seconds, the most a crash can lose. Their ids come from
+# blocks of CONVERSION_ID_BLOCK_SIZE reserved ahead, in SQLite's sequence table: the
+# conversion app refuses to start with it on another database.
+CONVERSION_WRITE_BEHIND = env.bool("CONVERSION_WRITE_BEHIND", default=False)
+CONVERSION_WRITE_BEHIND_MAX_ROWS = env.int(
+    "CONVERSION_WRITE_BEHIND_MAX_ROWS", default=500
+)
+CONVERSION_WRITE_BEHIND_INTERVAL = env.float(
+    "CONVERSION_WRITE_BEHIND_INTERVAL", default=1.0
+)
+CONVERSION_ID_BLOCK_SIZE = env.int("CONVERSION_ID_BLOCK_SIZE", default=1000)
+
+# POST /api/conversions/ with an Idempotency-Key header: the first response for a user and
+# key is kept for IDEMPOTENCY_KEY_TTL seconds and returned to the repeats. A repeat sent while
+# the first request runs waits up to IDEMPOTENCY_WAIT seconds for its response; the first
+# request holds the key for at most IDEMPOTENCY_LOCK_TIMEOUT seconds.
+IDEMPOTENCY_KEY_TTL = env.int("IDEMPOTENCY_KEY_TTL", default=86400)
+IDEMPOTENCY_LOCK_TIMEOUT = env.int("IDEMPOTENCY_LOCK_TIMEOUT", default=60)
+IDEMPOTENCY_WAIT = env.float("IDEMPOTENCY_WAIT", default=10)
+IDEMPOTENCY_POLL_INTERVAL = env.float("IDEMPOTENCY_POLL_INTERVAL", default=0.05)
+
+# external_id -> primary key mappings of users, kept per worker for
+# USER_ID_LOCAL_CACHE_TIMEOUT seconds and in the cache above for USER_ID_CACHE_TIMEOUT
+USER_ID_LOCAL_CACHE_TIMEOUT = env.float("USER_ID_LOCAL_CACHE_TIMEOUT", default=60)
+USER_ID_LOCAL_CACHE_MAX_ENTRIES = env.int(
+    "USER_ID_LOCAL_CACHE_MAX_ENTRIES", default=10_000
+)
+USER_ID_CACHE_TIMEOUT = env.int("USER_ID_CACHE_TIMEOUT", default=3600)
@@ -0,0 +1,32 @@
+"""
+SQLite backend of the "production" database profile (see DATABASE_PROFILE in settings).
+
+On top of Django's SQLite backend it takes two OPTIONS that Django 5.0 doesn't have:
+- pragmas: PRAGMAs run on every new connection, e.g. {"journal_mode": "WAL"}
+- transaction_mode: how transactions start, "IMMEDIATE" takes the write lock up front, so
+  a transaction that reads then writes waits for busy_timeout instead of failing with
+  "database is locked" when another one got to write first.
+"""
+
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        kwargs.pop("pragmas", None)
+        kwargs.pop("transaction_mode", None)
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for pragma, value in self.settings_dict["OPTIONS"].get("pragmas", {}).items():
+            conn.execute(f"PRAGMA {pragma} = {value}")
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        transaction_mode = self.settings_dict["OPTIONS"].get("transaction_mode")
+        if transaction_mode:
+            self.cursor().execute(f"BEGIN {transaction_mode}")
+        else:
+            super()._start_transaction_under_autocommit()
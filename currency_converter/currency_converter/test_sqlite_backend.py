@@ -0,0 +1,58 @@
+import pytest
+from django.db.utils import ConnectionHandler
+from django.test.utils import CaptureQueriesContext
+
+pytestmark = pytest.mark.django_db
+
+PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 1234,
+    "mmap_size": 2**20,
+    "cache_size": -2000,
+    "temp_store": "MEMORY",
+}
+
+
+@pytest.fixture
+def profile_connection(tmp_path):
+    connections = ConnectionHandler(
+        {
+            "default": {},
+            "profile": {
+                "ENGINE": "currency_converter.sqlite_backend",
+                "NAME": str(tmp_path / "profile.sqlite3"),
+                "OPTIONS": {"transaction_mode": "IMMEDIATE", "pragmas": PRAGMAS},
+            },
+        }
+    )
+    connection = connections["profile"]
+    yield connection
+    connections.close_all()
+
+
+def pragma(connection, name):
+    with connection.cursor() as cursor:
+        cursor.execute(f"PRAGMA {name}")
+        return cursor.fetchone()[0]
+
+
+def test_new_connection_expect_pragmas_applied(profile_connection):
+    assert pragma(profile_connection, "journal_mode") == "wal"
+    assert pragma(profile_connection, "synchronous") == 1  # NORMAL
+    assert pragma(profile_connection, "busy_timeout") == 1234
+    assert pragma(profile_connection, "mmap_size") == 2**20
+    assert pragma(profile_connection, "cache_size") == -2000
+    assert pragma(profile_connection, "temp_store") == 2  # MEMORY
+    assert pragma(profile_connection, "foreign_keys") == 1
+
+
+def test_transaction_expect_immediate_begin(profile_connection):
+    with CaptureQueriesContext(profile_connection) as queries:
+        # What transaction.atomic does on SQLite when entering the outermost block
+        profile_connection.set_autocommit(
+            False, force_begin_transaction_with_broken_autocommit=True
+        )
+        profile_connection.rollback()
+        profile_connection.set_autocommit(True)
+    assert queries.captured_queries[0]["sql"] == "BEGIN IMMEDIATE"
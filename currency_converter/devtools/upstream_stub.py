@@ -0,0 +1,148 @@
+import gzip
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+DEFAULT_RATES = {
+    "AUD": 1.632531,
+    "BRL": 5.640447,
+    "CAD": 1.482082,
+    "CHF": 0.979783,
+    "CNY": 7.841296,
+    "EUR": 1,
+    "GBP": 0.851043,
+    "JPY": 169.979316,
+    "USD": 1.083952,
+}
+
+# what the provider answers once the monthly quota is used up
+DEFAULT_ERROR = {
+    "code": 104,
+    "info": "Your monthly API request volume has been reached. Please upgrade your plan.",
+}
+
+
+class _QuietThreadingHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        pass  # clients giving up on a slow response are expected
+
+
+class StubExchangeRatesServer:
+    """
+    StubExchangeRatesServer is a local stand-in for exchangeratesapi.io's /v1/latest endpoint.
+    It answers with the same response shape and can inject latency, HTTP failures
+    (randomly with failure_rate, or for the next fail_next requests) and `success: false` errors
+    (always with error, or randomly with error_rate).
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        rates: Optional[dict] = None,
+        latency: float = 0.0,
+        failure_rate: float = 0.0,
+        failure_status: int = 503,
+        error: Optional[dict] = None,
+        error_rate: float = 0.0,
+    ) -> None:
+        self.host = host
+        self.rates = rates or DEFAULT_RATES
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.error = error
+        self.error_rate = error_rate
+        self.fail_next = 0
+        self.requests_count = 0
+        self.connections_count = 0
+        self.last_headers: dict = {}
+        self._lock = threading.Lock()
+        self._server = _QuietThreadingHTTPServer((host, port), self._handler())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self._server.server_port}/v1/latest"
+
+    def start(self) -> "StubExchangeRatesServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def serve_forever(self) -> None:
+        self._server.serve_forever()
+
+    def __enter__(self) -> "StubExchangeRatesServer":
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+    def payload(self) -> dict:
+        if self.error:
+            return {"success": False, "error": self.error}
+        if self.error_rate and random.random() < self.error_rate:
+            return {"success": False, "error": DEFAULT_ERROR}
+        now = time.time()
+        return {
+            "success": True,
+            "timestamp": int(now),
+            "base": "EUR",
+            "date": time.strftime("%Y-%m-%d", time.gmtime(now)),
+            "rates": self.rates,
+        }
+
+    def _should_fail(self) -> bool:
+        with self._lock:
+            if self.fail_next > 0:
+                self.fail_next -= 1
+                return True
+        return random.random() < self.failure_rate
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                with stub._lock:
+                    stub.connections_count += 1
+
+            def do_GET(self):
+                with stub._lock:
+                    stub.requests_count += 1
+                stub.last_headers = dict(self.headers)
+                if stub.latency:
+                    time.sleep(stub.latency)
+                if stub._should_fail():
+                    self.send_response(stub.failure_status)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                body = json.dumps(stub.payload()).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                if "gzip" in self.headers.get("Accept-Encoding", ""):
+                    body = gzip.compress(body)
+                    self.send_header("Content-Encoding", "gzip")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,108 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+
+
+class UserIdResolver:
+    """
+    UserIdResolver maps a user's external_id to its primary key, so a request looks the user up once.
+    Mappings are kept in a small per-worker cache, for local_timeout seconds, backed by the shared cache.
+    Saving or deleting a user invalidates its mapping (see users.signals); other workers' local copies
+    expire on their own, which is why local_timeout is short.
+    Users that don't exist are not cached.
+    """
+
+    key_prefix = "user-pk"
+
+    def __init__(
+        self,
+        local_timeout: float = 60,
+        shared_timeout: int = 3600,
+        max_entries: int = 10_000,
+    ) -> None:
+        self.local_timeout = local_timeout
+        self.shared_timeout = shared_timeout
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[float, int]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def resolve(self, external_id: str) -> Optional[int]:
+        user_pk = self._get_local(external_id)
+        if user_pk is not None:
+            return user_pk
+
+        user_pk = cache.get(self.cache_key(external_id))
+        if user_pk is None:
+            user_pk = (
+                get_user_model()
+                .objects.filter(external_id=external_id)
+                .values_list("pk", flat=True)
+                .first()
+            )
+            if user_pk is None:
+                return None
+            cache.set(self.cache_key(external_id), user_pk, timeout=self.shared_timeout)
+        self._set_local(external_id, user_pk)
+        return user_pk
+
+    async def aresolve(self, external_id: str) -> Optional[int]:
+        user_pk = self._get_local(external_id)
+        if user_pk is not None:
+            return user_pk
+
+        user_pk = await cache.aget(self.cache_key(external_id))
+        if user_pk is None:
+            user_pk = (
+                await get_user_model()
+                .objects.filter(external_id=external_id)
+                .values_list("pk", flat=True)
+                .afirst()
+            )
+            if user_pk is None:
+                return None
+            await cache.aset(
+                self.cache_key(external_id), user_pk, timeout=self.shared_timeout
+            )
+        self._set_local(external_id, user_pk)
+        return user_pk
+
+    def invalidate(self, external_id: str) -> None:
+        with self._lock:
+            self._entries.pop(external_id, None)
+        cache.delete(self.cache_key(external_id))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def cache_key(self, external_id: str) -> str:
+        return f"{self.key_prefix}:{external_id}"
+
+    def _get_local(self, external_id: str) -> Optional[int]:
+        entry = self._entries.get(external_id)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+        return None
+
+    def _set_local(self, external_id: str, user_pk: int) -> None:
+        with self._lock:
+            self._entries[external_id] = (
+                time.monotonic() + self.local_timeout,
+                user_pk,
+            )
+            self._entries.move_to_end(external_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+# One instance per worker process, so the local cache survives across requests
+user_id_resolver = UserIdResolver(
+    local_timeout=settings.USER_ID_LOCAL_CACHE_TIMEOUT,
+    shared_timeout=settings.USER_ID_CACHE_TIMEOUT,
+    max_entries=settings.USER_ID_LOCAL_CACHE_MAX_ENTRIES,
+)
@@ -0,0 +1,11 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from users.models import CustomUser
+from users.services import user_id_resolver
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def invalidate_user_id(sender, instance, **kwargs):
+    user_id_resolver.invalidate(instance.external_id)
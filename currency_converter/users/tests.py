@@ -1,5 +1,21 @@
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from users.services import user_id_resolver
+
+# the user signals invalidate the user id mappings kept in the cache
+locmem_cache = override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+
+
+def setUpModule():
+    locmem_cache.enable()
+
+
+def tearDownModule():
+    locmem_cache.disable()
 
 
 class UsersManagersTests(TestCase):
@@ -44,3 +60,44 @@ class UsersManagersTests(TestCase):
             User.objects.create_superuser(
                 email="super@user.com", password="foo", is_superuser=False
             )
+
+
+class UserIdResolverTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        user_id_resolver.clear()
+        self.user = get_user_model().objects.create_user(
+            email="normal@user.com", password="foo"
+        )
+
+    def tearDown(self):
+        user_id_resolver.clear()
+
+    def test_resolve_returns_the_user_pk(self):
+        self.assertEqual(user_id_resolver.resolve(self.user.external_id), self.user.pk)
+
+    def test_resolve_queries_the_database_once(self):
+        with self.assertNumQueries(1):
+            user_id_resolver.resolve(self.user.external_id)
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                user_id_resolver.resolve(self.user.external_id), self.user.pk
+            )
+
+    def test_resolve_falls_back_to_the_shared_cache(self):
+        user_id_resolver.resolve(self.user.external_id)
+        user_id_resolver.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                user_id_resolver.resolve(self.user.external_id), self.user.pk
+            )
+
+    def test_resolve_unknown_user(self):
+        self.assertIsNone(user_id_resolver.resolve("unknown"))
+        self.assertIsNone(cache.get(user_id_resolver.cache_key("unknown")))
+
+    def test_deleting_the_user_invalidates_its_mapping(self):
+        external_id = self.user.external_id
+        user_id_resolver.resolve(external_id)
+        self.user.delete()
+        self.assertIsNone(user_id_resolver.resolve(external_id))
@@ -7,6 +7,12 @@ set -e
 echo "Applying database migrations..."
 python currency_converter/manage.py migrate
 
+# Fetch the conversion rates before serving the first request
+if [ "${WARM_RATES_ON_BOOT:-false}" = "true" ]; then
+    echo "Warming conversion rates..."
+    python currency_converter/manage.py warm_rates || echo "Could not warm conversion rates, they will be fetched on demand"
+fi
+
 # Start the server
 echo "Starting server..."
 exec "$@"